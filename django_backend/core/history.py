@@ -0,0 +1,91 @@
+import base64
+import json
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from .models import Prediction
+
+# Fields returned for every history entry; "results" is only added on request
+# because it is by far the largest part of a record
+SUMMARY_PROJECTION = {
+    "user_id": 1,
+    "soil_params": 1,
+    "env_params": 1,
+    "created_at": 1,
+    "results.top_crop": 1,
+}
+
+
+def encode_cursor(document):
+    """Return an opaque cursor that resumes after document"""
+    payload = json.dumps(
+        {"t": document["created_at"].isoformat(), "id": str(document["_id"])}
+    )
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Returns:
+        tuple: (created_at, ObjectId)
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(payload["t"]), ObjectId(payload["id"])
+    except (ValueError, KeyError, TypeError, InvalidId, UnicodeError):
+        raise ValueError("Invalid cursor")
+
+
+def prediction_history(user_id, limit=20, cursor=None, include_results=False):
+    """
+    Return one page of a user's predictions, newest first.
+
+    Pages are selected by keyset rather than by offset: the query resumes
+    strictly after the (created_at, _id) of the previous page's last record,
+    so with the (user_id, -created_at, -_id) index every page is a bounded
+    index range scan, however deep it is and however large the collection.
+
+    Args:
+        user_id (str): Owner of the predictions
+        limit (int): Maximum number of records to return
+        cursor (str): next_cursor of the previous page, or None for the first
+        include_results (bool): Return the full results dict of each record
+            instead of only its top crop
+
+    Returns:
+        dict: {"predictions": [...], "next_cursor": str or None}
+    """
+    query = {"user_id": user_id}
+    if cursor:
+        created_at, last_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": last_id}},
+        ]
+
+    projection = None if include_results else SUMMARY_PROJECTION
+    # One extra record tells us whether there is a next page
+    documents = list(
+        Prediction._get_collection()
+        .find(query, projection)
+        .sort([("created_at", -1), ("_id", -1)])
+        .limit(limit + 1)
+    )
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = encode_cursor(documents[-1])
+
+    predictions = []
+    for document in documents:
+        document["id"] = str(document.pop("_id"))
+        document["created_at"] = document["created_at"].isoformat()
+        predictions.append(document)
+    return {"predictions": predictions, "next_cursor": next_cursor}
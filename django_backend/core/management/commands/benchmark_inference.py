@@ -0,0 +1,109 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from sklearn.model_selection import train_test_split
+
+from ml.features import FEATURES
+from ml.models import CropModel
+
+# Datasets shipped at the repository root
+DEFAULT_DATASETS = [
+    os.path.join("datasets", "Crop_recommendation_dataset_large_3.csv"),
+    os.path.join("datasets-high-accu", "Crop_recommendation_same_1.csv"),
+    os.path.join("datasets-less-accuracy", "crop_data_4.csv"),
+]
+
+
+def time_call(func, repeat):
+    """Return per-call latencies in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.array(timings)
+
+
+class Command(BaseCommand):
+    help = "Checks the compiled tree evaluator against the native backends and times both"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dataset",
+            action="append",
+            help="Dataset CSV to train on (repeatable, defaults to the shipped datasets)",
+        )
+        parser.add_argument(
+            "--algorithm",
+            action="append",
+            choices=["random_forest", "xgboost"],
+            help="Algorithm to benchmark (repeatable, defaults to both)",
+        )
+        parser.add_argument("--repeat", type=int, default=200)
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        repo_root = os.path.dirname(settings.BASE_DIR)
+        datasets = options.get("dataset") or [
+            os.path.join(repo_root, path) for path in DEFAULT_DATASETS
+        ]
+        algorithms = options.get("algorithm") or ["random_forest", "xgboost"]
+
+        for dataset_path in datasets:
+            data = pd.read_csv(dataset_path)
+            X = data[FEATURES]
+            y = data["crop"].str.lower()
+            X_train, X_test, y_train, _ = train_test_split(
+                X, y, test_size=0.2, random_state=42
+            )
+            self.stdout.write(
+                self.style.SUCCESS(f"{os.path.basename(dataset_path)} ({len(data)} rows)")
+            )
+            for algorithm in algorithms:
+                model = CropModel(algorithm=algorithm)
+                if not model.train(X_train, y_train):
+                    self.stdout.write(self.style.ERROR(f"  {algorithm}: training failed"))
+                    continue
+                self.compare(model, X_test.to_numpy(dtype=np.float64), options)
+
+    def compare(self, model, X_test, options):
+        # The native forest sums tree outputs across threads in arbitrary order;
+        # a single job makes its accumulation order match the compiled evaluator
+        model.model.set_params(n_jobs=1)
+        compiled = model.get_compiled()
+
+        model.set_inference_backend("native")
+        native_proba = model.predict_proba(X_test)
+        model.set_inference_backend("compiled")
+        compiled_proba = model.predict_proba(X_test)
+
+        identical = np.mean(np.all(native_proba == compiled_proba, axis=1)) * 100
+        max_diff = float(np.max(np.abs(native_proba - compiled_proba)))
+        argmax_agreement = (
+            np.mean(native_proba.argmax(axis=1) == compiled_proba.argmax(axis=1)) * 100
+        )
+        self.stdout.write(
+            f"  {model.algorithm}: {compiled.n_trees} trees, {compiled.n_nodes} nodes, "
+            f"depth {compiled.max_depth}"
+        )
+        self.stdout.write(
+            f"    bit-identical rows: {identical:.2f}%, max |diff|: {max_diff:.3g}, "
+            f"top-1 agreement: {argmax_agreement:.2f}%"
+        )
+
+        repeat = options["repeat"]
+        row = X_test[:1]
+        batch = X_test[: options["batch_size"]]
+        for backend in ("native", "compiled"):
+            model.set_inference_backend(backend)
+            single = time_call(lambda: model.predict_proba(row), repeat)
+            bulk = time_call(lambda: model.predict_proba(batch), max(1, repeat // 20))
+            self.stdout.write(
+                f"    {backend:>8}: single p50 {np.percentile(single, 50):.3f} ms, "
+                f"p99 {np.percentile(single, 99):.3f} ms; "
+                f"batch of {len(batch)} p50 {np.percentile(bulk, 50):.2f} ms"
+            )
@@ -0,0 +1,49 @@
+import glob
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ml.rules import CROP_REQUIREMENTS_PATH, RuleEngine
+
+# Training datasets shipped at the repository root
+DEFAULT_DATASET_GLOBS = [
+    os.path.join("datasets", "*.csv"),
+    os.path.join("datasets-high-accu", "Crop_recommendation_same_1.csv"),
+    os.path.join("datasets-less-accuracy", "*.csv"),
+]
+
+
+class Command(BaseCommand):
+    help = "Learns the rule engine's per-crop requirement ranges from training datasets"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dataset",
+            action="append",
+            help="Dataset CSV to learn from (repeatable, defaults to the shipped datasets)",
+        )
+        parser.add_argument("--lower-quantile", type=float, default=0.1)
+        parser.add_argument("--upper-quantile", type=float, default=0.9)
+        parser.add_argument("--output", type=str, default=CROP_REQUIREMENTS_PATH)
+
+    def handle(self, *args, **options):
+        datasets = options.get("dataset")
+        if not datasets:
+            repo_root = os.path.dirname(settings.BASE_DIR)
+            datasets = sorted(
+                path
+                for pattern in DEFAULT_DATASET_GLOBS
+                for path in glob.glob(os.path.join(repo_root, pattern))
+            )
+
+        engine = RuleEngine.from_datasets(
+            datasets,
+            quantiles=(options["lower_quantile"], options["upper_quantile"]),
+        )
+        engine.save(options["output"])
+
+        self.stdout.write(f"Learned ranges from {len(datasets)} dataset(s)")
+        self.stdout.write(
+            self.style.SUCCESS(f"Wrote {len(engine.crops)} crops to {options['output']}")
+        )
@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ml.catalog import model_catalog
+from ml.lookup import build_lookup_grid, lookup_grid_settings, save_lookup_grid
+from ml.prediction import get_default_model_path
+from ml.registry import load_crop_model
+
+
+class Command(BaseCommand):
+    help = "Builds the prediction lookup grid of each model and measures its error"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            action="append",
+            help="Model to tabulate (repeatable, defaults to the default model "
+            "and every catalog model)",
+        )
+        parser.add_argument("--coarse-bins", type=int, help="Cells per feature")
+        parser.add_argument(
+            "--max-depth", type=int, help="Most halvings of a coarse cell"
+        )
+
+    def handle(self, *args, **options):
+        paths = options.get("path")
+        if not paths:
+            paths = [get_default_model_path()]
+            paths += [entry["path"] for entry in model_catalog.entries()]
+
+        config = lookup_grid_settings()
+        if options.get("coarse_bins"):
+            config["coarse_bins"] = options["coarse_bins"]
+        if options.get("max_depth"):
+            config["max_depth"] = options["max_depth"]
+
+        built = 0
+        for path in paths:
+            try:
+                model = load_crop_model(path)
+                if model is None:
+                    raise CommandError("not a CropModel")
+                start = time.perf_counter()
+                grid = build_lookup_grid(model, **config)
+                seconds = time.perf_counter() - start
+                lookup_path = save_lookup_grid(grid, path)
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"{path}: {str(e)}"))
+                continue
+            built += 1
+
+            uniform = grid.error["uniform"]
+            status = "served" if grid.accepted else "NOT served (error bound)"
+            self.stdout.write(
+                f"{path} -> {lookup_path} in {seconds:.1f}s: "
+                f"{len(grid.leaf_classes)} leaves, "
+                f"coverage {uniform['coverage']:.1%}, "
+                f"top-crop error {uniform['top1_error']:.3%} "
+                f"(99% bound {uniform['top1_error_bound']:.3%}), {status}"
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Built {built} lookup grid(s)"))
@@ -0,0 +1,161 @@
+import json
+import os
+import pickle
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from ml.artifacts import (
+    artifact_path_for,
+    artifact_size,
+    load_model_artifact,
+    save_model_artifact,
+    verify_artifact,
+)
+from ml.catalog import model_catalog
+from ml.features import FEATURES
+from ml.models import CropModel
+from ml.prediction import get_default_model_path
+from ml.utils import MODELS_PATH
+
+# Plausible input ranges used to compare predictions of both formats
+SAMPLE_RANGES = {
+    "N": (0, 140),
+    "P": (5, 145),
+    "K": (5, 205),
+    "pH": (3.5, 9.9),
+    "temperature": (8, 44),
+    "rainfall": (20, 300),
+    "humidity": (14, 100),
+}
+
+
+def load_pickle(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def best_time(func, repeat):
+    """Return the fastest of repeat calls in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+class Command(BaseCommand):
+    help = "Converts pickled models to versioned artifact directories"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            action="append",
+            help="Pickled model to convert (repeatable, defaults to every .pkl "
+            "in the models directory and the default model)",
+        )
+        parser.add_argument(
+            "--compare",
+            action="store_true",
+            help="Report size, load time and prediction agreement against pickle",
+        )
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        paths = options.get("path")
+        if not paths:
+            paths = sorted(
+                os.path.join(MODELS_PATH, filename)
+                for filename in os.listdir(MODELS_PATH)
+                if filename.endswith(".pkl")
+            )
+            default_path = os.path.splitext(get_default_model_path())[0] + ".pkl"
+            if os.path.exists(default_path):
+                paths.append(default_path)
+
+        converted = 0
+        for path in paths:
+            try:
+                artifact_path = self.convert(path)
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"{path}: {str(e)}"))
+                continue
+            converted += 1
+            self.stdout.write(f"{path} -> {artifact_path}")
+            if options["compare"]:
+                self.compare(path, artifact_path, options["repeat"])
+
+        self.stdout.write(self.style.SUCCESS(f"Converted {converted} model(s)"))
+
+    def convert(self, path):
+        model = load_pickle(path)
+        if not isinstance(model, CropModel):
+            raise ValueError("not a CropModel")
+
+        model_id = os.path.splitext(os.path.basename(path))[0]
+        metrics = {}
+        metrics_file = os.path.join(MODELS_PATH, f"{model_id}_metrics.json")
+        if os.path.exists(metrics_file):
+            with open(metrics_file, "r") as f:
+                metrics = json.load(f)
+
+        artifact_path = artifact_path_for(path)
+        save_model_artifact(model, artifact_path, metrics=metrics)
+        verify_artifact(artifact_path)
+
+        # Point the catalog at the artifact instead of the pickle
+        entry = next(
+            (
+                entry
+                for entry in model_catalog.entries()
+                if entry["path"] == os.path.abspath(path)
+            ),
+            None,
+        )
+        if entry is not None:
+            model_catalog.register(
+                entry["id"],
+                artifact_path,
+                entry["algorithm"],
+                created_at=entry["created_at"],
+                document_id=entry.get("document_id"),
+                activate=model_catalog.active_id == entry["id"],
+            )
+        return artifact_path
+
+    def compare(self, path, artifact_path, repeat):
+        rng = np.random.default_rng(0)
+        X = np.column_stack(
+            [rng.uniform(*SAMPLE_RANGES[feature], size=1000) for feature in FEATURES]
+        )
+
+        pickled = load_pickle(path)
+        artifact = load_model_artifact(artifact_path)
+        pickled_proba = pickled.predict_proba(X)
+        artifact_proba = artifact.predict_proba(X)
+        agreement = np.mean(
+            pickled_proba.argmax(axis=1) == artifact_proba.argmax(axis=1)
+        )
+        max_diff = float(np.max(np.abs(pickled_proba - artifact_proba)))
+
+        pickle_load = best_time(lambda: load_pickle(path), repeat)
+        artifact_open = best_time(lambda: load_model_artifact(artifact_path), repeat)
+        artifact_first = best_time(
+            lambda: load_model_artifact(artifact_path).predict_proba(X[:1]), repeat
+        )
+
+        self.stdout.write(
+            f"  size: pickle {os.path.getsize(path) / 1024:.0f} KiB, "
+            f"artifact {artifact_size(artifact_path) / 1024:.0f} KiB"
+        )
+        self.stdout.write(
+            f"  load: pickle {pickle_load:.2f} ms, "
+            f"artifact open {artifact_open:.2f} ms, "
+            f"open + first prediction {artifact_first:.2f} ms"
+        )
+        self.stdout.write(
+            f"  predictions: top-1 agreement {agreement * 100:.2f}%, "
+            f"max |diff| {max_diff:.3g}"
+        )
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ml.bundle import bundle_path_for, export_model_bundle
+from ml.catalog import model_catalog
+from ml.prediction import get_default_model_path
+from ml.registry import load_crop_model
+
+
+class Command(BaseCommand):
+    help = "Writes a memory-mappable .bundle next to each pickled model"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            action="append",
+            help="Pickled model to export (repeatable, defaults to the default "
+            "model and every catalog model)",
+        )
+
+    def handle(self, *args, **options):
+        paths = options.get("path")
+        if not paths:
+            default_path = get_default_model_path()
+            paths = [] if default_path.endswith(".bundle") else [default_path]
+            paths += [entry["path"] for entry in model_catalog.entries()]
+
+        exported = 0
+        for path in paths:
+            try:
+                model = load_crop_model(path)
+                if model is None:
+                    raise CommandError("not a CropModel")
+                bundle_path = bundle_path_for(path)
+                export_model_bundle(model, bundle_path)
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"{path}: {str(e)}"))
+                continue
+            exported += 1
+            self.stdout.write(f"{path} -> {bundle_path}")
+
+        self.stdout.write(self.style.SUCCESS(f"Exported {exported} model bundle(s)"))
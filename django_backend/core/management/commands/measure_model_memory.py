@@ -0,0 +1,108 @@
+import multiprocessing
+import os
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from ml.bundle import bundle_path_for, export_model_bundle, load_model_bundle
+from ml.features import FEATURES
+from ml.memory import process_memory
+from ml.prediction import get_default_model_path
+from ml.registry import load_crop_model
+
+# A handful of rows so every worker touches the whole model once
+SAMPLE = np.array(
+    [
+        [90, 42, 43, 6.5, 21, 203, 82],
+        [100, 50, 80, 6.8, 19, 55, 60],
+        [120, 40, 75, 6.2, 25, 65, 65],
+    ],
+    dtype=np.float64,
+)
+
+
+def run_worker(loader, path, preloaded, ready, done, results):
+    before = process_memory()
+    model = preloaded if preloaded is not None else loader(path)
+    model.predict_batch(SAMPLE)
+    # Measure only once every worker has the model, so shared pages are
+    # split between all of them in PSS
+    ready.wait()
+    results.put({"before": before, "after": process_memory()})
+    done.wait()
+
+
+class Command(BaseCommand):
+    help = (
+        "Reports per-worker RSS and PSS with pickled and memory-mapped model "
+        "bundles, with and without loading the model before forking"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument(
+            "--path", type=str, help="Pickled model (defaults to the default model)"
+        )
+
+    def handle(self, *args, **options):
+        if not hasattr(os, "fork"):
+            raise CommandError("Measuring forked workers requires a fork-capable OS")
+
+        path = options.get("path") or get_default_model_path()
+        if path.endswith(".bundle"):
+            path = os.path.splitext(path)[0] + ".pkl"
+        if not os.path.exists(path):
+            raise CommandError(f"Model not found: {path}")
+
+        bundle_path = bundle_path_for(path)
+        if not os.path.exists(bundle_path):
+            export_model_bundle(load_crop_model(path), bundle_path)
+
+        self.stdout.write(
+            f"pickle {os.path.getsize(path) / 1024:.0f} KiB, "
+            f"bundle {os.path.getsize(bundle_path) / 1024:.0f} KiB, "
+            f"{options['workers']} workers, {len(FEATURES)} features"
+        )
+        for label, loader, model_path in (
+            ("pickle", load_crop_model, path),
+            ("bundle", load_model_bundle, bundle_path),
+        ):
+            for preload in (False, True):
+                self.measure(label, loader, model_path, preload, options["workers"])
+
+    def measure(self, label, loader, path, preload, workers):
+        context = multiprocessing.get_context("fork")
+        ready = context.Barrier(workers + 1)
+        done = context.Barrier(workers + 1)
+        results = context.Queue()
+        # With preload the master loads once and workers inherit it copy-on-write
+        preloaded = loader(path) if preload else None
+
+        processes = [
+            context.Process(
+                target=run_worker,
+                args=(loader, path, preloaded, ready, done, results),
+            )
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        ready.wait()
+        measurements = [results.get() for _ in processes]
+        done.wait()
+        for process in processes:
+            process.join()
+
+        mode = "preload" if preload else "per-worker load"
+        self.stdout.write(self.style.SUCCESS(f"{label}, {mode}"))
+        for i, measurement in enumerate(measurements):
+            before, after = measurement["before"], measurement["after"]
+            self.stdout.write(
+                f"  worker {i}: RSS {before.get('vmrss_kib', 0)} -> "
+                f"{after.get('vmrss_kib', 0)} KiB "
+                f"(anon {after.get('rssanon_kib', 0)}, "
+                f"file {after.get('rssfile_kib', 0)}), "
+                f"PSS {before.get('pss_kib', 0)} -> {after.get('pss_kib', 0)} KiB"
+            )
+        total_pss = sum(m["after"].get("pss_kib", 0) for m in measurements)
+        self.stdout.write(f"  total worker PSS: {total_pss} KiB")
@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from ml.prediction import (
+    SLIM_RESPONSE_FIELDS,
+    generate_prediction,
+    shape_prediction_response,
+)
+
+SAMPLE_SOIL_PARAMS = {"nitrogen": 90, "phosphorus": 42, "potassium": 43, "ph": 6.5}
+SAMPLE_ENV_PARAMS = {"temperature": 20.8, "rainfall": 200, "humidity": 82}
+
+# Response modes of PredictionView: (label, fields, inline_icons)
+RESPONSE_MODES = [
+    ("full", None, True),
+    ("icons=ref", None, False),
+    ("slim", SLIM_RESPONSE_FIELDS, False),
+]
+
+
+class Command(BaseCommand):
+    help = "Measures prediction response size and JSON encode time per response mode"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        result = generate_prediction(SAMPLE_SOIL_PARAMS, SAMPLE_ENV_PARAMS)
+        renderer = JSONRenderer()
+        repeat = options["repeat"]
+
+        baseline = None
+        for label, fields, inline_icons in RESPONSE_MODES:
+            body = shape_prediction_response(
+                result, fields=fields, inline_icons=inline_icons
+            )
+            size = len(renderer.render(body))
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                renderer.render(
+                    shape_prediction_response(
+                        result, fields=fields, inline_icons=inline_icons
+                    )
+                )
+            encode_us = (time.perf_counter() - start) / repeat * 1e6
+
+            if baseline is None:
+                baseline = size
+            self.stdout.write(
+                f"{label:>10}: {size:>6} bytes ({size / baseline * 100:5.1f}%), "
+                f"shape + encode {encode_us:.1f} µs"
+            )
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from core.training_jobs import TrainingWorkerPool
+
+
+class Command(BaseCommand):
+    help = "Runs queued model training jobs in a pool of worker processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes",
+            type=int,
+            help="Jobs to run in parallel (defaults to TRAINING_JOBS['processes'])",
+        )
+
+    def handle(self, *args, **options):
+        overrides = {}
+        if options.get("processes"):
+            overrides["processes"] = options["processes"]
+        TrainingWorkerPool.from_settings(**overrides).run()
+        self.stdout.write(self.style.SUCCESS("Training worker pool stopped"))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from ml.catalog import model_catalog
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the model catalog manifest from the TrainedModel documents"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--activate", type=str, help="Model id to mark as active after syncing"
+        )
+
+    def handle(self, *args, **options):
+        model_catalog.sync_from_documents()
+        if options.get("activate"):
+            model_catalog.activate(options["activate"])
+
+        entries = model_catalog.entries()
+        self.stdout.write(f"Catalog contains {len(entries)} model(s)")
+        for entry in entries:
+            marker = "*" if entry["id"] == model_catalog.active_id else " "
+            self.stdout.write(
+                f" {marker} {entry['id']} ({entry['algorithm']}, {entry['created_at']})"
+            )
+        self.stdout.write(self.style.SUCCESS("Model catalog synced"))
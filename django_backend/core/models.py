@@ -7,6 +7,7 @@ from mongoengine import (
     ListField,
     DictField,
     IntField,
+    BooleanField,
 )
 
 from datetime import datetime
@@ -21,6 +22,13 @@ class Prediction(Document):
     results = DictField(required=True)
     created_at = DateTimeField(default=datetime.now)
 
+    meta = {
+        "indexes": [
+            # Serves the per-user history query and its keyset pagination
+            {"fields": ["user_id", "-created_at", "-id"]},
+        ]
+    }
+
 
 class TrainedModel(Document):
     name = StringField(required=True)
@@ -36,3 +44,33 @@ class Dataset(Document):
     columns = ListField(StringField())
     row_count = IntField()
     created_at = DateTimeField(default=datetime.now)
+
+
+class TrainingJob(Document):
+    dataset_id = StringField(required=True)
+    algorithm = StringField(required=True)
+    status = StringField(
+        required=True,
+        default="queued",
+        choices=("queued", "running", "succeeded", "failed", "cancelled"),
+    )
+    cancel_requested = BooleanField(default=False)
+    # Set once the training process starts writing the model; it is then no
+    # longer cancelled or requeued
+    saving = BooleanField(default=False)
+    worker = StringField()
+    attempts = IntField(default=0)
+    error = StringField()
+    result = DictField()
+    trained_model_id = StringField()
+    created_at = DateTimeField(default=datetime.now)
+    started_at = DateTimeField()
+    heartbeat_at = DateTimeField()
+    finished_at = DateTimeField()
+
+    meta = {
+        "indexes": [
+            # Workers claim the oldest queued (or abandoned running) job
+            {"fields": ["status", "created_at"]},
+        ]
+    }
@@ -0,0 +1,231 @@
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from django.conf import settings
+
+from .models import Prediction
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "block")
+
+
+class PredictionLog:
+    """
+    Write-behind buffer for Prediction records.
+
+    Requests append a record to an in-memory buffer and return; a background
+    thread writes the buffer to MongoDB with one insert_many per batch_size
+    records, or every flush_interval seconds when traffic is light. The buffer
+    holds at most max_buffer records. When it is full, the overflow policy
+    decides what gives: "drop_oldest" evicts the oldest record, "drop_newest"
+    discards the new one and "block" makes the request wait up to
+    block_timeout seconds for room before discarding it. Dropped records are
+    counted, never silently lost. Whatever is buffered at shutdown is flushed
+    before the process exits.
+    """
+
+    def __init__(
+        self,
+        max_buffer=10000,
+        batch_size=500,
+        flush_interval=1.0,
+        overflow_policy="drop_oldest",
+        block_timeout=0.05,
+        enabled=True,
+    ):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unsupported overflow policy: {overflow_policy}")
+        self.enabled = enabled
+        self.max_buffer = max_buffer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        self._reset_state()
+        self._enqueued = 0
+        self._dropped = 0
+        self._written = 0
+        self._flushes = 0
+        self._failed_batches = 0
+        self._last_flush_at = None
+        self._last_error = None
+
+    @classmethod
+    def from_settings(cls):
+        config = getattr(settings, "PREDICTION_LOG", {})
+        return cls(
+            max_buffer=config.get("max_buffer", 10000),
+            batch_size=config.get("batch_size", 500),
+            flush_interval=config.get("flush_interval", 1.0),
+            overflow_policy=config.get("overflow_policy", "drop_oldest"),
+            block_timeout=config.get("block_timeout", 0.05),
+            enabled=config.get("enabled", True),
+        )
+
+    def _reset_state(self):
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        # Signalled when records arrive (wakes the flusher) or leave (wakes
+        # requests blocked on a full buffer)
+        self._changed = threading.Condition(self._lock)
+        self._thread = None
+        self._closed = False
+
+    def record(self, soil_params, env_params, results, user_id=None, block=True):
+        """
+        Queue a prediction for storage without waiting for the database.
+
+        Args:
+            block (bool): Whether the "block" overflow policy may wait for room;
+                pass False on an event loop, where a full buffer then discards
+                the new record as "drop_newest" does
+
+        Returns:
+            bool: True if the record was buffered, False if it was dropped
+        """
+        if not self.enabled:
+            return False
+
+        document = {
+            "user_id": user_id or "anonymous",
+            "soil_params": soil_params,
+            "env_params": env_params,
+            "results": results,
+            "created_at": datetime.now(),
+        }
+        self._ensure_flusher()
+        with self._changed:
+            if len(self._buffer) >= self.max_buffer:
+                if self.overflow_policy == "drop_oldest":
+                    self._buffer.popleft()
+                    self._dropped += 1
+                elif self.overflow_policy == "block" and block:
+                    self._changed.wait_for(
+                        lambda: len(self._buffer) < self.max_buffer,
+                        timeout=self.block_timeout,
+                    )
+                if len(self._buffer) >= self.max_buffer:
+                    self._dropped += 1
+                    return False
+            self._buffer.append(document)
+            self._enqueued += 1
+            if len(self._buffer) >= self.batch_size:
+                self._changed.notify_all()
+        return True
+
+    def flush(self):
+        """Write everything buffered so far; returns the number of records written"""
+        written = 0
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return written
+            if not self._write(batch):
+                return written
+            written += len(batch)
+
+    def close(self, timeout=5.0):
+        """Stop the flusher thread and write out the remaining records"""
+        with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "overflow_policy": self.overflow_policy,
+                "max_buffer": self.max_buffer,
+                "batch_size": self.batch_size,
+                "buffered": len(self._buffer),
+                "enqueued": self._enqueued,
+                "written": self._written,
+                "dropped": self._dropped,
+                "flushes": self._flushes,
+                "failed_batches": self._failed_batches,
+                "last_flush_at": self._last_flush_at,
+                "last_error": self._last_error,
+            }
+
+    def reset_after_fork(self):
+        """
+        The flusher thread does not survive a fork, and records buffered in the
+        parent are the parent's to write; the child starts with an empty buffer.
+        """
+        self._reset_state()
+
+    def _ensure_flusher(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="prediction-log", daemon=True
+                )
+                self._thread.start()
+
+    def _take_batch(self):
+        with self._changed:
+            count = min(len(self._buffer), self.batch_size)
+            batch = [self._buffer.popleft() for _ in range(count)]
+            if batch:
+                self._changed.notify_all()
+        return batch
+
+    def _requeue(self, batch):
+        """Put a failed batch back at the front, as far as the bound allows"""
+        with self._changed:
+            room = max(self.max_buffer - len(self._buffer), 0)
+            self._dropped += len(batch) - min(room, len(batch))
+            self._buffer.extendleft(reversed(batch[:room]))
+
+    def _write(self, batch):
+        try:
+            Prediction._get_collection().insert_many(batch, ordered=False)
+        except Exception as e:
+            print(f"Error writing prediction records: {str(e)}")
+            with self._lock:
+                self._failed_batches += 1
+                self._last_error = str(e)
+            self._requeue(batch)
+            return False
+        with self._lock:
+            self._written += len(batch)
+            self._flushes += 1
+            self._last_flush_at = time.time()
+        return True
+
+    def _run(self):
+        backoff = self.flush_interval
+        while True:
+            with self._changed:
+                self._changed.wait_for(
+                    lambda: self._closed or len(self._buffer) >= self.batch_size,
+                    timeout=self.flush_interval,
+                )
+                if self._closed:
+                    return
+            batch = self._take_batch()
+            if not batch:
+                continue
+            if self._write(batch):
+                backoff = self.flush_interval
+            else:
+                # Do not hammer an unavailable database; the buffer's bound
+                # and overflow policy protect the requests meanwhile
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+
+# Shared write-behind buffer for this process's prediction records
+prediction_log = PredictionLog.from_settings()
+
+atexit.register(prediction_log.close)
+os.register_at_fork(after_in_child=prediction_log.reset_after_fork)
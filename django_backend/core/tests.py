@@ -1,3 +1,350 @@
-from django.test import TestCase
+import asyncio
+import base64
+import builtins
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
+from urllib.parse import urlencode
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory, SimpleTestCase
+from mongoengine import connect, disconnect
+from mongoengine.connection import get_connection
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.history import prediction_history
+from core.models import Prediction, TrainingJob
+from core.training_jobs import (
+    TrainingWorkerPool,
+    cancel_training_job,
+    claim_next_job,
+    finish_job,
+    send_heartbeats,
+)
+from core.views.prediction import AsyncPredictionView, get_predictions
+from core.views.training import TrainingJobView
+from ml import prediction
+
+SAMPLE = {
+    "N": 90,
+    "P": 42,
+    "K": 43,
+    "pH": 6.5,
+    "temperature": 20.8,
+    "rainfall": 202.9,
+    "humidity": 82.0,
+}
+
+
+class AsyncPredictionViewTests(SimpleTestCase):
+    def post(self, query=""):
+        request = RequestFactory().post(
+            f"/api/predict/async/{query}",
+            data=json.dumps(SAMPLE),
+            content_type="application/json",
+        )
+
+        async def auser():
+            return AnonymousUser()
+
+        request.auser = auser
+        return asyncio.run(AsyncPredictionView.as_view()(request))
+
+    def test_no_file_io_on_the_event_loop(self):
+        loop_thread = threading.get_ident()
+        on_loop, tier_checks = [], []
+
+        def watch(func):
+            def wrapper(*args, **kwargs):
+                if threading.get_ident() == loop_thread:
+                    on_loop.append((func.__name__, args[:1]))
+                return func(*args, **kwargs)
+
+            return wrapper
+
+        def tier_available(tier):
+            tier_checks.append(threading.get_ident())
+            return real_tier_available(tier)
+
+        real_tier_available = prediction.tier_available
+        with (
+            mock.patch("core.views.prediction.log_prediction"),
+            mock.patch.object(prediction, "tier_available", tier_available),
+            mock.patch("os.stat", watch(os.stat)),
+            mock.patch("builtins.open", watch(builtins.open)),
+        ):
+            response = self.post("?tier=fast")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(response["X-Model-Tier"], ("fast", "accurate"))
+        self.assertEqual(on_loop, [])
+        self.assertTrue(tier_checks)
+        self.assertNotIn(loop_thread, tier_checks)
+
+    def test_unknown_tier_is_rejected(self):
+        with mock.patch("core.views.prediction.log_prediction"):
+            response = self.post("?tier=fastest")
+        self.assertEqual(response.status_code, 400)
+
+
+def connect_mongo(db):
+    disconnect()
+    connect(
+        db=db,
+        host=settings.MONGODB_SETTINGS["host"],
+        port=settings.MONGODB_SETTINGS["port"],
+    )
+
+
+class MongoTestCase(SimpleTestCase):
+    """
+    Runs against a throwaway database next to the configured MongoDB one;
+    the collections of documents are emptied before every test.
+    """
+
+    documents = ()
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.db_name = f"{settings.MONGODB_SETTINGS['db']}_test"
+        connect_mongo(cls.db_name)
+
+    @classmethod
+    def tearDownClass(cls):
+        get_connection().drop_database(cls.db_name)
+        connect_mongo(settings.MONGODB_SETTINGS["db"])
+        for document in cls.documents:
+            document._collection = None
+        super().tearDownClass()
+
+    def setUp(self):
+        for document in self.documents:
+            document.drop_collection()
+            document.ensure_indexes()
+
+
+RESULTS = {
+    "top_crop": {"crop": "rice", "confidence": 0.9},
+    "crop_matches": [{"crop": "rice", "confidence": 0.9}],
+}
+
+
+class PredictionHistoryTests(MongoTestCase):
+    documents = (Prediction,)
+
+    def add_predictions(self, user_id, created_at, count):
+        return [
+            str(
+                Prediction(
+                    user_id=user_id,
+                    soil_params={},
+                    env_params={},
+                    results=RESULTS,
+                    created_at=created_at,
+                )
+                .save()
+                .id
+            )
+            for _ in range(count)
+        ]
+
+    def all_pages(self, user_id, limit):
+        ids, cursor = [], None
+        while True:
+            page = prediction_history(user_id, limit=limit, cursor=cursor)
+            self.assertLessEqual(len(page["predictions"]), limit)
+            ids += [entry["id"] for entry in page["predictions"]]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return ids
+
+    def test_pages_through_equal_timestamps_newest_first(self):
+        now = datetime(2026, 1, 1, 12)
+        older = self.add_predictions("u1", now - timedelta(hours=1), 4)
+        newer = self.add_predictions("u1", now, 5)
+        self.add_predictions("u2", now, 3)
+
+        # Records made at the same time come in descending id order
+        expected = sorted(newer, reverse=True) + sorted(older, reverse=True)
+        for limit in (1, 2, 3, 9, 10):
+            self.assertEqual(self.all_pages("u1", limit), expected)
+
+    def test_next_cursor_only_when_more_records_exist(self):
+        self.add_predictions("u1", datetime(2026, 1, 1), 4)
+        self.assertIsNone(prediction_history("u1", limit=4)["next_cursor"])
+        self.assertIsNone(prediction_history("u1", limit=5)["next_cursor"])
+        page = prediction_history("u1", limit=3)
+        self.assertIsNotNone(page["next_cursor"])
+        last = prediction_history("u1", limit=3, cursor=page["next_cursor"])
+        self.assertEqual(len(last["predictions"]), 1)
+        self.assertIsNone(last["next_cursor"])
+
+    def test_full_results_only_on_request(self):
+        self.add_predictions("u1", datetime(2026, 1, 1), 1)
+        summary = prediction_history("u1")["predictions"][0]
+        self.assertEqual(summary["results"], {"top_crop": RESULTS["top_crop"]})
+        full = prediction_history("u1", include_results=True)["predictions"][0]
+        self.assertEqual(full["results"], RESULTS)
+
+
+def encode(payload):
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+class PredictionHistoryViewTests(MongoTestCase):
+    documents = (Prediction,)
+
+    def setUp(self):
+        super().setUp()
+        for user_id in ("anonymous", "7", "8"):
+            Prediction(
+                user_id=user_id,
+                soil_params={},
+                env_params={},
+                results=RESULTS,
+            ).save()
+
+    def get(self, query="", user=None):
+        request = APIRequestFactory().get(f"/api/predictions/history/{query}")
+        if user is not None:
+            force_authenticate(request, user=user)
+        return get_predictions(request)
+
+    def owners(self, response):
+        self.assertEqual(response.status_code, 200)
+        return {entry["user_id"] for entry in response.data["predictions"]}
+
+    def test_anonymous_sees_only_anonymous_history(self):
+        self.assertEqual(self.owners(self.get()), {"anonymous"})
+        self.assertEqual(self.owners(self.get("?user_id=7")), {"anonymous"})
+
+    def test_users_see_only_their_own_history(self):
+        user = SimpleNamespace(is_authenticated=True, is_staff=False, pk=7)
+        self.assertEqual(self.owners(self.get(user=user)), {"7"})
+        self.assertEqual(self.owners(self.get("?user_id=8", user=user)), {"7"})
+
+    def test_staff_may_pick_the_user(self):
+        staff = SimpleNamespace(is_authenticated=True, is_staff=True, pk=1)
+        self.assertEqual(self.owners(self.get("?user_id=8", user=staff)), {"8"})
+        self.assertEqual(
+            self.owners(self.get("?user_id=anonymous", user=staff)), {"anonymous"}
+        )
+
+    def test_malformed_and_tampered_cursors_are_rejected(self):
+        cursors = [
+            "not a cursor",
+            encode("not json"),
+            encode("[]"),
+            encode(json.dumps({"t": "2026-01-01T00:00:00"})),
+            encode(json.dumps({"t": "yesterday", "id": "0" * 24})),
+            encode(json.dumps({"t": "2026-01-01T00:00:00", "id": "not-an-id"})),
+        ]
+        for cursor in cursors:
+            response = self.get("?" + urlencode({"cursor": cursor}))
+            self.assertEqual(response.status_code, 400, cursor)
+
+
+class FakeProcess:
+    def __init__(self):
+        self.terminated = False
+
+    def terminate(self):
+        self.terminated = True
+
+    def join(self):
+        pass
+
+
+class TrainingJobTests(MongoTestCase):
+    documents = (TrainingJob,)
+
+    def add_job(self, **fields):
+        return TrainingJob(dataset_id="d1", algorithm="xgboost", **fields).save()
+
+    def reload(self, job):
+        return TrainingJob.objects.get(id=job.id)
+
+    def test_claims_the_oldest_queued_job(self):
+        first = self.add_job(created_at=datetime(2026, 1, 1))
+        self.add_job(created_at=datetime(2026, 1, 2))
+        job = claim_next_job("w1")
+        self.assertEqual(job.id, first.id)
+        self.assertEqual((job.status, job.worker, job.attempts), ("running", "w1", 1))
+
+    def test_claiming_a_stale_running_job_bumps_attempts(self):
+        stale = datetime.now() - timedelta(seconds=300)
+        self.add_job(status="running", worker="w1", attempts=1, heartbeat_at=stale)
+        fresh = self.add_job(
+            status="running", worker="w1", attempts=1, heartbeat_at=datetime.now()
+        )
+        job = claim_next_job("w2", stale_after=120)
+        self.assertNotEqual(job.id, fresh.id)
+        self.assertEqual((job.worker, job.attempts), ("w2", 2))
+        self.assertIsNone(claim_next_job("w2", stale_after=120))
+
+    def test_fenced_out_worker_cannot_finish_the_job(self):
+        job = self.add_job(status="running", worker="w1", attempts=1)
+        TrainingJob.objects(id=job.id).update_one(
+            set__heartbeat_at=datetime.now() - timedelta(seconds=300)
+        )
+        claim_next_job("w2", stale_after=120)
+
+        self.assertFalse(finish_job(str(job.id), "failed", "w1", 1, error="late"))
+        self.assertEqual(self.reload(job).status, "running")
+        self.assertTrue(finish_job(str(job.id), "succeeded", "w2", 2))
+        self.assertEqual(self.reload(job).status, "succeeded")
+
+    def test_heartbeats_stop_once_the_job_is_taken_over(self):
+        job = self.add_job(status="running", worker="w1", attempts=1)
+        stopped = mock.Mock()
+        stopped.wait.side_effect = [False, True]
+        send_heartbeats(str(job.id), "w1", 1, 0, stopped)
+        beat = self.reload(job).heartbeat_at
+        self.assertIsNotNone(beat)
+
+        TrainingJob.objects(id=job.id).update_one(set__worker="w2", set__attempts=2)
+        stopped.wait.side_effect = [False, True]
+        send_heartbeats(str(job.id), "w1", 1, 0, stopped)
+        self.assertEqual(self.reload(job).heartbeat_at, beat)
+
+    def test_cancelling_a_queued_job_finishes_it(self):
+        job = cancel_training_job(self.add_job())
+        self.assertEqual(job.status, "cancelled")
+        self.assertTrue(job.cancel_requested)
+        self.assertIsNone(claim_next_job("w1"))
+
+    def test_cancelling_a_running_job_requests_it(self):
+        job = cancel_training_job(self.add_job(status="running", worker="w1"))
+        self.assertEqual(job.status, "running")
+        self.assertTrue(job.cancel_requested)
+
+    def test_cancelling_a_finished_job_conflicts(self):
+        view = TrainingJobView.as_view()
+        for status in ("succeeded", "failed", "cancelled"):
+            job = self.add_job(status=status)
+            request = APIRequestFactory().delete(f"/api/models/train/{job.id}/")
+            response = view(request, job_id=str(job.id))
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual(self.reload(job).status, status)
+
+    def test_shutdown_requeues_jobs_that_are_not_saving(self):
+        pool = TrainingWorkerPool()
+        training = self.add_job(status="running", worker=pool.worker, attempts=1)
+        saving = self.add_job(
+            status="running", worker=pool.worker, attempts=1, saving=True
+        )
+        processes = {str(training.id): FakeProcess(), str(saving.id): FakeProcess()}
+        pool._running = {job_id: (process, 1) for job_id, process in processes.items()}
+        pool._shutdown()
+
+        training, saving = self.reload(training), self.reload(saving)
+        self.assertEqual((training.status, training.attempts), ("queued", 0))
+        self.assertIsNone(training.worker)
+        self.assertTrue(processes[str(training.id)].terminated)
+        self.assertEqual(saving.status, "running")
+        self.assertFalse(processes[str(saving.id)].terminated)
@@ -0,0 +1,345 @@
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from django.conf import settings
+from mongoengine.queryset.visitor import Q
+
+from .models import Dataset, TrainedModel, TrainingJob
+
+TRAINING_ALGORITHMS = ("random_forest", "xgboost")
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+
+
+def enqueue_training_job(dataset_id, algorithm):
+    """Queue a training run; a worker pool picks it up"""
+    return TrainingJob(dataset_id=str(dataset_id), algorithm=algorithm).save()
+
+
+def get_training_job(job_id):
+    """Return the TrainingJob with this id, or None"""
+    if not ObjectId.is_valid(job_id):
+        return None
+    return TrainingJob.objects(id=job_id).first()
+
+
+def cancel_training_job(job):
+    """
+    Cancel a job: a queued job never starts, a running one stops before its
+    next training stage. A job that is already saving its model finishes.
+
+    Returns:
+        TrainingJob: The job's current state
+    """
+    now = datetime.now()
+    cancelled = TrainingJob.objects(id=job.id, status="queued").modify(
+        new=True,
+        set__status="cancelled",
+        set__cancel_requested=True,
+        set__finished_at=now,
+    )
+    if cancelled is not None:
+        return cancelled
+    TrainingJob.objects(id=job.id, status="running").update_one(
+        set__cancel_requested=True
+    )
+    return TrainingJob.objects.get(id=job.id)
+
+
+def owned_job(job_id, worker, attempts):
+    """Return a query for a job while it is running as attempt attempts on worker"""
+    return TrainingJob.objects(
+        id=job_id, status="running", worker=worker, attempts=attempts
+    )
+
+
+def finish_job(job_id, status, worker, attempts, **fields):
+    """
+    Record the outcome of a running job, unless it has since been taken over.
+
+    Returns:
+        bool: False if the job was no longer running as this attempt on worker
+    """
+    update = {f"set__{name}": value for name, value in fields.items()}
+    return bool(
+        owned_job(job_id, worker, attempts).update_one(
+            set__status=status, set__finished_at=datetime.now(), **update
+        )
+    )
+
+
+def job_state(job):
+    """Return a job as the training status endpoints report it"""
+    state = {
+        "job_id": str(job.id),
+        "name": str(job.id),
+        "status": job.status,
+        "algorithm": job.algorithm,
+        "dataset_id": job.dataset_id,
+        "cancel_requested": job.cancel_requested,
+        "saving": job.saving,
+        "attempts": job.attempts,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "error": job.error,
+        "trained_model_id": job.trained_model_id,
+        "message": f"Training job is {job.status}",
+    }
+    if job.result:
+        state.update(
+            model_id=job.result.get("model_id"),
+            model_path=job.result.get("model_path"),
+            message=job.result.get("message", state["message"]),
+            metrics=job.result.get("metrics"),
+        )
+    return state
+
+
+def claim_next_job(worker, stale_after=120):
+    """
+    Atomically take the oldest queued job, or a running one whose pool has
+    stopped sending heartbeats, and mark it as running on worker.
+
+    Returns:
+        TrainingJob: The claimed job, or None if there is nothing to run
+    """
+    now = datetime.now()
+    abandoned = Q(status="running") & Q(
+        heartbeat_at__lt=now - timedelta(seconds=stale_after)
+    )
+    return (
+        TrainingJob.objects(Q(status="queued") | abandoned)
+        .order_by("created_at")
+        .modify(
+            new=True,
+            set__status="running",
+            set__worker=worker,
+            set__started_at=now,
+            set__heartbeat_at=now,
+            set__saving=False,
+            inc__attempts=1,
+        )
+    )
+
+
+def send_heartbeats(job_id, worker, attempts, interval, stopped):
+    """Update the job's heartbeat every interval seconds until stopped is set"""
+    while not stopped.wait(interval):
+        try:
+            owned_job(job_id, worker, attempts).update_one(
+                set__heartbeat_at=datetime.now()
+            )
+        except Exception as e:
+            print(f"Error sending heartbeat for training job {job_id}: {str(e)}")
+
+
+def run_training_job(job_id, worker, attempts, heartbeat_interval=30):
+    """
+    Train the model of a job claimed as attempt attempts on worker, and record
+    the outcome.
+
+    The job's heartbeats come from this process, so a job whose pool died is
+    still finished here rather than trained twice. Between training stages
+    the job is checked: a cancelled job stops there, and so does one that was
+    taken over by another pool. Before the model is written the job is marked
+    as saving, which a cancellation or shutdown no longer interrupts, and every
+    write to the job is made only while it is still this attempt's.
+    """
+    from ml.catalog import model_catalog
+    from ml.training import TrainingCancelled, train_model
+
+    def checkpoint(stage):
+        job = owned_job(job_id, worker, attempts).only("cancel_requested").first()
+        if job is None:
+            raise TrainingCancelled("the job was taken over by another worker")
+        if job.cancel_requested:
+            raise TrainingCancelled("cancellation was requested")
+        if stage != "saving":
+            return
+        saving = owned_job(job_id, worker, attempts).filter(cancel_requested=False)
+        if not saving.update_one(set__saving=True):
+            raise TrainingCancelled("the job changed before saving")
+
+    stopped = threading.Event()
+    threading.Thread(
+        target=send_heartbeats,
+        args=(job_id, worker, attempts, heartbeat_interval, stopped),
+        daemon=True,
+    ).start()
+    job = TrainingJob.objects.get(id=job_id)
+    try:
+        dataset = Dataset.objects.get(id=job.dataset_id)
+        print(f"Training job {job_id}: {job.algorithm} on {dataset.file_path}")
+        result = train_model(job.algorithm, dataset.file_path, checkpoint=checkpoint)
+        if not result.get("success", False):
+            raise Exception(result.get("error", "Training failed"))
+
+        model = TrainedModel(
+            name=f"{job.algorithm}_{dataset.name}",
+            algorithm=job.algorithm,
+            metrics=result,
+            file_path=result["model_path"],
+        ).save()
+
+        # Make the new model the active one for every worker
+        model_catalog.register(
+            result["model_id"],
+            result["model_path"],
+            job.algorithm,
+            created_at=model.created_at.isoformat(),
+            document_id=str(model.id),
+        )
+    except TrainingCancelled as e:
+        print(f"Training job {job_id} stopped: {str(e)}")
+        finish_job(job_id, "cancelled", worker, attempts)
+        return
+    except Exception as e:
+        print(f"Training job {job_id} failed: {str(e)}")
+        finish_job(job_id, "failed", worker, attempts, error=str(e))
+        return
+    finally:
+        stopped.set()
+    finish_job(
+        job_id,
+        "succeeded",
+        worker,
+        attempts,
+        result=result,
+        trained_model_id=str(model.id),
+    )
+
+
+def training_process_main(job_id, worker, attempts, heartbeat_interval):
+    """Entry point of a training process, which starts from a fresh interpreter"""
+    import django
+
+    django.setup()
+    run_training_job(job_id, worker, attempts, heartbeat_interval)
+
+
+class TrainingWorkerPool:
+    """
+    Runs queued training jobs in worker processes.
+
+    Each job runs in its own spawned process, at most processes at a time, so
+    a training run never holds a web worker. The pool claims jobs from
+    MongoDB and fails jobs whose process died; the process sends the job's
+    heartbeats and handles its cancellation (see run_training_job). A job
+    whose process dies with the pool is claimed again by another pool once
+    its heartbeat is stale_after seconds old, up to max_attempts times.
+    """
+
+    def __init__(
+        self, processes=2, poll_interval=2.0, stale_after=120, max_attempts=3
+    ):
+        self.processes = processes
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self._context = multiprocessing.get_context("spawn")
+        self._running = {}
+        self._stopping = False
+
+    @classmethod
+    def from_settings(cls, **overrides):
+        config = {**getattr(settings, "TRAINING_JOBS", {}), **overrides}
+        return cls(
+            processes=config.get("processes", 2),
+            poll_interval=config.get("poll_interval", 2.0),
+            stale_after=config.get("stale_after", 120),
+            max_attempts=config.get("max_attempts", 3),
+        )
+
+    def run(self):
+        """Process jobs until SIGTERM or SIGINT, then requeue unfinished ones"""
+        signal.signal(signal.SIGTERM, lambda *_: self.stop())
+        signal.signal(signal.SIGINT, lambda *_: self.stop())
+        print(f"Training worker pool {self.worker} with {self.processes} process(es)")
+        while not self._stopping:
+            try:
+                self._reap()
+                self._fill()
+            except Exception as e:
+                print(f"Error in training worker pool: {str(e)}")
+            time.sleep(self.poll_interval)
+        self._shutdown()
+
+    def stop(self):
+        self._stopping = True
+
+    def _reap(self):
+        for job_id, (process, attempts) in list(self._running.items()):
+            if process.is_alive():
+                continue
+            process.join()
+            del self._running[job_id]
+            # A process that finished normally has recorded its own outcome
+            if process.exitcode != 0:
+                finish_job(
+                    job_id,
+                    "failed",
+                    self.worker,
+                    attempts,
+                    error=f"Training process exited with code {process.exitcode}",
+                )
+
+    def _fill(self):
+        while len(self._running) < self.processes and not self._stopping:
+            job = claim_next_job(self.worker, stale_after=self.stale_after)
+            if job is None:
+                return
+            job_id = str(job.id)
+            if job.cancel_requested:
+                finish_job(job_id, "cancelled", self.worker, job.attempts)
+                continue
+            if job.attempts > self.max_attempts:
+                finish_job(
+                    job_id,
+                    "failed",
+                    self.worker,
+                    job.attempts,
+                    error="Training job was abandoned too often",
+                )
+                continue
+            process = self._context.Process(
+                target=training_process_main,
+                args=(job_id, self.worker, job.attempts, self.stale_after / 4),
+                name=f"training-{job_id}",
+            )
+            process.start()
+            self._running[job_id] = (process, job.attempts)
+            print(f"Training job {job_id} started in process {process.pid}")
+
+    def _shutdown(self):
+        """
+        Put running jobs back in the queue for the next pool and stop their
+        processes. A job that is saving its model is left to finish.
+        """
+        for job_id, (process, attempts) in self._running.items():
+            # Once requeued, the job can no longer be marked as saving, so
+            # its process is stopped before it writes any model file
+            requeued = (
+                owned_job(job_id, self.worker, attempts)
+                .filter(saving=False)
+                .update_one(
+                    set__status="queued",
+                    unset__worker=True,
+                    unset__heartbeat_at=True,
+                    # Being stopped by a shutdown does not count as an attempt
+                    dec__attempts=1,
+                )
+            )
+            if requeued:
+                process.terminate()
+                print(f"Training job {job_id} requeued")
+            else:
+                print(f"Waiting for training job {job_id} to finish saving")
+            process.join()
+        self._running = {}
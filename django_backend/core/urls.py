@@ -1,9 +1,21 @@
 from django.urls import path
-from .views.prediction import PredictionView
-from .views.training import DatasetUploadView, ModelTrainingView
+from django.views.decorators.csrf import csrf_exempt
+from .views.prediction import (
+    AsyncPredictionView,
+    PredictionBatchView,
+    PredictionBulkView,
+    PredictionView,
+    get_predictions,
+)
+from .views.training import DatasetUploadView, ModelTrainingView, TrainingJobView
 
 urlpatterns = [
     path("predictions/", PredictionView.as_view()),
+    path("predictions/async/", csrf_exempt(AsyncPredictionView.as_view())),
+    path("predictions/history/", get_predictions),
+    path("predictions/batch/", PredictionBatchView.as_view()),
+    path("predictions/bulk/", PredictionBulkView.as_view()),
     path("datasets/upload/", DatasetUploadView.as_view()),
     path("models/train/", ModelTrainingView.as_view()),
+    path("models/train/<str:job_id>/", TrainingJobView.as_view()),
 ]
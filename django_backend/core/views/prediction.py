@@ -3,13 +3,29 @@ from rest_framework.response import Response
 from rest_framework.decorators import api_view
 from rest_framework.views import APIView
 from rest_framework import status
+from core.history import prediction_history
 from core.models import Prediction
+from core.prediction_log import prediction_log
 from core.serializers import PredictionSerializer
-from ml.prediction import generate_prediction
+from ml.bulk import BULK_OUTPUT_FORMATS, read_csv_chunks, stream_bulk_predictions
+from ml.executor import InferenceQueueFull
+from ml.prediction import (
+    RESPONSE_FIELDS,
+    FallbackPrediction,
+    SLIM_RESPONSE_FIELDS,
+    agenerate_prediction,
+    generate_batch_predictions,
+    generate_prediction,
+    select_model_tier,
+    shape_prediction_response,
+)
 from ml.models import CropModel
+import json
 import os
 import pickle
 from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
 
 
 @api_view(["POST"])
@@ -21,46 +37,147 @@ def predict_crop(request):
 
 @api_view(["GET"])
 def get_predictions(request):
-    return Response(
-        {
-            "predictions": [
-                {"id": 1, "crop": "Wheat", "confidence": 0.92, "date": "2024-03-25"}
-            ]
-        }
+    """
+    Prediction history, newest first, one page at a time.
+
+    Signed-in users see their own predictions and everyone else the ones
+    made without signing in; only staff may pick another user with
+    ?user_id=. Query parameters: ?limit=N (at most
+    PREDICTION_HISTORY_MAX_LIMIT), ?cursor= (next_cursor of the previous page)
+    and ?results=1 to include each prediction's full results.
+    """
+    if not request.user.is_authenticated:
+        user_id = "anonymous"
+    elif request.user.is_staff:
+        user_id = request.query_params.get("user_id", str(request.user.pk))
+    else:
+        user_id = str(request.user.pk)
+
+    max_limit = getattr(settings, "PREDICTION_HISTORY_MAX_LIMIT", 100)
+    try:
+        limit = int(request.query_params.get("limit", 20))
+    except (TypeError, ValueError):
+        limit = 0
+    if not 1 <= limit <= max_limit:
+        return Response(
+            {"error": f"limit must be between 1 and {max_limit}"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    include_results = request.query_params.get("results", "").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+
+    try:
+        page = prediction_history(
+            user_id,
+            limit=limit,
+            cursor=request.query_params.get("cursor"),
+            include_results=include_results,
+        )
+        return Response(page, status=status.HTTP_200_OK)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        print(f"Error fetching prediction history: {str(e)}")
+        return Response(
+            {"error": str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
+
+
+def parse_response_shape(query_params):
+    """
+    Read the response-shaping query parameters of a prediction request.
+
+    ?fields=a,b selects top-level fields, ?slim=1 selects top_crop, crop_matches
+    and match_analysis, and ?icons=ref replaces inline SVG with icon ids (slim
+    mode implies it).
+
+    Returns:
+        tuple: (fields or None, inline_icons)
+
+    Raises:
+        ValueError: If an unknown field or icons mode is requested
+    """
+    slim = query_params.get("slim", "").lower() in ("1", "true", "yes")
+    fields = None
+    if query_params.get("fields"):
+        fields = [f.strip() for f in query_params["fields"].split(",") if f.strip()]
+        unknown = [f for f in fields if f not in RESPONSE_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown response fields: {', '.join(unknown)}")
+    elif slim:
+        fields = list(SLIM_RESPONSE_FIELDS)
+
+    icons = query_params.get("icons", "ref" if slim else "inline")
+    if icons not in ("inline", "ref"):
+        raise ValueError("icons must be 'inline' or 'ref'")
+    return fields, icons == "inline"
+
+
+def extract_prediction_params(data):
+    """
+    Split a prediction request body into generate_prediction's inputs.
+
+    Returns:
+        tuple: (soil_params, env_params, list of missing parameter names)
+    """
+    # Extract soil parameters
+    soil_params = {
+        "nitrogen": data.get("N"),
+        "phosphorus": data.get("P"),
+        "potassium": data.get("K"),
+        "ph": data.get("pH"),
+    }
+
+    # Extract environmental parameters
+    env_params = {
+        "temperature": data.get("temperature"),
+        "rainfall": data.get("rainfall"),
+        "humidity": data.get("humidity"),
+    }
+
+    # Validate required parameters
+    required_params = ["N", "P", "K", "pH", "temperature", "rainfall", "humidity"]
+    missing_params = [param for param in required_params if data.get(param) is None]
+    return soil_params, env_params, missing_params
+
+
+def log_prediction(user, soil_params, env_params, prediction_result, block=True):
+    """
+    Queue a prediction for the audit trail without waiting for the write.
+
+    The canned response served when no prediction could be made is not a
+    result and is never recorded. Pass block=False on an event loop.
+    """
+    if isinstance(prediction_result, FallbackPrediction):
+        return
+    user_id = str(user.pk) if user is not None and user.is_authenticated else None
+    # Icons are static assets; the stored record keeps only their ids
+    prediction_log.record(
+        soil_params,
+        env_params,
+        shape_prediction_response(prediction_result, inline_icons=False),
+        user_id=user_id,
+        block=block,
     )
 
 
 class PredictionView(APIView):
     def post(self, request):
         try:
-            # Extract soil parameters
-            soil_params = {
-                "nitrogen": request.data.get("N"),
-                "phosphorus": request.data.get("P"),
-                "potassium": request.data.get("K"),
-                "ph": request.data.get("pH"),
-            }
-
-            # Extract environmental parameters
-            env_params = {
-                "temperature": request.data.get("temperature"),
-                "rainfall": request.data.get("rainfall"),
-                "humidity": request.data.get("humidity"),
-            }
-
-            # Validate required parameters
-            required_params = [
-                "N",
-                "P",
-                "K",
-                "pH",
-                "temperature",
-                "rainfall",
-                "humidity",
-            ]
-            missing_params = [
-                param for param in required_params if request.data.get(param) is None
-            ]
+            try:
+                fields, inline_icons = parse_response_shape(request.query_params)
+                tier = select_model_tier(request.query_params.get("tier"))
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            soil_params, env_params, missing_params = extract_prediction_params(
+                request.data
+            )
             if missing_params:
                 return Response(
                     {
@@ -70,18 +187,204 @@ class PredictionView(APIView):
                 )
 
             # Generate prediction
-            prediction_result = generate_prediction(soil_params, env_params)
+            prediction_result = generate_prediction(
+                soil_params, env_params, tier=tier
+            )
             if prediction_result is None:
                 return Response(
                     {"error": "Failed to generate prediction"},
                     status=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 )
+            log_prediction(request.user, soil_params, env_params, prediction_result)
+
+            prediction_result = shape_prediction_response(
+                prediction_result, fields=fields, inline_icons=inline_icons
+            )
+            response = Response(prediction_result, status=status.HTTP_200_OK)
+            response["X-Model-Tier"] = tier
+            return response
+
+        except Exception as e:
+            print(f"Error in prediction: {str(e)}")
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+
+class AsyncPredictionView(View):
+    """
+    Async PredictionView for ASGI deployments.
+
+    Accepts the same JSON body and query parameters. Predictions run in the
+    bounded inference executor, so slow clients and slow predictions do not
+    tie up a worker thread each.
+    """
+
+    async def post(self, request):
+        try:
+            try:
+                fields, inline_icons = parse_response_shape(request.GET)
+                data = json.loads(request.body or b"{}")
+            except ValueError as e:
+                return JsonResponse({"error": str(e)}, status=400)
+            if not isinstance(data, dict):
+                return JsonResponse({"error": "Expected a JSON object"}, status=400)
+
+            soil_params, env_params, missing_params = extract_prediction_params(data)
+            if missing_params:
+                return JsonResponse(
+                    {
+                        "error": f"Missing required parameters: {', '.join(missing_params)}"
+                    },
+                    status=400,
+                )
+
+            try:
+                # The tier is checked against the model files in the executor
+                prediction_result, tier = await agenerate_prediction(
+                    soil_params, env_params, requested_tier=request.GET.get("tier")
+                )
+            except ValueError as e:
+                return JsonResponse({"error": str(e)}, status=400)
+            except InferenceQueueFull as e:
+                return JsonResponse({"error": str(e)}, status=503)
+            if prediction_result is None:
+                return JsonResponse(
+                    {"error": "Failed to generate prediction"}, status=500
+                )
+            user = await request.auser()
+            log_prediction(
+                user, soil_params, env_params, prediction_result, block=False
+            )
 
-            return Response(prediction_result, status=status.HTTP_200_OK)
+            prediction_result = shape_prediction_response(
+                prediction_result, fields=fields, inline_icons=inline_icons
+            )
+            response = JsonResponse(prediction_result)
+            response["X-Model-Tier"] = tier
+            return response
 
         except Exception as e:
             print(f"Error in prediction: {str(e)}")
+            return JsonResponse({"error": str(e)}, status=500)
+
+
+class PredictionBatchView(APIView):
+    def post(self, request):
+        samples = request.data.get("samples")
+        if not isinstance(samples, list) or not samples:
+            return Response(
+                {"error": "samples must be a non-empty list"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        max_samples = getattr(settings, "ML_BATCH_MAX_SAMPLES", 1000)
+        if len(samples) > max_samples:
+            return Response(
+                {"error": f"A batch may contain at most {max_samples} samples"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            top_k = int(request.data.get("top_k", 5))
+        except (TypeError, ValueError):
+            top_k = 0
+        if top_k < 1:
+            return Response(
+                {"error": "top_k must be a positive integer"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        match_analysis = str(request.data.get("match_analysis", "")).lower() in (
+            "1",
+            "true",
+            "yes",
+        )
+
+        try:
+            tier = select_model_tier(request.data.get("tier"))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            results = generate_batch_predictions(
+                samples, top_k=top_k, match_analysis=match_analysis, tier=tier
+            )
+            return Response(
+                {"count": len(results), "tier": tier, "results": results},
+                status=status.HTTP_200_OK,
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except RuntimeError as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        except Exception as e:
+            print(f"Error in batch prediction: {str(e)}")
             return Response(
                 {"error": str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
+
+
+class PredictionBulkView(APIView):
+    """
+    Score a CSV of soil samples and stream the results back as they complete.
+
+    Send the CSV as the "file" field of a multipart upload, or as the raw body
+    with Content-Type: text/csv. A raw body is parsed while it is still being
+    received, so the first rows are answered before the upload has finished.
+    Query parameters: ?output=ndjson|csv (default ndjson) and ?top_k=N.
+    """
+
+    def post(self, request):
+        output = request.query_params.get("output", "ndjson")
+        if output not in BULK_OUTPUT_FORMATS:
+            return Response(
+                {"error": f"output must be one of: {', '.join(BULK_OUTPUT_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            top_k = int(request.query_params.get("top_k", 5))
+        except (TypeError, ValueError):
+            top_k = 0
+        if top_k < 1:
+            return Response(
+                {"error": "top_k must be a positive integer"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # Never touch request.data for raw CSV: that would buffer the whole body
+        if request.content_type.startswith("text/csv"):
+            source = request.stream
+        else:
+            source = request.FILES.get("file")
+        if source is None:
+            return Response(
+                {
+                    "error": "Upload a CSV as 'file' or send it with "
+                    "Content-Type: text/csv"
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            chunks = read_csv_chunks(
+                source, chunk_size=getattr(settings, "ML_BULK_CHUNK_SIZE", 5000)
+            )
+        except ValueError as e:
+            return Response(
+                {"error": f"Invalid CSV: {str(e)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        response = StreamingHttpResponse(
+            stream_bulk_predictions(chunks, output=output, top_k=top_k),
+            content_type=BULK_OUTPUT_FORMATS[output],
+        )
+        # Let proxies pass each chunk through instead of buffering the response
+        response["X-Accel-Buffering"] = "no"
+        return response
@@ -1,10 +1,18 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from core.models import Dataset, TrainedModel
-from core.serializers import DatasetSerializer, TrainedModelSerializer
-from ml.training import train_model
+from core.models import Dataset
+from core.serializers import DatasetSerializer
+from core.training_jobs import (
+    FINISHED_STATUSES,
+    TRAINING_ALGORITHMS,
+    cancel_training_job,
+    enqueue_training_job,
+    get_training_job,
+    job_state,
+)
 from ml.utils import DATASET_PATH
+from mongoengine.errors import ValidationError
 import pandas as pd
 import os
 from datetime import datetime
@@ -98,40 +106,59 @@ class ModelTrainingView(APIView):
                 {"error": "Algorithm is required"}, status=status.HTTP_400_BAD_REQUEST
             )
 
+        if algorithm not in TRAINING_ALGORITHMS:
+            algorithms = ", ".join(TRAINING_ALGORITHMS)
+            return Response(
+                {"error": f"algorithm must be one of: {algorithms}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
         print(
-            f"Starting training with dataset ID: {dataset_id}, algorithm: {algorithm}"
+            f"Queueing training with dataset ID: {dataset_id}, algorithm: {algorithm}"
         )  # Debug log
 
         try:
-            # Get dataset from MongoDB
+            # Check the dataset exists before queueing a job for it
             dataset = Dataset.objects.get(id=dataset_id)
-            print(f"Found dataset: {dataset.name} at {dataset.file_path}")  # Debug log
 
-            # Train model using the absolute file path
-            model_metrics = train_model(algorithm, dataset.file_path)
-
-            if not model_metrics.get("success", False):
-                raise Exception(model_metrics.get("error", "Training failed"))
-
-            # Save trained model
-            model = TrainedModel(
-                name=f"{algorithm}_{dataset.name}",
-                algorithm=algorithm,
-                metrics=model_metrics,
-                file_path=model_metrics["model_path"],
-            ).save()
-
-            serializer = TrainedModelSerializer(model)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        except Dataset.DoesNotExist:
+            # Training runs in a worker process (manage.py run_training_workers);
+            # poll the job for its state and the resulting model
+            job = enqueue_training_job(str(dataset.id), algorithm)
+            return Response(job_state(job), status=status.HTTP_202_ACCEPTED)
+        except (Dataset.DoesNotExist, ValidationError):
             print(f"Dataset not found with ID: {dataset_id}")  # Debug log
             return Response(
                 {"error": "Dataset not found"},
                 status=status.HTTP_404_NOT_FOUND,
             )
         except Exception as e:
-            print(f"Training error: {str(e)}")  # Debug log
+            print(f"Error queueing training: {str(e)}")  # Debug log
             return Response(
                 {"error": f"Training failed: {str(e)}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
+
+
+class TrainingJobView(APIView):
+    def get(self, request, job_id):
+        job = get_training_job(job_id)
+        if job is None:
+            return Response(
+                {"error": "Training job not found"}, status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(job_state(job), status=status.HTTP_200_OK)
+
+    def delete(self, request, job_id):
+        """Cancel a queued or running job"""
+        job = get_training_job(job_id)
+        if job is None:
+            return Response(
+                {"error": "Training job not found"}, status=status.HTTP_404_NOT_FOUND
+            )
+        if job.status in FINISHED_STATUSES:
+            return Response(
+                {"error": f"Training job has already {job.status}"},
+                status=status.HTTP_409_CONFLICT,
+            )
+        job = cancel_training_job(job)
+        return Response(job_state(job), status=status.HTTP_202_ACCEPTED)
@@ -136,6 +136,30 @@ MONGODB_SETTINGS = {
     "port": 27017,
 }
 
+# Prediction records are buffered in memory and written in batches by a
+# background thread; overflow_policy is "drop_oldest", "drop_newest" or "block"
+# ("block" never waits in async views, which drop the new record instead)
+PREDICTION_LOG = {
+    "enabled": True,
+    "max_buffer": 10000,
+    "batch_size": 500,
+    "flush_interval": 1.0,
+    "overflow_policy": "drop_oldest",
+    "block_timeout": 0.05,
+}
+# Largest page the prediction history endpoint returns
+PREDICTION_HISTORY_MAX_LIMIT = 100
+# Training job workers (manage.py run_training_workers): processes run jobs in
+# parallel, and a running job whose training process has not sent a heartbeat
+# for stale_after seconds is taken over by another pool, at most max_attempts
+# times
+TRAINING_JOBS = {
+    "processes": 2,
+    "poll_interval": 2.0,
+    "stale_after": 120,
+    "max_attempts": 3,
+}
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True  # For development only
 CORS_ALLOW_CREDENTIALS = True
@@ -201,6 +225,93 @@ CSRF_COOKIE_SECURE = False  # Set to True in production
 CSRF_COOKIE_HTTPONLY = False  # Set to True in production
 CSRF_COOKIE_SAMESITE = "Lax"
 
+# ML serving settings
+ML_BATCH_MAX_SAMPLES = 1000
+# Rows parsed and scored at a time by the streaming CSV endpoint
+ML_BULK_CHUNK_SIZE = 5000
+# Worker pool for inference requested by async views; requests beyond
+# max_workers + max_queue are rejected with 503
+ML_INFERENCE_EXECUTOR = {"max_workers": 4, "max_queue": 64}
+# Coalesce concurrent single-sample predictions into one model call, waiting
+# at most max_wait_ms for a batch of up to max_batch_size samples to form.
+# Batches form per process, so this only helps under the async view or
+# threaded workers; sync gunicorn workers never see two samples at once
+ML_MICRO_BATCHING = {"enabled": False, "max_batch_size": 64, "max_wait_ms": 2.0}
+# Preload the active model and run sample predictions when a serving process
+# starts; /api/ready/ returns 503 until this has finished. ML_WARMUP=1 in the
+# environment also enables it
+ML_WARMUP = {"enabled": False, "background": True, "samples": None}
+# How train_model stores models: "artifact" (versioned directory with a JSON
+# manifest and raw array payloads, no pickle) or "pickle"
+ML_MODEL_FORMAT = "artifact"
+# Serve models from memory-mapped .bundle files written next to the pickles, so
+# all worker processes share one copy of the tree arrays
+ML_SERVE_MODEL_BUNDLES = False
+# "native" (sklearn/XGBoost) or "compiled" (flattened numpy tree evaluator)
+ML_INFERENCE_BACKEND = "native"
+# Models other than the default one and its tiers (e.g. /api/predict/ with a
+# model_id) that each worker keeps loaded, least recently used evicted first
+ML_MODEL_REGISTRY_SIZE = 4
+# Precomputed lookup grid built by train_model (or build_lookup_grid) and
+# served in front of the model; cells where the model's answer changes are
+# halved up to max_depth times, max_splits cells in all. A grid whose measured
+# top-crop disagreement bound exceeds max_error_rate is never served
+ML_LOOKUP_GRID = {
+    "enabled": False,
+    "coarse_bins": 4,
+    "max_depth": 14,
+    "probes": 8,
+    "max_splits": 65536,
+    "validation_samples": 20000,
+    "max_error_rate": 0.01,
+}
+# Train balanced (smaller ensemble) and fast (distilled single tree) variants
+# of each model. Requests pick one with ?tier=accurate|balanced|fast; with auto
+# on, requests that do not are moved to a faster tier once balanced_at or
+# fast_at other predictions are in flight across all gunicorn workers. Sync
+# workers serve one request each, so the thresholds count busy workers and
+# default to half and all but one of them. The count is shared through memory
+# created before fork, so it needs preload_app; without it, it is per worker
+_SERVER_WORKERS = int(os.environ.get("GUNICORN_WORKERS", os.cpu_count() or 1))
+ML_MODEL_TIERS = {
+    "enabled": False,
+    "auto": False,
+    "balanced_at": max(1, _SERVER_WORKERS // 2),
+    "fast_at": max(2, _SERVER_WORKERS - 1),
+    "balanced": {"n_estimators": 20, "max_depth": 12},
+    "fast": {"max_depth": 8, "distill_samples": 20000},
+    "latency_samples": 200,
+}
+# Serve the accurate tier as a cascade: the first_stage tier answers samples
+# whose top-class probability reaches the threshold calibrated at training
+# time (the lowest at which it agrees with the full model target_agreement of
+# the time; "threshold" overrides it) and the full model scores the rest.
+# audit_rate of first-stage answers are re-checked against the full model
+ML_CASCADE = {
+    "enabled": False,
+    "first_stage": "fast",
+    "target_agreement": 0.99,
+    "calibration_samples": 20000,
+    "threshold": None,
+    "audit_rate": 0.01,
+}
+# Response cache for generate_prediction; precision is the step each input is
+# rounded to (kg/ha for N, P, K, pH units, °C, mm and %)
+ML_PREDICTION_CACHE = {
+    "enabled": True,
+    "max_entries": 10000,
+    "ttl": 300,
+    "precision": {
+        "N": 1.0,
+        "P": 1.0,
+        "K": 1.0,
+        "pH": 0.05,
+        "temperature": 0.5,
+        "rainfall": 1.0,
+        "humidity": 1.0,
+    },
+}
+
 # MongoDB Connection
 from mongoengine import connect
 
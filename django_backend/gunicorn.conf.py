@@ -0,0 +1,16 @@
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count()))
+wsgi_app = "django_backend.wsgi:application"
+
+# Import Django and load the active model once in the master process before
+# forking; workers then share the model's pages copy-on-write (and, with
+# ML_SERVE_MODEL_BUNDLES, through the page cache) instead of each loading a copy
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1").lower() in ("1", "true", "yes")
+
+if preload_app:
+    # Warm up synchronously in the master so workers are forked already warm
+    os.environ.setdefault("ML_WARMUP", "1")
+    os.environ.setdefault("ML_WARMUP_BACKGROUND", "0")
@@ -1,6 +1,21 @@
+import os
+import sys
+
 from django.apps import AppConfig
 
 
 class MlConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "ml"
+
+    def ready(self):
+        # Only serving processes warm up, not migrate, shell or training commands,
+        # and not the runserver autoreloader's parent process
+        if os.path.basename(sys.argv[0]) == "manage.py":
+            command = sys.argv[1] if len(sys.argv) > 1 else None
+            if command != "runserver" or os.environ.get("RUN_MAIN") != "true":
+                return
+
+        from .warmup import start_warmup
+
+        start_warmup()
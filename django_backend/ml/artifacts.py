@@ -0,0 +1,325 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from .bundle import (
+    BundledCropModel,
+    bundle_arrays,
+    compiled_from_arrays,
+    read_array_bundle,
+    write_array_bundle,
+)
+from .features import feature_matrix
+
+ARTIFACT_FORMAT_VERSION = 1
+ARTIFACT_EXTENSION = ".model"
+MANIFEST_FILE = "manifest.json"
+ARRAYS_FILE = "arrays.bundle"
+BOOSTER_FILE = "booster.ubj"
+# An artifact path is a symlink to its current version, a sibling directory
+# named <path>.v<timestamp>-<pid>. The versions it last replaced are kept
+# for processes that opened them but have not mapped their payloads yet
+ARTIFACT_VERSION_MARKER = ".v"
+ARTIFACT_VERSIONS_KEPT = 2
+
+
+def file_checksum(path, chunk_size=1024 * 1024):
+    """Return the SHA-256 hex digest of a file"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def model_checksum(path):
+    """Checksum of a model file, or the manifest checksum of an artifact"""
+    if os.path.isdir(path):
+        return artifact_checksum(path)
+    return file_checksum(path)
+
+
+def is_model_artifact(path):
+    """Return True if path is a model artifact directory"""
+    return os.path.isfile(os.path.join(path, MANIFEST_FILE))
+
+
+def library_versions():
+    """Versions of the libraries that produced an artifact, for diagnostics"""
+    versions = {"numpy": np.__version__}
+    for name in ("sklearn", "xgboost"):
+        try:
+            versions[name] = __import__(name).__version__
+        except ImportError:
+            pass
+    return versions
+
+
+def payloads_checksum(payloads):
+    """Combine the per-file digests of an artifact into one checksum"""
+    digest = hashlib.sha256()
+    for name in sorted(payloads):
+        digest.update(f"{name}:{payloads[name]['sha256']}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def save_model_artifact(model, path, metrics=None):
+    """
+    Write a trained CropModel as a versioned artifact directory.
+
+    The directory holds manifest.json (features, classes, scaler parameters,
+    algorithm, metrics, library versions and payload checksums), the compiled
+    ensemble as a memory-mappable arrays.bundle and, for XGBoost, the booster
+    in its own binary format. Nothing in it is pickled, so loading an
+    artifact never executes code from the file. Each save writes a new
+    version directory next to path and then repoints path at it, so path
+    always resolves to a complete artifact.
+
+    Args:
+        model (CropModel): Trained model
+        path (str): Artifact directory to create or replace
+        metrics (dict): Optional evaluation metrics to record
+
+    Returns:
+        dict: The manifest that was written
+    """
+    path = os.path.abspath(path)
+    version_path = artifact_version_path(path)
+    os.makedirs(version_path)
+
+    try:
+        arrays, metadata = bundle_arrays(model)
+        write_array_bundle(os.path.join(version_path, ARRAYS_FILE), arrays, metadata)
+        payload_files = [ARRAYS_FILE]
+
+        if model.algorithm == "xgboost" and model.model is not None:
+            raw = model.model.get_booster().save_raw(raw_format="ubj")
+            with open(os.path.join(version_path, BOOSTER_FILE), "wb") as f:
+                f.write(raw)
+            payload_files.append(BOOSTER_FILE)
+
+        payloads = {}
+        for name in payload_files:
+            payload_path = os.path.join(version_path, name)
+            payloads[name] = {
+                "sha256": file_checksum(payload_path),
+                "bytes": os.path.getsize(payload_path),
+            }
+
+        mean = getattr(model.scaler, "mean_", None)
+        scale = getattr(model.scaler, "scale_", None)
+        manifest = {
+            "format_version": ARTIFACT_FORMAT_VERSION,
+            "algorithm": model.algorithm,
+            "features": metadata["features"],
+            "classes": metadata["classes"],
+            "scaler": {
+                "mean": None if mean is None else np.asarray(mean).tolist(),
+                "scale": None if scale is None else np.asarray(scale).tolist(),
+            },
+            "forest": metadata["forest"],
+            "metrics": metrics or {},
+            "created_at": datetime.now().isoformat(),
+            "libraries": library_versions(),
+            "payloads": payloads,
+            "checksum": payloads_checksum(payloads),
+        }
+        with open(os.path.join(version_path, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+        switch_artifact_version(path, version_path)
+    except Exception:
+        shutil.rmtree(version_path, ignore_errors=True)
+        raise
+    prune_artifact_versions(path)
+    return manifest
+
+
+def artifact_version_path(path):
+    """Return a new version directory name for the artifact at path"""
+    stamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    return f"{path}{ARTIFACT_VERSION_MARKER}{stamp}-{os.getpid()}"
+
+
+def artifact_versions(path):
+    """Return the version directories of the artifact at path, oldest first"""
+    directory, name = os.path.split(path)
+    prefix = f"{name}{ARTIFACT_VERSION_MARKER}"
+    return [
+        os.path.join(directory, entry)
+        for entry in sorted(os.listdir(directory))
+        if entry.startswith(prefix)
+    ]
+
+
+def switch_artifact_version(path, version_path):
+    """
+    Point path at version_path.
+
+    A symlink to the new version is renamed over path, which replaces the old
+    link in one step: a reader resolves path to either version, never to
+    nothing. The link is relative, so the models directory can be moved.
+    """
+    link_path = f"{path}.{os.getpid()}.link"
+    if os.path.lexists(link_path):
+        os.remove(link_path)
+    os.symlink(os.path.basename(version_path), link_path)
+    if os.path.isdir(path) and not os.path.islink(path):
+        # An artifact saved before versioning is a plain directory, which a
+        # link cannot be renamed over; it becomes the oldest version, leaving
+        # path missing for this one swap only
+        os.replace(path, f"{path}{ARTIFACT_VERSION_MARKER}{'0' * 20}-legacy")
+    os.replace(link_path, path)
+
+
+def prune_artifact_versions(path, keep=ARTIFACT_VERSIONS_KEPT):
+    """Remove all but the current version and the keep - 1 newest others"""
+    current = os.path.realpath(path)
+    older = [
+        version
+        for version in artifact_versions(path)
+        if os.path.realpath(version) != current
+    ]
+    for version in older[: max(0, len(older) - (keep - 1))]:
+        shutil.rmtree(version, ignore_errors=True)
+
+
+def read_manifest(path):
+    """Read and validate an artifact's manifest"""
+    with open(os.path.join(path, MANIFEST_FILE), "r") as f:
+        manifest = json.load(f)
+    version = manifest.get("format_version")
+    if not isinstance(version, int) or version > ARTIFACT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported model artifact version {version}: {path}")
+    return manifest
+
+
+def verify_artifact(path):
+    """
+    Check every payload of an artifact against the checksums in its manifest.
+
+    Raises:
+        ValueError: If a payload is missing or does not match
+    """
+    manifest = read_manifest(path)
+    for name, payload in manifest["payloads"].items():
+        payload_path = os.path.join(path, name)
+        if not os.path.isfile(payload_path):
+            raise ValueError(f"Missing artifact payload: {name}")
+        if file_checksum(payload_path) != payload["sha256"]:
+            raise ValueError(f"Checksum mismatch for artifact payload: {name}")
+    if payloads_checksum(manifest["payloads"]) != manifest["checksum"]:
+        raise ValueError("Artifact checksum does not match its payloads")
+    return manifest
+
+
+def artifact_checksum(path):
+    """Return the checksum recorded in an artifact's manifest"""
+    return read_manifest(path)["checksum"]
+
+
+def artifact_size(path):
+    """Return the total size in bytes of an artifact directory"""
+    return sum(
+        os.path.getsize(os.path.join(path, name))
+        for name in os.listdir(path)
+        if os.path.isfile(os.path.join(path, name))
+    )
+
+
+class ArtifactCropModel(BundledCropModel):
+    """
+    CropModel backed by an artifact directory, loaded lazily.
+
+    Opening an artifact only reads its manifest; the tree arrays are mapped
+    on the first prediction and the XGBoost booster is only read if the
+    native backend is selected. Random forests always use the compiled
+    evaluator, which matches the native forest.
+    """
+
+    def __init__(self, path, manifest, use_mmap=True):
+        scaler = manifest.get("scaler", {})
+        mean = scaler.get("mean")
+        scale = scaler.get("scale")
+        super().__init__(
+            algorithm=manifest["algorithm"],
+            features=manifest["features"],
+            class_names=manifest["classes"],
+            mean=None if mean is None else np.array(mean, dtype=np.float64),
+            scale=None if scale is None else np.array(scale, dtype=np.float64),
+            compiled=None,
+        )
+        self.artifact_path = path
+        self.manifest = manifest
+        self.metrics = manifest.get("metrics", {})
+        self.use_mmap = use_mmap
+        self.booster = None
+        self._load_lock = threading.Lock()
+
+    def get_compiled(self):
+        if self.compiled is None:
+            with self._load_lock:
+                if self.compiled is None:
+                    arrays, _ = read_array_bundle(
+                        os.path.join(self.artifact_path, ARRAYS_FILE),
+                        use_mmap=self.use_mmap,
+                    )
+                    self.compiled = compiled_from_arrays(
+                        arrays, self.manifest["forest"]
+                    )
+        return self.compiled
+
+    def get_booster(self):
+        """Return the native XGBoost booster, or None if the artifact has none"""
+        if BOOSTER_FILE not in self.manifest["payloads"]:
+            return None
+        if self.booster is None:
+            with self._load_lock:
+                if self.booster is None:
+                    from xgboost import Booster
+
+                    booster = Booster()
+                    booster.load_model(os.path.join(self.artifact_path, BOOSTER_FILE))
+                    self.booster = booster
+        return self.booster
+
+    def predict_proba(self, X):
+        X_scaled = self.scale(feature_matrix(X, self.features))
+        if self.inference_backend == "native" and self.get_booster() is not None:
+            return self.booster.inplace_predict(X_scaled)
+        return self.get_compiled().predict_proba(X_scaled)
+
+    def set_inference_backend(self, backend):
+        """Native inference is available for XGBoost artifacts only"""
+        super().set_inference_backend(backend)
+        self.inference_backend = backend
+
+
+def load_model_artifact(path, use_mmap=True, verify=False):
+    """
+    Open a model artifact directory.
+
+    The version path points at is opened, and the model keeps reading its
+    payloads from that version even after a newer one is saved.
+
+    Args:
+        path (str): Artifact directory written by save_model_artifact
+        use_mmap (bool): Memory-map the tree arrays instead of reading them
+        verify (bool): Check every payload checksum before returning
+
+    Returns:
+        ArtifactCropModel: Model that loads its payloads on first use
+    """
+    path = os.path.realpath(path)
+    manifest = verify_artifact(path) if verify else read_manifest(path)
+    return ArtifactCropModel(path, manifest, use_mmap=use_mmap)
+
+
+def artifact_path_for(model_path):
+    """Return the artifact directory that corresponds to a pickled model"""
+    return os.path.splitext(model_path)[0] + ARTIFACT_EXTENSION
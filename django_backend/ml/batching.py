@@ -0,0 +1,210 @@
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 250, 1000)
+
+
+class Histogram:
+    """Fixed-bucket histogram; the last bucket counts values above every bound"""
+
+    def __init__(self, bounds):
+        self.bounds = np.asarray(bounds, dtype=np.float64)
+        self._counts = np.zeros(len(bounds) + 1, dtype=np.int64)
+        self._total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        bucket = int(np.searchsorted(self.bounds, value, side="left"))
+        with self._lock:
+            self._counts[bucket] += 1
+            self._total += value
+
+    def snapshot(self):
+        with self._lock:
+            counts = self._counts.tolist()
+            total = self._total
+        labels = [f"le_{bound:g}" for bound in self.bounds.tolist()] + ["inf"]
+        count = sum(counts)
+        return {
+            "count": count,
+            "mean": total / count if count else 0.0,
+            "buckets": dict(zip(labels, counts)),
+        }
+
+
+class PendingPrediction:
+    """One caller's sample, waiting for its batch to be scored"""
+
+    __slots__ = ("model", "features", "top_k", "enqueued_at", "done", "result", "error")
+
+    def __init__(self, model, features, top_k):
+        self.model = model
+        self.features = features
+        self.top_k = top_k
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-sample predictions into vectorized model calls.
+
+    Callers block in predict() while a dispatcher thread collects samples until
+    max_batch_size is reached or max_wait_ms has passed since the first one
+    arrived, scores each model's samples with one predict_batch() call and
+    hands every caller its own row. Each caller waits at most max_wait_ms
+    longer than before, and every model call is shared by the whole batch.
+    """
+
+    def __init__(self, max_batch_size=64, max_wait_ms=2.0, enabled=False):
+        self.enabled = enabled
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._samples = 0
+        self._errors = 0
+        self.batch_sizes = Histogram((1, 2, 4, 8, 16, 32, 64, 128, 256))
+        self.batch_latency_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.queue_wait_ms = Histogram(LATENCY_BUCKETS_MS)
+
+    @classmethod
+    def from_settings(cls):
+        config = getattr(settings, "ML_MICRO_BATCHING", {})
+        return cls(
+            max_batch_size=config.get("max_batch_size", 64),
+            max_wait_ms=config.get("max_wait_ms", 2.0),
+            enabled=config.get("enabled", False),
+        )
+
+    def predict(self, model, features, top_k=5):
+        """
+        Return model.predict(features), scored together with concurrent calls.
+
+        Args:
+            model (CropModel): Model to predict with
+            features (np.ndarray): One sample in the model's feature order
+            top_k (int): Number of crop matches to return
+
+        Returns:
+            dict: Prediction results, or None if prediction fails
+        """
+        if not self.enabled:
+            return model.predict(features)
+
+        pending = PendingPrediction(model, features, top_k)
+        self._ensure_dispatcher()
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "enabled": self.enabled,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "batches": self._batches,
+                "samples": self._samples,
+                "errors": self._errors,
+                "mean_batch_size": (
+                    self._samples / self._batches if self._batches else 0.0
+                ),
+            }
+        stats["queue_depth"] = self._queue.qsize()
+        stats["batch_size"] = self.batch_sizes.snapshot()
+        stats["batch_latency_ms"] = self.batch_latency_ms.snapshot()
+        stats["queue_wait_ms"] = self.queue_wait_ms.snapshot()
+        return stats
+
+    def reset_after_fork(self):
+        """The dispatcher thread does not survive a fork; start a new one on demand"""
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_dispatcher(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="micro-batcher", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._dispatch(batch)
+            except Exception as e:
+                # Never let the dispatcher die with callers still waiting
+                print(f"Error in micro-batch dispatch: {str(e)}")
+                for pending in batch:
+                    if not pending.done.is_set():
+                        pending.error = e
+                        pending.done.set()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _dispatch(self, batch):
+        started_at = time.perf_counter()
+        for pending in batch:
+            self.queue_wait_ms.observe((started_at - pending.enqueued_at) * 1000)
+
+        # Samples can only share a call if they target the same model and top_k
+        groups = {}
+        for pending in batch:
+            groups.setdefault((id(pending.model), pending.top_k), []).append(pending)
+
+        for group in groups.values():
+            model = group[0].model
+            try:
+                X = np.stack([pending.features for pending in group])
+                results = model.predict_batch(X, top_k=group[0].top_k)
+            except Exception as e:
+                results = None
+                print(f"Error in micro-batch prediction: {str(e)}")
+            if results is None:
+                with self._lock:
+                    self._errors += 1
+                results = [None] * len(group)
+            for pending, result in zip(group, results):
+                pending.result = result
+                pending.done.set()
+
+        self.batch_latency_ms.observe((time.perf_counter() - started_at) * 1000)
+        self.batch_sizes.observe(len(batch))
+        with self._lock:
+            self._batches += 1
+            self._samples += len(batch)
+
+
+# Shared dispatcher for single-sample predictions
+micro_batcher = MicroBatcher.from_settings()
+
+os.register_at_fork(after_in_child=micro_batcher.reset_after_fork)
@@ -0,0 +1,164 @@
+import csv
+import io
+import json
+
+import numpy as np
+import pandas as pd
+
+from .features import FEATURE_ALIASES, FEATURES
+from .prediction import load_default_model, rank_feature_matrix
+
+# Supported output formats and their content types
+BULK_OUTPUT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+# CSV header names accepted for each feature
+COLUMN_NAMES = {
+    **{feature: feature for feature in FEATURES},
+    **{alias: feature for feature, alias in FEATURE_ALIASES.items()},
+}
+
+
+def read_csv_chunks(source, chunk_size=5000):
+    """
+    Start reading a CSV of soil samples in chunks of chunk_size rows.
+
+    Only the feature columns are parsed. The header and the first chunk are
+    read before returning, so a malformed file fails before a streaming
+    response has started.
+
+    Args:
+        source: Path or file-like object with the CSV
+        chunk_size (int): Rows per chunk
+
+    Returns:
+        iterator: DataFrames with exactly the FEATURES columns
+
+    Raises:
+        ValueError: If the CSV cannot be parsed or lacks a feature column
+    """
+    reader = pd.read_csv(
+        source,
+        chunksize=chunk_size,
+        skipinitialspace=True,
+        usecols=lambda column: column.strip() in COLUMN_NAMES,
+    )
+    try:
+        first = next(reader)
+    except StopIteration:
+        return iter(())
+
+    columns = {column: COLUMN_NAMES[column.strip()] for column in first.columns}
+    features = list(columns.values())
+    duplicated = sorted({f for f in features if features.count(f) > 1})
+    if duplicated:
+        raise ValueError(f"Duplicate columns for: {', '.join(duplicated)}")
+    missing = [feature for feature in FEATURES if feature not in features]
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}")
+
+    def chunks():
+        chunk = first
+        while True:
+            yield chunk.rename(columns=columns)
+            try:
+                chunk = next(reader)
+            except StopIteration:
+                return
+
+    return chunks()
+
+
+def score_chunk(chunk, model, top_k=5):
+    """
+    Rank crops for every row of a CSV chunk with one vectorized model call.
+
+    Returns:
+        list: Per row, a {"top_crop", "crop_matches"} dict, or None if the row
+            has a missing or non-numeric value
+    """
+    X = chunk[FEATURES].apply(pd.to_numeric, errors="coerce").to_numpy(np.float64)
+    valid = np.isfinite(X).all(axis=1)
+
+    results = [None] * len(X)
+    if valid.any():
+        ranked = rank_feature_matrix(
+            np.ascontiguousarray(X[valid]), model, top_k=top_k
+        )
+        for row, result in zip(np.flatnonzero(valid).tolist(), ranked):
+            results[row] = result
+    return results
+
+
+def stream_bulk_predictions(chunks, output="ndjson", top_k=5):
+    """
+    Score CSV chunks and yield the formatted results chunk by chunk.
+
+    The model is resolved once, so a model swap never splits a file between
+    two versions. Only one chunk of input and output is held in memory at a
+    time.
+
+    Args:
+        chunks: Iterator of DataFrames from read_csv_chunks
+        output (str): "ndjson" (one JSON object per line) or "csv"
+        top_k (int): Number of crop matches per row
+
+    Yields:
+        str: Formatted output for one chunk
+    """
+    model = load_default_model()
+    row = 0
+
+    if output == "csv":
+        header = ["row"]
+        for rank in range(1, top_k + 1):
+            header.extend([f"crop_{rank}", f"confidence_{rank}"])
+        header.append("error")
+        yield format_csv_rows([header])
+
+    try:
+        for chunk in chunks:
+            results = score_chunk(chunk, model, top_k=top_k)
+            if output == "csv":
+                yield format_csv_rows(csv_rows(results, row, top_k))
+            else:
+                yield "".join(ndjson_lines(results, row))
+            row += len(results)
+    except Exception as e:
+        # Headers are already sent, so report the failure in the body
+        print(f"Error in bulk prediction at row {row}: {str(e)}")
+        error = f"Scoring stopped at row {row}: {str(e)}"
+        if output == "csv":
+            yield format_csv_rows([[row] + [""] * (2 * top_k) + [error]])
+        else:
+            yield json.dumps({"row": row, "error": error}) + "\n"
+
+
+def ndjson_lines(results, start_row):
+    for row, result in enumerate(results, start_row):
+        if result is None:
+            line = {"row": row, "error": "Row values must be finite numbers"}
+        else:
+            line = {"row": row, **result}
+        yield json.dumps(line) + "\n"
+
+
+def csv_rows(results, start_row, top_k):
+    for row, result in enumerate(results, start_row):
+        if result is None:
+            yield [row] + [""] * (2 * top_k) + ["Row values must be finite numbers"]
+            continue
+        values = [row]
+        for crop_match in result["crop_matches"]:
+            values.extend([crop_match["crop"], crop_match["confidence"]])
+        values.extend([""] * (2 * top_k + 1 - len(values)))
+        values.append("")
+        yield values
+
+
+def format_csv_rows(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
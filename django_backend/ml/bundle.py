@@ -0,0 +1,251 @@
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+from django.conf import settings
+
+from .compiled import CompiledForest
+from .features import feature_matrix
+from .models import INFERENCE_BACKENDS, CropModel
+
+BUNDLE_MAGIC = b"CROPBNDL"
+BUNDLE_FORMAT_VERSION = 1
+BUNDLE_EXTENSION = ".bundle"
+# Array payloads start on cache-line (and SIMD) friendly boundaries
+BUNDLE_ALIGNMENT = 64
+
+_PREAMBLE = struct.Struct("<8sII")
+
+
+def _align(offset):
+    return -(-offset // BUNDLE_ALIGNMENT) * BUNDLE_ALIGNMENT
+
+
+def write_array_bundle(path, arrays, metadata=None):
+    """
+    Write numeric arrays and JSON metadata to a single memory-mappable file.
+
+    The layout is a fixed preamble (magic, format version, header length), a
+    JSON header with each array's dtype, shape and offset, then the raw array
+    bytes, each aligned to BUNDLE_ALIGNMENT. The file is written to a
+    temporary path and renamed, so readers never see a partial bundle.
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    for name, array in arrays.items():
+        if array.dtype.hasobject:
+            raise ValueError(f"Array {name} has an object dtype and cannot be mapped")
+
+    # Lay the arrays out relative to the data section, then place that section
+    # after the header (whose length depends on the offsets written into it)
+    layout = {}
+    relative = 0
+    for name, array in arrays.items():
+        relative = _align(relative)
+        layout[name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "offset": relative,
+        }
+        relative += array.nbytes
+
+    header = {"metadata": metadata or {}, "arrays": layout}
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = _align(_PREAMBLE.size + len(header_bytes))
+    for entry in layout.values():
+        entry["offset"] += data_start
+    header_bytes = json.dumps(header).encode("utf-8")
+    # Re-encoding can lengthen the header; move the data section if it did
+    while _PREAMBLE.size + len(header_bytes) > data_start:
+        shift = BUNDLE_ALIGNMENT
+        data_start += shift
+        for entry in layout.values():
+            entry["offset"] += shift
+        header_bytes = json.dumps(header).encode("utf-8")
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREAMBLE.pack(BUNDLE_MAGIC, BUNDLE_FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in arrays.items():
+            f.seek(layout[name]["offset"])
+            f.write(array.tobytes())
+    os.replace(tmp_path, path)
+
+
+def read_array_bundle(path, use_mmap=True):
+    """
+    Open an array bundle.
+
+    Args:
+        path (str): Bundle written by write_array_bundle
+        use_mmap (bool): Map the file read-only so every process that opens it
+            shares the same physical pages; otherwise read it into memory
+
+    Returns:
+        tuple: ({name: read-only np.ndarray}, metadata dict)
+    """
+    with open(path, "rb") as f:
+        if use_mmap:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            buffer = f.read()
+
+    magic, version, header_length = _PREAMBLE.unpack_from(buffer, 0)
+    if magic != BUNDLE_MAGIC:
+        raise ValueError(f"Not a model bundle: {path}")
+    if version > BUNDLE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported bundle format version {version}: {path}")
+
+    header = json.loads(
+        bytes(buffer[_PREAMBLE.size : _PREAMBLE.size + header_length])
+    )
+    arrays = {}
+    for name, entry in header["arrays"].items():
+        dtype = np.dtype(entry["dtype"])
+        shape = tuple(entry["shape"])
+        count = int(np.prod(shape, dtype=np.int64))
+        arrays[name] = np.frombuffer(
+            buffer, dtype=dtype, count=count, offset=entry["offset"]
+        ).reshape(shape)
+    return arrays, header["metadata"]
+
+
+class BundledCropModel(CropModel):
+    """
+    CropModel served from an array bundle instead of an unpickled estimator.
+
+    The compiled tree arrays and scaler parameters are read-only views of a
+    memory-mapped file, so every worker process that loads the same bundle
+    shares one copy of them through the page cache. Predictions are those of
+    the compiled backend.
+    """
+
+    def __init__(self, algorithm, features, class_names, mean, scale, compiled):
+        super().__init__(algorithm)
+        self.features = list(features)
+        self.class_names = np.asarray(class_names, dtype=object)
+        self.scaler.mean_ = mean
+        self.scaler.scale_ = scale
+        self.compiled = compiled
+        self.inference_backend = "compiled"
+
+    def predict_proba(self, X):
+        X_scaled = self.scale(feature_matrix(X, self.features))
+        return self.compiled.predict_proba(X_scaled)
+
+    def set_inference_backend(self, backend):
+        """Bundles only carry the compiled ensemble, which serves every backend"""
+        if backend not in INFERENCE_BACKENDS:
+            raise ValueError(f"Unsupported inference backend: {backend}")
+
+    def train(self, X, y):
+        raise NotImplementedError("Bundled models are read-only; train a CropModel")
+
+
+def bundle_arrays(model):
+    """
+    Return the arrays and metadata that describe a trained CropModel.
+
+    Returns:
+        tuple: (arrays dict, metadata dict) as stored by write_array_bundle
+    """
+    compiled = model.get_compiled()
+    arrays = {f"forest_{name}": array for name, array in compiled.arrays().items()}
+    mean = getattr(model.scaler, "mean_", None)
+    scale = getattr(model.scaler, "scale_", None)
+    if mean is not None:
+        arrays["scaler_mean"] = np.asarray(mean, dtype=np.float64)
+    if scale is not None:
+        arrays["scaler_scale"] = np.asarray(scale, dtype=np.float64)
+
+    metadata = {
+        "algorithm": model.algorithm,
+        "features": list(model.features),
+        "classes": [str(name) for name in model.get_class_names().tolist()],
+        "forest": {
+            "kind": compiled.kind,
+            "max_depth": compiled.max_depth,
+            "n_classes": compiled.n_classes,
+            "base_score": float(compiled.base_score),
+        },
+    }
+    return arrays, metadata
+
+
+def compiled_from_arrays(arrays, forest):
+    """Rebuild a CompiledForest from bundle arrays and its "forest" metadata"""
+    return CompiledForest(
+        kind=forest["kind"],
+        feature=arrays["forest_feature"],
+        threshold=arrays["forest_threshold"],
+        left=arrays["forest_left"],
+        right=arrays["forest_right"],
+        value=arrays["forest_value"],
+        roots=arrays["forest_roots"],
+        max_depth=forest["max_depth"],
+        n_classes=forest["n_classes"],
+        tree_class=arrays.get("forest_tree_class"),
+        # XGBoost margins are float32, as the native booster computes them
+        base_score=(
+            np.float32(forest["base_score"])
+            if forest["kind"] == "xgboost"
+            else forest["base_score"]
+        ),
+    )
+
+
+def model_from_bundle_arrays(arrays, metadata):
+    """Build a BundledCropModel from the output of read_array_bundle"""
+    return BundledCropModel(
+        algorithm=metadata["algorithm"],
+        features=metadata["features"],
+        class_names=metadata["classes"],
+        mean=arrays.get("scaler_mean"),
+        scale=arrays.get("scaler_scale"),
+        compiled=compiled_from_arrays(arrays, metadata["forest"]),
+    )
+
+
+def export_model_bundle(model, path):
+    """Write a trained CropModel as a memory-mappable bundle"""
+    arrays, metadata = bundle_arrays(model)
+    write_array_bundle(path, arrays, metadata)
+
+
+def load_model_bundle(path, use_mmap=True):
+    """Load a BundledCropModel from a bundle file"""
+    arrays, metadata = read_array_bundle(path, use_mmap=use_mmap)
+    return model_from_bundle_arrays(arrays, metadata)
+
+
+def bundle_path_for(model_path):
+    """Return the bundle path that accompanies a pickled model"""
+    return os.path.splitext(model_path)[0] + BUNDLE_EXTENSION
+
+
+def pickle_path_for(bundle_path):
+    """Return the pickled model a bundle was exported from"""
+    return os.path.splitext(bundle_path)[0] + ".pkl"
+
+
+def serving_path(model_path):
+    """
+    Return the file a model should be served from.
+
+    With ML_SERVE_MODEL_BUNDLES enabled, a bundle next to the pickle is
+    preferred as long as it is not older than the pickle it was exported from.
+    """
+    if not getattr(settings, "ML_SERVE_MODEL_BUNDLES", False):
+        return model_path
+    if model_path.endswith(BUNDLE_EXTENSION):
+        return model_path
+
+    bundle_path = bundle_path_for(model_path)
+    try:
+        if os.stat(bundle_path).st_mtime_ns >= os.stat(model_path).st_mtime_ns:
+            return bundle_path
+    except OSError:
+        pass
+    return model_path
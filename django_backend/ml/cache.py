@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from .features import FEATURES
+
+# Agronomic precision each input is rounded to before it becomes part of a key
+DEFAULT_PRECISION = {
+    "N": 1.0,
+    "P": 1.0,
+    "K": 1.0,
+    "pH": 0.05,
+    "temperature": 0.5,
+    "rainfall": 1.0,
+    "humidity": 1.0,
+}
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache of prediction responses with a per-entry TTL.
+
+    Keys are the serving model version plus the seven inputs, each quantized to
+    its configured precision, so soil tests that differ by less than that
+    precision share one response: the one computed from the raw inputs of the
+    first of them. Entries for an old model version are never
+    returned, and the whole cache is dropped when the active model is swapped.
+    """
+
+    def __init__(self, max_entries=10000, ttl=300, precision=None, enabled=True):
+        precision = {**DEFAULT_PRECISION, **(precision or {})}
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.steps = np.array([precision[f] for f in FEATURES], dtype=np.float64)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    @classmethod
+    def from_settings(cls):
+        config = getattr(settings, "ML_PREDICTION_CACHE", {})
+        return cls(
+            max_entries=config.get("max_entries", 10000),
+            ttl=config.get("ttl", 300),
+            precision=config.get("precision"),
+            enabled=config.get("enabled", True),
+        )
+
+    def quantize(self, features):
+        """Return the grid cell of a feature vector, as a tuple usable in a key"""
+        cells = np.round(features / self.steps).astype(np.int64)
+        return tuple(cells.tolist())
+
+    def get(self, key):
+        """Return the cached value for key, or None if absent or expired"""
+        now = time.monotonic()
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self._misses += 1
+                return None
+            expires_at, value = item
+            if expires_at <= now:
+                del self._entries[key]
+                self._expirations += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def set(self, key, value):
+        """Store value under key, evicting the least recently used entries"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def on_model_swapped(self, path, version):
+        """Registry listener: responses from the previous model are now stale"""
+        self.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+            }
+
+
+# Shared response cache for generate_prediction
+prediction_cache = PredictionCache.from_settings()
@@ -0,0 +1,321 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from .artifacts import is_model_artifact, model_checksum
+from .batching import LATENCY_BUCKETS_MS, Histogram
+from .catalog import write_json_atomic
+from .executor import summarize_latencies
+from .features import feature_matrix
+from .models import CropModel
+from .registry import RegistryEntry, file_signature, model_registry
+from .tiers import tier_is_current, tier_model_path
+
+# Name of the calibration inside a model artifact directory
+CASCADE_FILE = "cascade.json"
+CASCADE_EXTENSION = ".cascade.json"
+
+
+def align_probabilities(probabilities, source_names, target_names):
+    """Reorder (and zero-fill) probability columns from one class order to another"""
+    columns = {name: column for column, name in enumerate(target_names.tolist())}
+    aligned = np.zeros((len(probabilities), len(target_names)), dtype=np.float64)
+    for column, name in enumerate(source_names.tolist()):
+        if name in columns:
+            aligned[:, columns[name]] = probabilities[:, column]
+    return aligned
+
+
+class CascadeCropModel(CropModel):
+    """
+    Two-stage CropModel: a cheap first stage answers the samples it is sure of.
+
+    Every sample is scored by the first stage; those whose top-class
+    probability reaches threshold keep its answer and only the rest are
+    scored by the full model. A share of the first stage's answers
+    (audit_rate) is also scored by the full model to keep measuring how often
+    the two agree in production.
+    """
+
+    def __init__(self, first, full, threshold, calibration=None, audit_rate=0.0):
+        super().__init__(full.algorithm)
+        self.first = first
+        self.full = full
+        self.threshold = threshold
+        self.calibration = calibration or {}
+        self.audit_rate = audit_rate
+        self.features = list(full.features)
+        self.class_names = full.get_class_names()
+        self.first_class_names = first.get_class_names()
+        self.lookup_grid = getattr(full, "lookup_grid", None)
+        self._rng = np.random.default_rng()
+        self._lock = threading.Lock()
+        self._samples = 0
+        self._first_stage = 0
+        self._audited = 0
+        self._audit_agreed = 0
+        self.first_stage_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.full_stage_ms = Histogram(LATENCY_BUCKETS_MS)
+
+    def predict_proba(self, X):
+        X = feature_matrix(X, self.features)
+        start = time.perf_counter()
+        probabilities = align_probabilities(
+            self.first.predict_proba(X), self.first_class_names, self.class_names
+        )
+        confident = probabilities.max(axis=1) >= self.threshold
+        self.first_stage_ms.observe((time.perf_counter() - start) * 1000)
+
+        audit = confident & (self._rng.random(len(X)) < self.audit_rate)
+        full_rows = ~confident | audit
+        audited = agreed = 0
+        if full_rows.any():
+            start = time.perf_counter()
+            full_probabilities = self.full.predict_proba(X[full_rows])
+            self.full_stage_ms.observe((time.perf_counter() - start) * 1000)
+
+            audit_rows = audit[full_rows]
+            audited = int(audit_rows.sum())
+            if audited:
+                agreed = int(
+                    (
+                        full_probabilities[audit_rows].argmax(axis=1)
+                        == probabilities[audit].argmax(axis=1)
+                    ).sum()
+                )
+            # Audited samples keep the first stage's answer
+            probabilities[~confident] = full_probabilities[~audit_rows]
+
+        with self._lock:
+            self._samples += len(X)
+            self._first_stage += int(confident.sum())
+            self._audited += audited
+            self._audit_agreed += agreed
+        return probabilities
+
+    def get_compiled(self):
+        return self.full.get_compiled()
+
+    def set_inference_backend(self, backend):
+        self.first.set_inference_backend(backend)
+        self.full.set_inference_backend(backend)
+        self.inference_backend = backend
+
+    def train(self, X, y):
+        raise NotImplementedError("Train the cascade's stages, not the cascade")
+
+    def stats(self):
+        with self._lock:
+            samples = self._samples
+            first_stage = self._first_stage
+            audited = self._audited
+            audit_agreed = self._audit_agreed
+        return {
+            "threshold": self.threshold,
+            "samples": samples,
+            "first_stage": first_stage,
+            "full_stage": samples - first_stage,
+            "first_stage_rate": first_stage / samples if samples else 0.0,
+            "audited": audited,
+            "audit_agreement": audit_agreed / audited if audited else None,
+            "first_stage_ms": self.first_stage_ms.snapshot(),
+            "full_stage_ms": self.full_stage_ms.snapshot(),
+            "calibration": self.calibration,
+        }
+
+
+def calibrate_cascade(
+    first,
+    full,
+    X_test,
+    y_test,
+    target_agreement=0.99,
+    calibration_samples=20000,
+    latency_samples=200,
+    seed=42,
+):
+    """
+    Choose the lowest first-stage threshold that keeps agreement with the full model.
+
+    The stages are compared on the test split and on random samples spread
+    over its range. Among the thresholds at which the first stage's accepted
+    answers agree with the full model at least target_agreement of the time,
+    the lowest (the one that lets the first stage answer most) is chosen.
+
+    Returns:
+        dict: The threshold (None if no threshold reaches the target), the
+            first stage's answer rate and agreement at it, and the accuracy
+            and single-sample latency of the cascade and the full model on
+            the test split
+    """
+    X_test = feature_matrix(X_test, full.features)
+    rng = np.random.default_rng(seed)
+    low, high = X_test.min(axis=0), X_test.max(axis=0)
+    spread = low + rng.random((calibration_samples, X_test.shape[1])) * (high - low)
+    X = np.vstack([X_test, spread])
+
+    class_names = full.get_class_names()
+    first_probabilities = align_probabilities(
+        first.predict_proba(X), first.get_class_names(), class_names
+    )
+    confidence = first_probabilities.max(axis=1)
+    agree = first_probabilities.argmax(axis=1) == full.predict_proba(X).argmax(axis=1)
+
+    # Accepting everything at or above each confidence, most confident first;
+    # a threshold can only sit at the last sample of a run of equal confidences
+    order = np.argsort(-confidence, kind="stable")
+    confidence = confidence[order]
+    agreement = np.cumsum(agree[order]) / np.arange(1, len(order) + 1)
+    candidates = np.flatnonzero(
+        (agreement >= target_agreement)
+        & np.append(confidence[1:] != confidence[:-1], True)
+    )
+
+    calibration = {
+        "target_agreement": target_agreement,
+        "samples": len(X),
+        "threshold": None,
+        "first_stage_rate": 0.0,
+        "first_stage_agreement": None,
+    }
+    if not len(candidates):
+        return calibration
+    last = candidates[-1]
+    calibration.update(
+        threshold=float(confidence[last]),
+        first_stage_rate=float((last + 1) / len(X)),
+        first_stage_agreement=float(agreement[last]),
+    )
+
+    cascade = CascadeCropModel(first, full, calibration["threshold"])
+    labels = y_test.str.lower().to_numpy()
+    for name, model in (("cascade", cascade), ("full", full)):
+        predicted = class_names[model.predict_proba(X_test).argmax(axis=1)]
+        seconds = []
+        for row in X_test[:latency_samples]:
+            start = time.perf_counter()
+            model.predict(row)
+            seconds.append(time.perf_counter() - start)
+        calibration[name] = {
+            "accuracy": float(np.mean(predicted == labels)),
+            "latency_ms": summarize_latencies(np.array(seconds, dtype=np.float64)),
+        }
+    return calibration
+
+
+def cascade_path_for(model_path):
+    """Return where the cascade calibration of a model file or artifact is stored"""
+    if is_model_artifact(model_path):
+        return os.path.join(model_path, CASCADE_FILE)
+    return model_path + CASCADE_EXTENSION
+
+
+def save_cascade_calibration(calibration, model_path, first_stage):
+    """Store a calibration with the full model it was made for"""
+    write_json_atomic(
+        cascade_path_for(model_path),
+        {
+            **calibration,
+            "first_stage": first_stage,
+            "checksum": model_checksum(model_path),
+        },
+    )
+
+
+class CascadeCache:
+    """
+    Serving-side cascades, one per full model, rebuilt when either stage or
+    the calibration changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cascades = {}
+
+    @property
+    def enabled(self):
+        return bool(getattr(settings, "ML_CASCADE", {}).get("enabled", False))
+
+    def wrap(self, entry, model_path):
+        """
+        Return entry with its model replaced by a calibrated cascade.
+
+        Args:
+            entry (RegistryEntry): The full model's registry entry
+            model_path (str): Path the full model was loaded from
+
+        Returns:
+            RegistryEntry: Cascade entry, or entry itself if there is no
+                usable calibration or first stage
+        """
+        config = getattr(settings, "ML_CASCADE", {})
+        first_stage = config.get("first_stage", "fast")
+        if not tier_is_current(model_path, first_stage):
+            return entry
+        first_entry = model_registry.get_entry(
+            tier_model_path(model_path, first_stage), pin=True
+        )
+        calibration_path = cascade_path_for(model_path)
+        signature = file_signature(calibration_path)
+        if first_entry is None or signature is None:
+            return entry
+
+        key = (entry.version, first_entry.version, signature)
+        cached = self._cascades.get(model_path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        try:
+            with open(calibration_path, "r") as f:
+                calibration = json.load(f)
+            if calibration.get("checksum") != model_checksum(model_path):
+                print(f"Ignoring cascade {calibration_path}: made for another model")
+                calibration = None
+        except Exception as e:
+            print(f"Error loading cascade calibration: {str(e)}")
+            calibration = None
+
+        # ML_CASCADE["threshold"] overrides the calibrated one, for tuning
+        threshold = config.get("threshold")
+        if threshold is None and calibration is not None:
+            threshold = calibration.get("threshold")
+        if threshold is None:
+            cascade_entry = entry
+        else:
+            cascade = CascadeCropModel(
+                first_entry.model,
+                entry.model,
+                threshold,
+                calibration=calibration,
+                audit_rate=config.get("audit_rate", 0.01),
+            )
+            cascade_entry = RegistryEntry(
+                model=cascade,
+                signature=entry.signature,
+                version=f"{entry.version}+{first_entry.version}",
+                loaded_at=time.time(),
+                load_seconds=entry.load_seconds + first_entry.load_seconds,
+            )
+        with self._lock:
+            self._cascades[model_path] = (key, cascade_entry)
+        return cascade_entry
+
+    def stats(self):
+        with self._lock:
+            cascades = list(self._cascades.items())
+        return {
+            "enabled": self.enabled,
+            "models": {
+                os.path.basename(path): entry.model.stats()
+                for path, (_, entry) in cascades
+                if isinstance(entry.model, CascadeCropModel)
+            },
+        }
+
+
+# Cascades served by this process
+model_cascades = CascadeCache()
@@ -0,0 +1,245 @@
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from .artifacts import ARTIFACT_EXTENSION, is_model_artifact, model_checksum
+from .registry import file_signature
+from .tiers import is_tier_model_id
+from .utils import MODELS_PATH
+
+# Manifest describing every servable model and which one is active
+CATALOG_PATH = os.path.join(MODELS_PATH, "catalog.json")
+
+
+def write_json_atomic(path, data):
+    """Write JSON to a temporary file and rename it over path"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class ModelCatalog:
+    """
+    Persistent index of trained models with an "active" pointer.
+
+    The manifest is held in memory so resolving a model is a dict lookup. Writes
+    from this process update memory directly; changes made by other worker
+    processes are picked up by a single stat of the manifest file, never by
+    scanning the models directory.
+
+    Web workers and training processes all update the manifest, so every
+    read-modify-write of it holds an flock on a sidecar lock file and starts
+    from the manifest on disk.
+    """
+
+    def __init__(self, manifest_path=CATALOG_PATH):
+        self.manifest_path = manifest_path
+        self.lock_path = f"{manifest_path}.lock"
+        self._lock = threading.Lock()
+        self._signature = None
+        self._models = {}
+        self._active = None
+        self._loaded = False
+
+    def resolve(self, model_id=None):
+        """
+        Return the catalog entry for model_id, or the active model if none is given.
+
+        Args:
+            model_id (str): Optional model id to look up
+
+        Returns:
+            dict: Entry with id, path, checksum, algorithm and created_at, or None
+        """
+        self._refresh_if_changed()
+        if model_id is None:
+            model_id = self._active
+        if model_id is None:
+            return None
+        return self._models.get(model_id)
+
+    def entries(self):
+        """Return all catalog entries, newest first"""
+        self._refresh_if_changed()
+        return sorted(
+            self._models.values(), key=lambda entry: entry["created_at"], reverse=True
+        )
+
+    @property
+    def active_id(self):
+        self._refresh_if_changed()
+        return self._active
+
+    def register(
+        self,
+        model_id,
+        path,
+        algorithm,
+        created_at=None,
+        document_id=None,
+        activate=True,
+    ):
+        """
+        Add a finished model file to the catalog and optionally make it active.
+
+        This is the change notification for the catalog: callers register a
+        model once it has been fully written, so requests never see a partial file.
+        """
+        entry = {
+            "id": model_id,
+            "path": os.path.abspath(path),
+            "checksum": model_checksum(path),
+            "algorithm": algorithm,
+            "created_at": created_at or datetime.now().isoformat(),
+            "document_id": document_id,
+        }
+        with self._locked():
+            self._load_locked(force=True)
+            self._models[model_id] = entry
+            if activate or self._active is None:
+                self._active = model_id
+            self._save_locked()
+        return entry
+
+    def activate(self, model_id):
+        """Point the catalog at an already registered model"""
+        with self._locked():
+            self._load_locked(force=True)
+            if model_id not in self._models:
+                raise KeyError(f"Model not found in catalog: {model_id}")
+            self._active = model_id
+            self._save_locked()
+
+    def remove(self, model_id):
+        """Drop a model from the catalog, falling back to the newest remaining one"""
+        with self._locked():
+            self._load_locked(force=True)
+            self._models.pop(model_id, None)
+            if self._active == model_id:
+                self._active = self._newest_id()
+            self._save_locked()
+
+    def sync_from_documents(self):
+        """
+        Rebuild the catalog from the TrainedModel documents in MongoDB.
+
+        Documents whose file no longer exists are skipped. The active pointer is
+        kept if its model is still present, otherwise the newest model becomes active.
+        """
+        from core.models import TrainedModel
+
+        models = {}
+        for document in TrainedModel.objects.order_by("created_at"):
+            if not document.file_path or not os.path.exists(document.file_path):
+                continue
+            model_id = os.path.splitext(os.path.basename(document.file_path))[0]
+            models[model_id] = {
+                "id": model_id,
+                "path": os.path.abspath(document.file_path),
+                "checksum": model_checksum(document.file_path),
+                "algorithm": document.algorithm,
+                "created_at": document.created_at.isoformat(),
+                "document_id": str(document.id),
+            }
+
+        with self._locked():
+            self._load_locked(force=True)
+            self._models = models
+            if self._active not in self._models:
+                self._active = self._newest_id()
+            self._save_locked()
+
+    @contextmanager
+    def _locked(self):
+        """Hold the catalog against this process's threads and other processes"""
+        with self._lock:
+            os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+            with open(self.lock_path, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh_if_changed(self):
+        if self._loaded and file_signature(self.manifest_path) == self._signature:
+            return
+        with self._locked():
+            self._load_locked()
+
+    def _load_locked(self, force=False):
+        signature = file_signature(self.manifest_path)
+        if self._loaded and signature == self._signature and not force:
+            return
+
+        if signature is None:
+            # First run: index whatever models already exist, once
+            self._models = self._discover_existing_models()
+            self._active = self._newest_id()
+            self._loaded = True
+            if self._models:
+                self._save_locked()
+            return
+
+        try:
+            with open(self.manifest_path, "r") as f:
+                manifest = json.load(f)
+            self._models = manifest.get("models", {})
+            self._active = manifest.get("active")
+            self._signature = signature
+            self._loaded = True
+        except Exception as e:
+            # Keep the last good manifest if the file cannot be parsed
+            print(f"Error loading model catalog: {str(e)}")
+
+    def _save_locked(self):
+        write_json_atomic(
+            self.manifest_path, {"active": self._active, "models": self._models}
+        )
+        self._signature = file_signature(self.manifest_path)
+
+    def _newest_id(self):
+        if not self._models:
+            return None
+        return max(self._models.values(), key=lambda entry: entry["created_at"])["id"]
+
+    def _discover_existing_models(self):
+        models_dir = os.path.dirname(self.manifest_path)
+        if not os.path.isdir(models_dir):
+            return {}
+
+        models = {}
+        for filename in sorted(os.listdir(models_dir)):
+            path = os.path.join(models_dir, filename)
+            if filename.endswith(ARTIFACT_EXTENSION):
+                if not is_model_artifact(path):
+                    continue
+            elif not filename.endswith(".pkl"):
+                continue
+            model_id = os.path.splitext(filename)[0]
+            if is_tier_model_id(model_id):
+                # Faster variants are served alongside their model, not on their own
+                continue
+            if model_id in models and filename.endswith(".pkl"):
+                # An artifact converted from this pickle takes precedence
+                continue
+            models[model_id] = {
+                "id": model_id,
+                "path": os.path.abspath(path),
+                "checksum": model_checksum(path),
+                "algorithm": model_id.split("_")[0],
+                "created_at": datetime.fromtimestamp(
+                    os.path.getctime(path)
+                ).isoformat(),
+                "document_id": None,
+            }
+        return models
+
+
+# Shared catalog used by the prediction and training views
+model_catalog = ModelCatalog()
@@ -0,0 +1,232 @@
+import json
+
+import numpy as np
+
+
+class CompiledForest:
+    """
+    Tree ensemble flattened into per-node numpy arrays.
+
+    All trees share one set of node arrays; roots holds the index of each tree's
+    first node. Leaves point to themselves, so every sample in every tree can be
+    advanced one level at a time for max_depth steps without tracking which
+    traversals have finished.
+
+    kind is "random_forest" (value holds per-leaf class probabilities that are
+    averaged over trees) or "xgboost" (value holds per-leaf margins that are
+    summed into the column given by tree_class and passed through a softmax).
+    """
+
+    def __init__(
+        self,
+        kind,
+        feature,
+        threshold,
+        left,
+        right,
+        value,
+        roots,
+        max_depth,
+        n_classes,
+        tree_class=None,
+        base_score=0.0,
+    ):
+        self.kind = kind
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.n_classes = int(n_classes)
+        self.tree_class = tree_class
+        self.base_score = base_score
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    def arrays(self):
+        """Return the numeric arrays that make up the ensemble, keyed by name"""
+        arrays = {
+            "feature": self.feature,
+            "threshold": self.threshold,
+            "left": self.left,
+            "right": self.right,
+            "value": self.value,
+            "roots": self.roots,
+        }
+        if self.tree_class is not None:
+            arrays["tree_class"] = self.tree_class
+        return arrays
+
+    def apply(self, X):
+        """
+        Return the leaf reached by every sample in every tree.
+
+        Args:
+            X (np.ndarray): Scaled features of shape (n_samples, n_features)
+
+        Returns:
+            np.ndarray: Node indices of shape (n_trees, n_samples)
+        """
+        # Both libraries compare float32 inputs against the stored thresholds
+        X_t = np.ascontiguousarray(np.asarray(X, dtype=np.float32).T)
+        n_samples = X_t.shape[1]
+        samples = np.arange(n_samples)[None, :]
+
+        nodes = np.repeat(self.roots[:, None], n_samples, axis=1)
+        for _ in range(self.max_depth):
+            values = X_t[self.feature[nodes], samples]
+            if self.kind == "xgboost":
+                go_left = values < self.threshold[nodes]
+            else:
+                go_left = values <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def predict_proba(self, X):
+        """Return class probabilities for scaled features, like the native estimator"""
+        leaves = self.apply(X)
+        n_samples = leaves.shape[1]
+
+        if self.kind == "xgboost":
+            margins = np.full(
+                (n_samples, self.n_classes), self.base_score, dtype=np.float32
+            )
+            for tree, tree_leaves in enumerate(leaves):
+                margins[:, self.tree_class[tree]] += self.value[tree_leaves]
+            margins -= margins.max(axis=1, keepdims=True)
+            np.exp(margins, out=margins)
+            margins /= margins.sum(axis=1, keepdims=True)
+            return margins
+
+        # Accumulate tree by tree in estimator order, as the forest does
+        proba = np.zeros((n_samples, self.n_classes), dtype=np.float64)
+        for tree_leaves in leaves:
+            proba += self.value[tree_leaves]
+        proba /= self.n_trees
+        return proba
+
+
+def _max_depth(left, right, root=0):
+    depth = 0
+    stack = [(root, 0)]
+    while stack:
+        node, node_depth = stack.pop()
+        if left[node] == node:
+            depth = max(depth, node_depth)
+            continue
+        stack.append((left[node], node_depth + 1))
+        stack.append((right[node], node_depth + 1))
+    return depth
+
+
+def compile_random_forest(forest):
+    """Flatten a fitted sklearn RandomForestClassifier into a CompiledForest"""
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        n_nodes = tree.node_count
+        node_ids = np.arange(n_nodes)
+        is_leaf = tree.children_left == -1
+
+        left = np.where(is_leaf, node_ids, tree.children_left) + offset
+        right = np.where(is_leaf, node_ids, tree.children_right) + offset
+
+        # Normalize leaf values to probabilities exactly as
+        # DecisionTreeClassifier.predict_proba does
+        value = np.array(tree.value[:, 0, :], dtype=np.float64)
+        normalizer = value.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        value /= normalizer
+
+        roots.append(offset)
+        features.append(np.where(is_leaf, 0, tree.feature))
+        thresholds.append(tree.threshold)
+        lefts.append(left)
+        rights.append(right)
+        values.append(value)
+        max_depth = max(max_depth, tree.max_depth)
+        offset += n_nodes
+
+    return CompiledForest(
+        kind="random_forest",
+        feature=np.concatenate(features).astype(np.int32),
+        threshold=np.concatenate(thresholds).astype(np.float64),
+        left=np.concatenate(lefts).astype(np.int32),
+        right=np.concatenate(rights).astype(np.int32),
+        value=np.concatenate(values),
+        roots=np.array(roots, dtype=np.int32),
+        max_depth=max_depth,
+        n_classes=forest.n_classes_,
+    )
+
+
+def compile_xgboost(classifier):
+    """Flatten a fitted multi:softprob XGBClassifier into a CompiledForest"""
+    booster = classifier.get_booster()
+    model_json = json.loads(booster.save_raw(raw_format="json"))
+    learner = model_json["learner"]
+    gradient_booster = learner["gradient_booster"]
+    if gradient_booster.get("name") != "gbtree":
+        raise ValueError(
+            f"Unsupported XGBoost booster: {gradient_booster.get('name')}"
+        )
+
+    model = gradient_booster["model"]
+    n_classes = int(learner["learner_model_param"]["num_class"])
+    base_score = np.float32(learner["learner_model_param"]["base_score"])
+
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for tree in model["trees"]:
+        left = np.array(tree["left_children"], dtype=np.int64)
+        right = np.array(tree["right_children"], dtype=np.int64)
+        node_ids = np.arange(len(left))
+        is_leaf = left == -1
+
+        left = np.where(is_leaf, node_ids, left)
+        right = np.where(is_leaf, node_ids, right)
+        # Leaf nodes store their (learning-rate scaled) weight in split_conditions
+        conditions = np.array(tree["split_conditions"], dtype=np.float32)
+
+        roots.append(offset)
+        features.append(np.where(is_leaf, 0, tree["split_indices"]))
+        thresholds.append(conditions)
+        lefts.append(left + offset)
+        rights.append(right + offset)
+        values.append(np.where(is_leaf, conditions, np.float32(0)))
+        max_depth = max(max_depth, _max_depth(left, right))
+        offset += len(node_ids)
+
+    return CompiledForest(
+        kind="xgboost",
+        feature=np.concatenate(features).astype(np.int32),
+        threshold=np.concatenate(thresholds).astype(np.float32),
+        left=np.concatenate(lefts).astype(np.int32),
+        right=np.concatenate(rights).astype(np.int32),
+        value=np.concatenate(values).astype(np.float32),
+        roots=np.array(roots, dtype=np.int32),
+        max_depth=max_depth,
+        n_classes=n_classes,
+        tree_class=np.array(model["tree_info"], dtype=np.int32),
+        base_score=base_score,
+    )
+
+
+def compile_estimator(estimator, algorithm):
+    """Compile a CropModel's fitted estimator for the given algorithm"""
+    if algorithm == "random_forest":
+        return compile_random_forest(estimator)
+    if algorithm == "xgboost":
+        return compile_xgboost(estimator)
+    raise ValueError(f"Unsupported algorithm: {algorithm}")
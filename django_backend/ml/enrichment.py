@@ -0,0 +1,259 @@
+import threading
+from collections import namedtuple
+
+from .icons import ICONS, get_condition_icon_id
+from .knowledge_base import crop_knowledge_base
+from .utils import (
+    build_recommendation_texts,
+    calculate_match_for_conditions,
+    get_crop_conditions,
+    select_recommendations,
+)
+
+def get_icon_for_condition(condition_name):
+    """Return an icon reference for different growing conditions"""
+    # This will be used by the frontend to display the appropriate icon
+    return ICONS[get_condition_icon_id(condition_name)]
+
+
+# Default timelines for different crops
+CROP_TIMELINES = {
+    "wheat": [
+        {
+            "stage": "Planting",
+            "duration": "1 week",
+            "description": "Prepare soil and plant seeds at appropriate depth",
+        },
+        {
+            "stage": "Germination",
+            "duration": "1-2 weeks",
+            "description": "Seeds germinate and first shoots appear",
+        },
+        {
+            "stage": "Tillering",
+            "duration": "3-5 weeks",
+            "description": "Multiple stems develop from the main shoot",
+        },
+        {
+            "stage": "Stem Extension",
+            "duration": "6-8 weeks",
+            "description": "Stems grow taller and nodes develop",
+        },
+        {
+            "stage": "Heading",
+            "duration": "9-10 weeks",
+            "description": "Wheat heads emerge from the stem",
+        },
+        {
+            "stage": "Flowering",
+            "duration": "11 weeks",
+            "description": "Pollination occurs",
+        },
+        {
+            "stage": "Ripening",
+            "duration": "12-15 weeks",
+            "description": "Grain matures and dries",
+        },
+    ],
+    "barley": [
+        {
+            "stage": "Planting",
+            "duration": "1 week",
+            "description": "Prepare soil and plant seeds 2-3 cm deep",
+        },
+        {
+            "stage": "Germination",
+            "duration": "1-2 weeks",
+            "description": "Seeds germinate and first shoots appear",
+        },
+        {
+            "stage": "Tillering",
+            "duration": "3-4 weeks",
+            "description": "Multiple stems develop from the main shoot",
+        },
+        {
+            "stage": "Stem Extension",
+            "duration": "5-7 weeks",
+            "description": "Stems grow taller and nodes develop",
+        },
+        {
+            "stage": "Heading",
+            "duration": "8-9 weeks",
+            "description": "Barley heads emerge from the stem",
+        },
+        {
+            "stage": "Flowering",
+            "duration": "10 weeks",
+            "description": "Pollination occurs",
+        },
+        {
+            "stage": "Ripening",
+            "duration": "11-13 weeks",
+            "description": "Grain matures and dries",
+        },
+    ],
+    "maize": [
+        {
+            "stage": "Planting",
+            "duration": "1 week",
+            "description": "Plant seeds 4-5 cm deep in warm soil",
+        },
+        {
+            "stage": "Emergence",
+            "duration": "1-2 weeks",
+            "description": "Seedlings emerge from the soil",
+        },
+        {
+            "stage": "Vegetative Growth",
+            "duration": "3-9 weeks",
+            "description": "Rapid growth and leaf development",
+        },
+        {
+            "stage": "Tasseling",
+            "duration": "10 weeks",
+            "description": "Tassels form at the top of the plant",
+        },
+        {
+            "stage": "Silking",
+            "duration": "11-12 weeks",
+            "description": "Silks emerge from ear shoots",
+        },
+        {
+            "stage": "Kernel Development",
+            "duration": "13-16 weeks",
+            "description": "Kernels fill with starch",
+        },
+        {
+            "stage": "Maturity",
+            "duration": "17-20 weeks",
+            "description": "Kernels reach physiological maturity",
+        },
+    ],
+}
+
+
+def generate_timeline(crop_name):
+    """Generate cultivation timeline for the crop"""
+    # Return the timeline for the requested crop, or a default timeline
+    return CROP_TIMELINES.get(crop_name.lower(), CROP_TIMELINES["wheat"])
+
+
+class CropEnrichment(
+    namedtuple(
+        "CropEnrichment",
+        [
+            "crop_name",
+            "crop_info",
+            "growing_conditions",
+            "timeline",
+            "conditions",
+            "parameter_texts",
+            "general_texts",
+        ],
+    )
+):
+    """
+    Precomputed, input-independent response fragments for one crop.
+
+    The fragments are shared between responses and must be treated as
+    read-only; only the match percentages and the choice of recommendation
+    depend on the soil sample.
+    """
+
+    __slots__ = ()
+
+    def match_analysis(self, soil_params):
+        """Calculate overall and per-parameter match for a soil sample"""
+        return calculate_match_for_conditions(soil_params, self.conditions)
+
+    def recommendations(self, soil_params):
+        """Select the recommendations that apply to a soil sample"""
+        return select_recommendations(
+            self.conditions, self.parameter_texts, self.general_texts, soil_params
+        )
+
+
+def build_crop_enrichment(crop_name):
+    """Compile the static response fragments for a crop"""
+    crop_info = (
+        crop_knowledge_base.get(crop_name) or crop_knowledge_base.get("wheat") or {}
+    )
+    growing_conditions = [
+        {
+            "name": key,
+            "value": value,
+            "icon": get_icon_for_condition(key),
+            "icon_id": get_condition_icon_id(key),
+        }
+        for key, value in crop_info.get("growingConditions", {}).items()
+    ]
+    conditions = get_crop_conditions(crop_name)
+    parameter_texts, general_texts = build_recommendation_texts(crop_name, conditions)
+    return CropEnrichment(
+        crop_name=crop_name,
+        crop_info=crop_info,
+        growing_conditions=growing_conditions,
+        timeline=generate_timeline(crop_name),
+        conditions=conditions,
+        parameter_texts=parameter_texts,
+        general_texts=general_texts,
+    )
+
+
+class CropEnrichmentStore:
+    """
+    Per-crop CropEnrichment objects, rebuilt when crop_data.json changes.
+
+    prepare_for_model() compiles every crop a newly loaded model can predict up
+    front; crops seen for the first time otherwise (e.g. from the rule-based
+    fallback) are compiled once on first use.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._enrichments = {}
+        self._crop_data_version = None
+        self._prepared_model = None
+
+    def get(self, crop_name):
+        """Return the enrichment for crop_name, compiling it if needed"""
+        self._rebuild_if_stale()
+        enrichment = self._enrichments.get(crop_name)
+        if enrichment is None:
+            enrichment = build_crop_enrichment(crop_name)
+            self._enrichments[crop_name] = enrichment
+        return enrichment
+
+    def prepare(self, crop_names):
+        """Compile the enrichment for every crop in crop_names"""
+        self._rebuild_if_stale()
+        enrichments = dict(self._enrichments)
+        for crop_name in crop_names:
+            if crop_name not in enrichments:
+                enrichments[crop_name] = build_crop_enrichment(crop_name)
+        self._enrichments = enrichments
+
+    def prepare_for_model(self, model):
+        """Compile the enrichment for every class of model, once per model"""
+        if model is self._prepared_model:
+            return
+        with self._lock:
+            if model is self._prepared_model:
+                return
+            self.prepare(model.get_class_names().tolist())
+            self._prepared_model = model
+
+    def _rebuild_if_stale(self):
+        version = crop_knowledge_base.version
+        if version == self._crop_data_version:
+            return
+        # Recompile every known crop against the new crop data in one swap
+        self._enrichments = {
+            crop_name: build_crop_enrichment(crop_name)
+            for crop_name in list(self._enrichments)
+        }
+        self._crop_data_version = version
+
+
+# Shared enrichment store for the prediction pipeline
+crop_enrichment = CropEnrichmentStore()
@@ -0,0 +1,132 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+
+
+class InferenceQueueFull(RuntimeError):
+    """Raised when the inference executor cannot accept more work"""
+
+
+class InferenceExecutor:
+    """
+    Bounded worker pool for CPU-bound inference called from async views.
+
+    At most max_workers tasks run at once and at most max_queue more wait for
+    a worker; further submissions are rejected with InferenceQueueFull instead
+    of growing an unbounded backlog behind a slow model. Threads are used
+    rather than processes because the models live in this process and
+    numpy, sklearn and XGBoost release the GIL while they compute.
+    """
+
+    def __init__(self, max_workers=4, max_queue=64, sample_size=1000):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="inference"
+        )
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._wait_times = deque(maxlen=sample_size)
+        self._run_times = deque(maxlen=sample_size)
+
+    @classmethod
+    def from_settings(cls):
+        config = getattr(settings, "ML_INFERENCE_EXECUTOR", {})
+        return cls(
+            max_workers=config.get("max_workers", 4),
+            max_queue=config.get("max_queue", 64),
+        )
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Run func(*args, **kwargs) on a worker thread and await its result.
+
+        Raises:
+            InferenceQueueFull: If every worker is busy and the queue is full
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise InferenceQueueFull("Inference queue is full, try again later")
+
+        submitted_at = time.perf_counter()
+        with self._lock:
+            self._queued += 1
+
+        def task():
+            started_at = time.perf_counter()
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._wait_times.append(started_at - submitted_at)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._run_times.append(time.perf_counter() - started_at)
+
+        try:
+            future = self._pool.submit(task)
+        except Exception:
+            with self._lock:
+                self._queued -= 1
+            self._slots.release()
+            raise
+        # The slot is held until the task finishes, even if the caller goes away
+        future.add_done_callback(lambda _: self._slots.release())
+
+        try:
+            result = await asyncio.wrap_future(future)
+        except Exception:
+            with self._lock:
+                self._failed += 1
+            raise
+        with self._lock:
+            self._completed += 1
+        return result
+
+    def stats(self):
+        with self._lock:
+            wait_times = np.array(self._wait_times, dtype=np.float64)
+            run_times = np.array(self._run_times, dtype=np.float64)
+            stats = {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queue_depth": self._queued,
+                "running": self._running,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+            }
+        stats["wait_ms"] = summarize_latencies(wait_times)
+        stats["run_ms"] = summarize_latencies(run_times)
+        return stats
+
+
+def summarize_latencies(seconds):
+    """Return mean, p50, p99 and max in milliseconds for an array of durations"""
+    if not len(seconds):
+        return {"count": 0}
+    ms = seconds * 1000
+    return {
+        "count": len(ms),
+        "mean": float(ms.mean()),
+        "p50": float(np.percentile(ms, 50)),
+        "p99": float(np.percentile(ms, 99)),
+        "max": float(ms.max()),
+    }
+
+
+# Shared pool for inference requested by async views
+inference_executor = InferenceExecutor.from_settings()
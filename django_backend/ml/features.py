@@ -0,0 +1,120 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+# Canonical feature order used by CropModel, the scaler and the trained estimators
+FEATURES = ["N", "P", "K", "pH", "temperature", "rainfall", "humidity"]
+
+# Request parameter names accepted in place of the canonical feature names
+FEATURE_ALIASES = {
+    "N": "nitrogen",
+    "P": "phosphorus",
+    "K": "potassium",
+    "pH": "ph",
+}
+
+
+def feature_vector(data, features=FEATURES, default=None, out=None):
+    """
+    Coerce one sample to a contiguous float64 array in canonical feature order.
+
+    Args:
+        data: Mapping keyed by feature name (or its alias, e.g. "nitrogen"), or a
+            float array already in canonical order
+        features (list): Feature order to produce
+        default (float): Value used for missing features; if None they are an error
+        out (np.ndarray): Optional preallocated array of shape (len(features),)
+
+    Returns:
+        np.ndarray: Array of shape (len(features),)
+
+    Raises:
+        ValueError: If a feature is missing, non-numeric or not finite
+    """
+    if isinstance(data, np.ndarray):
+        if data.shape != (len(features),):
+            raise ValueError(
+                f"Expected {len(features)} feature values, got shape {data.shape}"
+            )
+        vector = np.ascontiguousarray(data, dtype=np.float64)
+        if not np.isfinite(vector).all():
+            raise ValueError("Feature values must be finite numbers")
+        if out is not None:
+            out[:] = vector
+            return out
+        return vector
+
+    if out is None:
+        out = np.empty(len(features), dtype=np.float64)
+
+    missing = []
+    for i, feature in enumerate(features):
+        value = data.get(feature)
+        if value is None:
+            value = data.get(FEATURE_ALIASES.get(feature))
+        if value is None:
+            if default is None:
+                missing.append(feature)
+                continue
+            value = default
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Parameter {feature} must be numeric, got {value!r}")
+        if not math.isfinite(value):
+            raise ValueError(f"Parameter {feature} must be a finite number")
+        out[i] = value
+
+    if missing:
+        raise ValueError(f"Missing required parameters: {', '.join(missing)}")
+    return out
+
+
+def feature_matrix(data, features=FEATURES):
+    """
+    Coerce a batch of samples to a contiguous (n_samples, n_features) float64 array.
+
+    Accepts a list of mappings, a 2-D float array in canonical order, or a
+    DataFrame with the feature columns (kept for backwards compatibility).
+    A single mapping or 1-D array is treated as a batch of one.
+
+    Raises:
+        ValueError: If any sample fails validation; the row index is included
+    """
+    if isinstance(data, pd.DataFrame):
+        missing = [feature for feature in features if feature not in data.columns]
+        if missing:
+            raise ValueError(f"Missing required columns: {', '.join(missing)}")
+        try:
+            X = data[features].to_numpy(dtype=np.float64)
+        except (TypeError, ValueError):
+            raise ValueError("Feature columns must be numeric")
+        if not np.isfinite(X).all():
+            raise ValueError("Feature values must be finite numbers")
+        return np.ascontiguousarray(X)
+
+    if isinstance(data, np.ndarray):
+        if data.ndim == 1:
+            return feature_vector(data, features)[None, :]
+        if data.ndim != 2 or data.shape[1] != len(features):
+            raise ValueError(
+                f"Expected an array of shape (n, {len(features)}), got {data.shape}"
+            )
+        X = np.ascontiguousarray(data, dtype=np.float64)
+        if not np.isfinite(X).all():
+            raise ValueError("Feature values must be finite numbers")
+        return X
+
+    if hasattr(data, "get"):
+        return feature_vector(data, features)[None, :]
+
+    X = np.empty((len(data), len(features)), dtype=np.float64)
+    for row, sample in enumerate(data):
+        if not hasattr(sample, "get"):
+            raise ValueError(f"Sample {row} must be an object")
+        try:
+            feature_vector(sample, features, out=X[row])
+        except ValueError as e:
+            raise ValueError(f"Sample {row}: {str(e)}")
+    return X
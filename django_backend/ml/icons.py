@@ -0,0 +1,63 @@
+import hashlib
+
+# Inline SVG icons served by id; ids are stable and referenced from responses
+ICONS = {
+    "temperature": '<svg class="h-6 w-6 text-primary" viewBox="0 0 24 24" fill="none" stroke="currentColor"><path strokeLinecap="round" strokeLinejoin="round" strokeWidth="2" d="M5 8h14M5 8a2 2 0 110-4h14a2 2 0 110 4M5 8v10a2 2 0 002 2h10a2 2 0 002-2V8m-9 4h4" /></svg>',
+    "rainfall": '<svg class="h-6 w-6 text-primary" viewBox="0 0 24 24" fill="none" stroke="currentColor"><path strokeLinecap="round" strokeLinejoin="round" strokeWidth="2" d="M3 15a4 4 0 004 4h9a5 5 0 10-.1-9.999 5.002 5.002 0 10-9.78 2.096A4.001 4.001 0 003 15z" /></svg>',
+    "growth-period": '<svg class="h-6 w-6 text-primary" viewBox="0 0 24 24" fill="none" stroke="currentColor"><path strokeLinecap="round" strokeLinejoin="round" strokeWidth="2" d="M8 7V3m8 4V3m-9 8h10M5 21h14a2 2 0 002-2V7a2 2 0 00-2-2H5a2 2 0 00-2 2v12a2 2 0 002 2z" /></svg>',
+    "optimal-ph": '<svg class="h-6 w-6 text-primary" viewBox="0 0 24 24" fill="none" stroke="currentColor"><path strokeLinecap="round" strokeLinejoin="round" strokeWidth="2" d="M19.428 15.428a2 2 0 00-1.022-.547l-2.387-.477a6 6 0 00-3.86.517l-.318.158a6 6 0 01-3.86.517L6.05 15.21a2 2 0 00-1.806.547M8 4h8l-1 1v5.172a2 2 0 00.586 1.414l5 5c1.26 1.26.367 3.414-1.415 3.414H4.828c-1.782 0-2.674-2.154-1.414-3.414l5-5A2 2 0 009 10.172V5L8 4z" /></svg>',
+    "info": '<svg class="h-6 w-6 text-primary" viewBox="0 0 24 24" fill="none" stroke="currentColor"><path strokeLinecap="round" strokeLinejoin="round" strokeWidth="2" d="M13 16h-1v-4h-1m1-4h.01M21 12a9 9 0 11-18 0 9 9 0 0118 0z" /></svg>',
+    "weather-sunny": '<svg class="h-8 w-8 text-yellow-500" viewBox="0 0 24 24" fill="currentColor" stroke="none"><path d="M12 3v1m0 16v1m9-9h-1M4 12H3m15.364 6.364l-.707-.707M6.343 6.343l-.707-.707m12.728 0l-.707.707M6.343 17.657l-.707.707M16 12a4 4 0 11-8 0 4 4 0 018 0z" /></svg>',
+    "weather-partly-cloudy": '<svg class="h-8 w-8 text-blue-300" viewBox="0 0 24 24" fill="currentColor" stroke="none"><path d="M4 11.9c0-1.7 1.3-3 3-3 .7 0 1.3.2 1.8.6.5-1.9 2.2-3.4 4.2-3.4 2.4 0 4.4 2 4.4 4.4 0 .3 0 .7-.1 1 .1 0 .3-.1.4-.1 1.7 0 3 1.3 3 3s-1.3 3-3 3H7c-1.7 0-3-1.3-3-3z" /></svg>',
+    "weather-cloudy": '<svg class="h-8 w-8 text-blue-300" viewBox="0 0 24 24" fill="currentColor" stroke="none"><path d="M4 11.9c0-1.7 1.3-3 3-3 .7 0 1.3.2 1.8.6.5-1.9 2.2-3.4 4.2-3.4 2.4 0 4.4 2 4.4 4.4 0 .3 0 .7-.1 1 .1 0 .3-.1.4-.1 1.7 0 3 1.3 3 3s-1.3 3-3 3H7c-1.7 0-3-1.3-3-3z" /></svg>',
+    "weather-light-rain": '<svg class="h-8 w-8 text-blue-500" viewBox="0 0 24 24" fill="currentColor" stroke="none"><path d="M13 9.5a.5.5 0 11-1 0 .5.5 0 011 0zm-5 1a.5.5 0 11-1 0 .5.5 0 011 0zM12 16a.5.5 0 11-1 0 .5.5 0 011 0zm5-3.5a.5.5 0 11-1 0 .5.5 0 011 0zM4 11.9c0-1.7 1.3-3 3-3 .7 0 1.3.2 1.8.6.5-1.9 2.2-3.4 4.2-3.4 2.4 0 4.4 2 4.4 4.4 0 .3 0 .7-.1 1 .1 0 .3-.1.4-.1 1.7 0 3 1.3 3 3s-1.3 3-3 3H7c-1.7 0-3-1.3-3-3z" /></svg>',
+    "weather-rain": '<svg class="h-8 w-8 text-blue-500" viewBox="0 0 24 24" fill="currentColor" stroke="none"><path d="M13 9.5a.5.5 0 11-1 0 .5.5 0 011 0zm-5 1a.5.5 0 11-1 0 .5.5 0 011 0zM12 16a.5.5 0 11-1 0 .5.5 0 011 0zm5-3.5a.5.5 0 11-1 0 .5.5 0 011 0zM4 11.9c0-1.7 1.3-3 3-3 .7 0 1.3.2 1.8.6.5-1.9 2.2-3.4 4.2-3.4 2.4 0 4.4 2 4.4 4.4 0 .3 0 .7-.1 1 .1 0 .3-.1.4-.1 1.7 0 3 1.3 3 3s-1.3 3-3 3H7c-1.7 0-3-1.3-3-3z" /></svg>',
+}
+
+# Icon ids for the growing conditions listed in crop_data.json
+CONDITION_ICON_IDS = {
+    "Temperature": "temperature",
+    "Rainfall": "rainfall",
+    "Growth Period": "growth-period",
+    "Optimal pH": "optimal-ph",
+}
+DEFAULT_CONDITION_ICON_ID = "info"
+
+# Icon ids for the weather forecast conditions
+WEATHER_ICON_IDS = {
+    "Sunny": "weather-sunny",
+    "Partly Cloudy": "weather-partly-cloudy",
+    "Cloudy": "weather-cloudy",
+    "Light Rain": "weather-light-rain",
+    "Rain": "weather-rain",
+}
+DEFAULT_WEATHER_ICON_ID = "weather-partly-cloudy"
+
+# Changes whenever any icon changes, so icon URLs can be cached indefinitely
+ICONS_VERSION = hashlib.sha256(
+    "".join(f"{icon_id}:{svg}" for icon_id, svg in sorted(ICONS.items())).encode()
+).hexdigest()[:12]
+
+
+def get_condition_icon_id(condition_name):
+    """Return the icon id for a growing condition"""
+    return CONDITION_ICON_IDS.get(condition_name, DEFAULT_CONDITION_ICON_ID)
+
+
+def get_weather_icon_id(condition):
+    """Return the icon id for a weather condition"""
+    return WEATHER_ICON_IDS.get(condition, DEFAULT_WEATHER_ICON_ID)
+
+
+def icon_url(icon_id):
+    """Return the versioned URL an icon is served from"""
+    return f"/api/icons/{icon_id}.svg?v={ICONS_VERSION}"
+
+
+def render_svg_document(icon_id):
+    """Return an icon as a standalone SVG document, or None if it is unknown"""
+    svg = ICONS.get(icon_id)
+    if svg is None:
+        return None
+    # Inline markup relies on the page's namespace; a served file needs its own
+    return svg.replace("<svg ", '<svg xmlns="http://www.w3.org/2000/svg" ', 1)
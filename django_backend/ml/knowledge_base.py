@@ -0,0 +1,166 @@
+import json
+import os
+import re
+import threading
+
+from .registry import file_signature
+from .utils import RECOMMENDATIONS_PATH
+
+CROP_DATA_PATH = os.path.join(RECOMMENDATIONS_PATH, "crop_data.json")
+
+# Served when crop_data.json is missing; written only by create_default_crop_data
+DEFAULT_CROP_DATA = {
+    "Wheat": {
+        "image": "https://images.unsplash.com/photo-1543257580-7269da773bf5?w=900&auto=format&fit=crop&q=60&ixlib=rb-4.0.3&ixid=M3wxMjA3fDB8MHxzZWFyY2h8M3x8d2hlYXR8ZW58MHx8MHx8fDA%3D",
+        "growingConditions": {
+            "Temperature": "15-25°C",
+            "Rainfall": "450-650mm",
+            "Growth Period": "120-150 days",
+            "Optimal pH": "6.0-7.5",
+        },
+        "soilRequirements": {
+            "nitrogen": "60-100 kg/ha",
+            "phosphorus": "30-60 kg/ha",
+            "potassium": "60-100 kg/ha",
+            "ph": "6.0-7.5",
+        },
+        "description": "Wheat is a cereal grain that's a worldwide staple food. It's versatile and adaptable to various soil conditions with high nitrogen requirements.",
+    },
+    "Barley": {
+        "image": "https://images.unsplash.com/photo-1523741543316-beb7fc7023d8?w=800&auto=format&fit=crop&q=60&ixlib=rb-4.0.3&ixid=M3wxMjA3fDB8MHxzZWFyY2h8Mnx8YmFybGV5fGVufDB8fDB8fHww",
+        "growingConditions": {
+            "Temperature": "15-24°C",
+            "Rainfall": "350-550mm",
+            "Growth Period": "90-120 days",
+            "Optimal pH": "6.0-7.0",
+        },
+        "soilRequirements": {
+            "nitrogen": "50-90 kg/ha",
+            "phosphorus": "20-50 kg/ha",
+            "potassium": "50-90 kg/ha",
+            "ph": "6.0-7.0",
+        },
+        "description": "Barley is a hardy cereal grain with a high tolerance for drought and adaptability to various soil conditions.",
+    },
+    "Oats": {
+        "image": "https://images.unsplash.com/photo-1595435934819-5aadc815c045?w=800&auto=format&fit=crop&q=60&ixlib=rb-4.0.3&ixid=M3wxMjA3fDB8MHxzZWFyY2h8OHx8b2F0c3xlbnwwfHwwfHx8MA%3D%3D",
+        "growingConditions": {
+            "Temperature": "16-22°C",
+            "Rainfall": "400-600mm",
+            "Growth Period": "90-120 days",
+            "Optimal pH": "5.5-7.0",
+        },
+        "soilRequirements": {
+            "nitrogen": "40-80 kg/ha",
+            "phosphorus": "20-40 kg/ha",
+            "potassium": "40-80 kg/ha",
+            "ph": "5.5-7.0",
+        },
+        "description": "Oats are a nutrient-rich cereal grain that can improve soil health and prevent erosion when used in crop rotation.",
+    },
+    "Maize": {
+        "image": "https://images.unsplash.com/photo-1551754655-cd27e38d2076?w=800&auto=format&fit=crop&q=60&ixlib=rb-4.0.3&ixid=M3wxMjA3fDB8MHxzZWFyY2h8Mnx8Y29ybnxlbnwwfHwwfHx8MA%3D%3D",
+        "growingConditions": {
+            "Temperature": "20-30°C",
+            "Rainfall": "500-800mm",
+            "Growth Period": "100-140 days",
+            "Optimal pH": "5.8-6.8",
+        },
+        "soilRequirements": {
+            "nitrogen": "80-120 kg/ha",
+            "phosphorus": "30-50 kg/ha",
+            "potassium": "60-100 kg/ha",
+            "ph": "5.8-6.8",
+        },
+        "description": "Maize (corn) is a heat-loving crop with high yield potential, requiring substantial nitrogen and consistent moisture.",
+    },
+    "Cotton": {
+        "image": "https://images.unsplash.com/photo-1605000797499-95a51c5269ae?w=800&auto=format&fit=crop&q=60&ixlib=rb-4.0.3&ixid=M3wxMjA3fDB8MHxzZWFyY2h8Mnx8Y290dG9ufGVufDB8fDB8fHww",
+        "growingConditions": {
+            "Temperature": "20-30°C",
+            "Rainfall": "600-1200mm",
+            "Growth Period": "150-180 days",
+            "Optimal pH": "6.0-7.5",
+        },
+        "soilRequirements": {
+            "nitrogen": "60-100 kg/ha",
+            "phosphorus": "30-50 kg/ha",
+            "potassium": "60-90 kg/ha",
+            "ph": "6.0-7.5",
+        },
+        "description": "Cotton thrives in warm climates with long growing seasons and well-drained soils. It requires moderate to high levels of nutrients.",
+    },
+}
+
+
+def normalize_crop_name(name):
+    """Normalize a crop name for lookups, e.g. "Green Banana" -> "greenbanana" """
+    return re.sub(r"[^a-z0-9]", "", str(name).lower())
+
+
+class CropKnowledgeBase:
+    """
+    In-memory view of crop_data.json indexed by normalized crop name.
+
+    The file is parsed once and re-read only when its mtime (or size) changes,
+    so a prediction costs one stat instead of an open and a JSON parse. Nothing
+    is ever written here: a missing file is served from DEFAULT_CROP_DATA and an
+    unreadable one keeps the last good copy.
+    """
+
+    def __init__(self, path=CROP_DATA_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._signature = None
+        self._loaded = False
+        self._data = {}
+        self._index = {}
+
+    @property
+    def data(self):
+        """Return the raw crop data dict as loaded from the file"""
+        self._refresh_if_changed()
+        return self._data
+
+    @property
+    def version(self):
+        """Return the file signature the current data was loaded from"""
+        self._refresh_if_changed()
+        return self._signature
+
+    def get(self, crop_name, default=None):
+        """Return the crop information for crop_name, ignoring case and spacing"""
+        self._refresh_if_changed()
+        return self._index.get(normalize_crop_name(crop_name), default)
+
+    def _refresh_if_changed(self):
+        signature = file_signature(self.path)
+        if self._loaded and signature == self._signature:
+            return
+
+        with self._lock:
+            if self._loaded and signature == self._signature:
+                return
+
+            if signature is None:
+                data = DEFAULT_CROP_DATA
+            else:
+                try:
+                    with open(self.path, "r") as f:
+                        data = json.load(f)
+                except Exception as e:
+                    print(f"Error loading crop data: {str(e)}")
+                    if self._loaded:
+                        return
+                    data = DEFAULT_CROP_DATA
+
+            self._data = data
+            self._index = {
+                normalize_crop_name(name): info for name, info in data.items()
+            }
+            self._signature = signature
+            self._loaded = True
+
+
+# Shared crop knowledge base for the prediction pipeline
+crop_knowledge_base = CropKnowledgeBase()
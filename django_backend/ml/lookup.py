@@ -0,0 +1,575 @@
+import math
+import os
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from .artifacts import is_model_artifact, model_checksum
+from .bundle import read_array_bundle, write_array_bundle
+from .models import top_k_indices
+
+LOOKUP_FORMAT_VERSION = 2
+LOOKUP_EXTENSION = ".lookup"
+# Name of the grid inside a model artifact directory
+LOOKUP_FILE = "lookup.bundle"
+
+# Agronomic range of each input covered by the grid, in request units;
+# samples outside it are always answered by the model
+DEFAULT_FEATURE_BOUNDS = {
+    "N": (0.0, 140.0),
+    "P": (5.0, 145.0),
+    "K": (5.0, 205.0),
+    "pH": (3.5, 10.0),
+    "temperature": (8.0, 44.0),
+    "rainfall": (20.0, 300.0),
+    "humidity": (14.0, 100.0),
+}
+
+# Leaf value of a cell that must be answered by the model
+FALLBACK = -1
+
+# z for a one-sided 99% confidence bound on the measured disagreement rate
+CONFIDENCE_Z = 2.326
+
+
+def grid_cells(bins, dims):
+    """Return the multi-index of every cell of a bins**dims grid, in C order"""
+    return np.indices((bins,) * dims).reshape(dims, -1).T
+
+
+def disagreement_bound(errors, n):
+    """Upper Wilson score bound on a rate of which errors in n were observed"""
+    if n == 0:
+        return 1.0
+    z2 = CONFIDENCE_Z**2
+    p = errors / n
+    centre = p + z2 / (2 * n)
+    margin = CONFIDENCE_Z * math.sqrt(p * (1 - p) / n + z2 / (4 * n * n))
+    return min(1.0, (centre + margin) / (1 + z2 / n))
+
+
+class LookupGrid:
+    """
+    Precomputed top-k predictions of a CropModel over a bounded feature box.
+
+    The box is split into coarse_bins cells per feature, and every coarse
+    cell is the root of a binary tree of finer cells: a cell is refined by
+    halving it along one feature, cycling through the features level by
+    level, so each part of the box ends up on a grid as fine as the model's
+    answers there require. A cell in which the model's top crop is the same
+    at every probe point is a leaf holding the top-k crops and confidences at
+    its centre. Cells that still disagree when the depth or split budget runs
+    out lie on a decision boundary and are answered by the model. A lookup is
+    a few subtractions and a floor for the coarse cell, then one comparison
+    per level below it.
+
+    Confidences are those at the cell centre, so they approximate the model's;
+    the error measured against the model when the grid was built is in
+    self.error.
+    """
+
+    def __init__(
+        self,
+        features,
+        lower,
+        upper,
+        coarse_bins,
+        depth,
+        node_feature,
+        node_threshold,
+        node_left,
+        node_right,
+        node_leaf,
+        leaf_classes,
+        leaf_confidence,
+        class_names,
+        error=None,
+        checksum=None,
+    ):
+        self.features = list(features)
+        self.lower = np.asarray(lower, dtype=np.float64)
+        self.upper = np.asarray(upper, dtype=np.float64)
+        self.coarse_bins = coarse_bins
+        self.depth = depth
+        self.node_feature = node_feature
+        self.node_threshold = node_threshold
+        self.node_left = node_left
+        self.node_right = node_right
+        self.node_leaf = node_leaf
+        self.leaf_classes = leaf_classes
+        self.leaf_confidence = leaf_confidence
+        self.class_names = np.asarray(class_names, dtype=object)
+        self.error = error or {}
+        self.checksum = checksum
+        dims = len(self.features)
+        self._coarse_strides = coarse_bins ** np.arange(dims - 1, -1, -1)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._fallbacks = 0
+
+    @property
+    def top_k(self):
+        return self.leaf_classes.shape[1]
+
+    @property
+    def accepted(self):
+        return bool(self.error.get("accepted", False))
+
+    def locate(self, X):
+        """
+        Return the leaf row of every sample of X, or FALLBACK.
+
+        Args:
+            X (np.ndarray): Features of shape (n_samples, n_features), in the
+                grid's feature order
+
+        Returns:
+            np.ndarray: int64 leaf rows of shape (n_samples,)
+        """
+        position = (X - self.lower) / (self.upper - self.lower)
+        inside = ((position >= 0) & (position <= 1)).all(axis=1)
+        position = np.where(inside[:, None], position, 0.0) * self.coarse_bins
+        coarse = np.minimum(position.astype(np.int64), self.coarse_bins - 1)
+
+        # The first coarse_bins**dims nodes are the roots of the coarse cells;
+        # leaves point to themselves, so finished descents stay put
+        nodes = coarse @ self._coarse_strides
+        samples = np.arange(len(X))
+        for _ in range(self.depth):
+            left = self.node_left[nodes]
+            if (left == nodes).all():
+                break
+            go_left = X[samples, self.node_feature[nodes]] < self.node_threshold[nodes]
+            nodes = np.where(go_left, left, self.node_right[nodes])
+
+        refs = self.node_leaf[nodes].astype(np.int64)
+        refs[~inside] = FALLBACK
+        return refs
+
+    def predict_batch(self, X, top_k=5):
+        """
+        Answer every sample of X that falls in a leaf.
+
+        Returns:
+            list: One {"top_crop", "crop_matches"} dict per row, in the form of
+                CropModel.predict_batch, or None for rows the model must answer
+        """
+        leaves = self.locate(X)
+        hit = leaves >= 0
+        n_hits = int(hit.sum())
+        with self._lock:
+            self._hits += n_hits
+            self._fallbacks += len(leaves) - n_hits
+
+        results = [None] * len(leaves)
+        if not n_hits:
+            return results
+        k = min(top_k, self.top_k)
+        names = self.class_names[self.leaf_classes[leaves[hit], :k]].tolist()
+        confidences = self.leaf_confidence[leaves[hit], :k].tolist()
+        for row, crops, probs in zip(np.flatnonzero(hit), names, confidences):
+            crop_matches = [
+                {"crop": crop, "confidence": prob} for crop, prob in zip(crops, probs)
+            ]
+            results[row] = {
+                "top_crop": dict(crop_matches[0]),
+                "crop_matches": crop_matches,
+            }
+        return results
+
+    def stats(self):
+        with self._lock:
+            hits, fallbacks = self._hits, self._fallbacks
+        nodes = len(self.node_leaf)
+        return {
+            "coarse_bins": self.coarse_bins,
+            "depth": self.depth,
+            "nodes": nodes,
+            "refined_cells": int((self.node_left != np.arange(nodes)).sum()),
+            "leaves": len(self.leaf_classes),
+            "hits": hits,
+            "fallbacks": fallbacks,
+            "hit_rate": hits / (hits + fallbacks) if hits + fallbacks else 0.0,
+            "error": self.error,
+        }
+
+    def arrays(self):
+        return {
+            "node_feature": self.node_feature,
+            "node_threshold": self.node_threshold,
+            "node_left": self.node_left,
+            "node_right": self.node_right,
+            "node_leaf": self.node_leaf,
+            "leaf_classes": self.leaf_classes,
+            "leaf_confidence": self.leaf_confidence,
+        }
+
+    def metadata(self):
+        return {
+            "format_version": LOOKUP_FORMAT_VERSION,
+            "features": self.features,
+            "lower": self.lower.tolist(),
+            "upper": self.upper.tolist(),
+            "coarse_bins": self.coarse_bins,
+            "depth": self.depth,
+            "classes": [str(name) for name in self.class_names.tolist()],
+            "error": self.error,
+            "checksum": self.checksum,
+        }
+
+
+def probe_cells(model, origins, widths, probes, top_k, rng, chunk_size=50000):
+    """
+    Evaluate the model at the centre and at random points of each cell.
+
+    Args:
+        model (CropModel): Model to evaluate
+        origins (np.ndarray): Lower corner of each cell, shape (n_cells, n_features)
+        widths (np.ndarray): Width of each cell along each feature, of the same
+            shape (or one row shared by every cell)
+        probes (int): Random points per cell besides its centre
+        top_k (int): Number of crops to keep for each cell centre
+        rng (np.random.Generator): Source of the probe points
+        chunk_size (int): Maximum number of points per model call
+
+    Returns:
+        tuple: (share of each cell's probes whose top crop differs from the
+            centre's, centre top-k class indices, centre confidences)
+    """
+    n_cells, dims = origins.shape
+    widths = np.broadcast_to(widths, origins.shape)
+    points_per_cell = probes + 1
+    cells_per_call = max(1, chunk_size // points_per_cell)
+
+    disagreement = np.empty(n_cells, dtype=np.float64)
+    classes = None
+    confidence = None
+    for start in range(0, n_cells, cells_per_call):
+        stop = min(start + cells_per_call, n_cells)
+        offsets = np.empty((stop - start, points_per_cell, dims))
+        offsets[:, 0] = 0.5
+        offsets[:, 1:] = rng.random((stop - start, probes, dims))
+        points = origins[start:stop, None, :] + offsets * widths[start:stop, None, :]
+
+        probabilities = model.predict_proba(points.reshape(-1, dims))
+        probabilities = probabilities.reshape(stop - start, points_per_cell, -1)
+        top1 = probabilities.argmax(axis=2)
+        disagreement[start:stop] = (top1[:, 1:] != top1[:, :1]).mean(axis=1)
+
+        centre = probabilities[:, 0]
+        top = top_k_indices(centre, top_k)
+        if classes is None:
+            classes = np.empty((n_cells, top.shape[1]), dtype=np.int16)
+            confidence = np.empty((n_cells, top.shape[1]), dtype=np.float32)
+        classes[start:stop] = top
+        confidence[start:stop] = np.take_along_axis(centre, top, axis=1)
+    return disagreement, classes, confidence
+
+
+def build_lookup_grid(
+    model,
+    bounds=None,
+    coarse_bins=4,
+    max_depth=14,
+    probes=8,
+    top_k=5,
+    max_splits=65536,
+    split_batch=1024,
+    validation_samples=20000,
+    validation_X=None,
+    max_error_rate=0.01,
+    seed=42,
+):
+    """
+    Evaluate a trained model over an adaptive grid and measure its error.
+
+    Cells whose probes disagree are split in rounds of split_batch. Each
+    round splits the cells where the model's answer changes most (the share
+    of probes that disagree with the centre), weighted by how many of the
+    validation_X samples fall in them when those are given, so the budget
+    goes to decision boundaries where the traffic is.
+
+    Args:
+        model (CropModel): Trained model to tabulate
+        bounds (dict): (low, high) per feature; defaults to DEFAULT_FEATURE_BOUNDS
+        coarse_bins (int): Cells per feature at the coarse level
+        max_depth (int): Most halvings of a coarse cell; each level halves one
+            feature, so max_depth=14 refines every feature up to four times
+            finer than the coarse grid
+        probes (int): Random probe points per cell besides its centre
+        top_k (int): Crops stored per leaf
+        max_splits (int): Most cells that may be split; mixed cells left over
+            fall back to the model
+        split_batch (int): Cells split (and their halves probed) per round
+        validation_samples (int): Uniform random samples the error is measured on
+        validation_X (np.ndarray): Optional real samples, used to direct the
+            refinement and to measure the error on too
+        max_error_rate (float): Largest acceptable upper bound on the top-crop
+            disagreement rate; a grid above it is built but never served
+        seed (int): Seed for probe and validation points
+
+    Returns:
+        LookupGrid: The grid, with its measured error in grid.error
+    """
+    bounds = {**DEFAULT_FEATURE_BOUNDS, **(bounds or {})}
+    features = list(model.features)
+    dims = len(features)
+    lower = np.array([bounds[feature][0] for feature in features], dtype=np.float64)
+    upper = np.array([bounds[feature][1] for feature in features], dtype=np.float64)
+    rng = np.random.default_rng(seed)
+
+    # Node arrays sized for the whole budget: the coarse cells plus two
+    # halves per split. Unsplit nodes point to themselves.
+    n_nodes = coarse_bins**dims
+    capacity = n_nodes + 2 * max_splits
+    node_feature = np.zeros(capacity, dtype=np.int8)
+    node_threshold = np.zeros(capacity, dtype=np.float64)
+    node_left = np.arange(capacity, dtype=np.int32)
+    node_right = np.arange(capacity, dtype=np.int32)
+    node_leaf = np.full(capacity, FALLBACK, dtype=np.int32)
+    node_depth = np.zeros(capacity, dtype=np.int16)
+    node_origin = np.empty((capacity, dims), dtype=np.float64)
+    node_width = np.empty((capacity, dims), dtype=np.float64)
+    disagreement = np.zeros(capacity, dtype=np.float64)
+
+    coarse_width = (upper - lower) / coarse_bins
+    node_origin[:n_nodes] = lower + grid_cells(coarse_bins, dims) * coarse_width
+    node_width[:n_nodes] = coarse_width
+
+    # Node of every real sample inside the box, followed down as cells split
+    traffic_X = None
+    if validation_X is not None and len(validation_X):
+        traffic_X = np.ascontiguousarray(validation_X, dtype=np.float64)
+        position = (traffic_X - lower) / (upper - lower)
+        traffic_X = traffic_X[((position >= 0) & (position <= 1)).all(axis=1)]
+        position = (traffic_X - lower) / (upper - lower) * coarse_bins
+        coarse = np.minimum(position.astype(np.int64), coarse_bins - 1)
+        traffic_nodes = coarse @ (coarse_bins ** np.arange(dims - 1, -1, -1))
+
+    leaf_classes, leaf_confidence = [], []
+    n_leaves = 0
+    splits = 0
+    frontier = np.empty(0, dtype=np.int64)
+    new_nodes = np.arange(n_nodes)
+    while True:
+        # Settled new cells become leaves, mixed ones may be split later
+        disagreement[new_nodes], classes, confidence = probe_cells(
+            model, node_origin[new_nodes], node_width[new_nodes], probes, top_k, rng
+        )
+        settled = disagreement[new_nodes] == 0
+        node_leaf[new_nodes[settled]] = n_leaves + np.arange(settled.sum())
+        leaf_classes.append(classes[settled])
+        leaf_confidence.append(confidence[settled])
+        n_leaves += int(settled.sum())
+        mixed = new_nodes[~settled]
+        frontier = np.concatenate([frontier, mixed[node_depth[mixed] < max_depth]])
+
+        budget = min(split_batch, max_splits - splits)
+        if budget <= 0 or not len(frontier):
+            break
+        priority = disagreement[frontier]
+        if traffic_X is not None:
+            traffic = np.bincount(traffic_nodes, minlength=capacity)
+            priority = priority * (traffic[frontier] + 1)
+        chosen = np.argsort(-priority, kind="stable")[:budget]
+        parents = frontier[chosen]
+        frontier = np.delete(frontier, chosen)
+
+        # Halve each parent along the next feature in turn
+        split_feature = node_depth[parents] % dims
+        half = node_width[parents, split_feature] / 2
+        left = n_nodes + 2 * np.arange(len(parents))
+        right = left + 1
+        for children in (left, right):
+            node_origin[children] = node_origin[parents]
+            node_width[children] = node_width[parents]
+            node_width[children, split_feature] = half
+            node_depth[children] = node_depth[parents] + 1
+        node_origin[right, split_feature] += half
+        node_feature[parents] = split_feature
+        node_threshold[parents] = node_origin[parents, split_feature] + half
+        node_left[parents] = left
+        node_right[parents] = right
+        if traffic_X is not None:
+            split = node_left[traffic_nodes] != traffic_nodes
+            moved = traffic_nodes[split]
+            go_left = (
+                traffic_X[np.flatnonzero(split), node_feature[moved]]
+                < node_threshold[moved]
+            )
+            traffic_nodes[split] = np.where(
+                go_left, node_left[moved], node_right[moved]
+            )
+
+        new_nodes = np.arange(n_nodes, n_nodes + 2 * len(parents))
+        n_nodes += 2 * len(parents)
+        splits += len(parents)
+
+    grid = LookupGrid(
+        features=features,
+        lower=lower,
+        upper=upper,
+        coarse_bins=coarse_bins,
+        depth=int(node_depth[:n_nodes].max()),
+        node_feature=node_feature[:n_nodes],
+        node_threshold=node_threshold[:n_nodes],
+        node_left=node_left[:n_nodes],
+        node_right=node_right[:n_nodes],
+        node_leaf=node_leaf[:n_nodes],
+        leaf_classes=np.concatenate(leaf_classes),
+        leaf_confidence=np.concatenate(leaf_confidence),
+        class_names=model.get_class_names(),
+    )
+
+    uniform_X = lower + rng.random((validation_samples, dims)) * (upper - lower)
+    error = {"uniform": measure_grid_error(grid, model, uniform_X)}
+    if validation_X is not None and len(validation_X):
+        error["data"] = measure_grid_error(grid, model, validation_X)
+    worst = max(measured["top1_error_bound"] for measured in error.values())
+    error["max_error_rate"] = max_error_rate
+    error["accepted"] = worst <= max_error_rate
+    grid.error = error
+    return grid
+
+
+def measure_grid_error(grid, model, X):
+    """
+    Compare the grid's answers with the model's on the samples of X.
+
+    Returns:
+        dict: Coverage (share of samples answered by the grid), top-crop
+            disagreement rate on covered samples with its 99% upper bound,
+            top-k agreement and the top crop's confidence error
+    """
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    leaves = grid.locate(X)
+    covered = leaves >= 0
+    n = int(covered.sum())
+    measured = {"samples": len(X), "coverage": n / len(X) if len(X) else 0.0}
+    if not n:
+        measured.update(top1_error=0.0, top1_error_bound=1.0)
+        return measured
+
+    probabilities = model.predict_proba(X[covered])
+    k = grid.top_k
+    model_top = top_k_indices(probabilities, k)
+    grid_top = grid.leaf_classes[leaves[covered]].astype(np.int64)
+    disagree = int((model_top[:, 0] != grid_top[:, 0]).sum())
+    confidence_error = np.abs(
+        grid.leaf_confidence[leaves[covered], 0]
+        - np.take_along_axis(probabilities, grid_top[:, :1], axis=1)[:, 0]
+    )
+    measured.update(
+        top1_error=disagree / n,
+        top1_error_bound=disagreement_bound(disagree, n),
+        topk_agreement=float((np.sort(model_top) == np.sort(grid_top)).all(1).mean()),
+        confidence_error_mean=float(confidence_error.mean()),
+        confidence_error_max=float(confidence_error.max()),
+    )
+    return measured
+
+
+def lookup_path_for(model_path):
+    """Return where the lookup grid of a model file or artifact is stored"""
+    if is_model_artifact(model_path):
+        return os.path.join(model_path, LOOKUP_FILE)
+    # Keep the model's extension, so a pickle and its bundle each have a grid
+    return model_path + LOOKUP_EXTENSION
+
+
+def save_lookup_grid(grid, model_path):
+    """
+    Store a grid with the model it was built from.
+
+    The grid records the model's checksum, so it is never served with a
+    different model. Serving processes reload the model, and pick the grid
+    up, because the grid file is part of the model's registry signature.
+    """
+    grid.checksum = model_checksum(model_path)
+    path = lookup_path_for(model_path)
+    write_array_bundle(path, grid.arrays(), grid.metadata())
+    return path
+
+
+def load_lookup_grid(model_path, use_mmap=True):
+    """
+    Load the grid stored with a model, if there is a current one.
+
+    Returns:
+        LookupGrid: The grid, or None if it is missing, stale or of an
+            unsupported version
+    """
+    path = lookup_path_for(model_path)
+    if not os.path.isfile(path):
+        return None
+    arrays, metadata = read_array_bundle(path, use_mmap=use_mmap)
+    if metadata.get("format_version") != LOOKUP_FORMAT_VERSION:
+        return None
+    if metadata.get("checksum") != model_checksum(model_path):
+        print(f"Ignoring lookup grid {path}: it was built for another model")
+        return None
+    return LookupGrid(
+        features=metadata["features"],
+        lower=metadata["lower"],
+        upper=metadata["upper"],
+        coarse_bins=metadata["coarse_bins"],
+        depth=metadata["depth"],
+        class_names=metadata["classes"],
+        error=metadata["error"],
+        checksum=metadata["checksum"],
+        **arrays,
+    )
+
+
+def lookup_grid_settings():
+    """Keyword arguments for build_lookup_grid from ML_LOOKUP_GRID"""
+    config = dict(getattr(settings, "ML_LOOKUP_GRID", {}))
+    config.pop("enabled", None)
+    return config
+
+
+def attach_lookup_grid(model, model_path):
+    """Serve model through its stored grid if ML_LOOKUP_GRID is enabled and it passed"""
+    model.lookup_grid = None
+    if not getattr(settings, "ML_LOOKUP_GRID", {}).get("enabled", False):
+        return
+    try:
+        grid = load_lookup_grid(model_path)
+    except Exception as e:
+        print(f"Error loading lookup grid for {model_path}: {str(e)}")
+        return
+    if grid is None:
+        return
+    if not grid.accepted or grid.features != list(model.features):
+        print(f"Not serving lookup grid for {model_path}: error bound not met")
+        return
+    model.lookup_grid = grid
+
+
+def predict_with_lookup(model, X, top_k=5, score=None):
+    """
+    Rank crops for every row of X, from the model's lookup grid where possible.
+
+    Rows outside the grid, on a decision boundary or asking for more crops
+    than the grid stores are scored in one call of score(X, top_k), which
+    defaults to model.predict_batch.
+
+    Returns:
+        list: One {"top_crop", "crop_matches"} dict per row, or None on failure
+    """
+    score = score or model.predict_batch
+    grid = getattr(model, "lookup_grid", None)
+    if grid is None or top_k > grid.top_k:
+        return score(X, top_k=top_k)
+
+    X = np.asarray(X, dtype=np.float64).reshape(-1, len(grid.features))
+    results = grid.predict_batch(X, top_k=top_k)
+    missing = [row for row, result in enumerate(results) if result is None]
+    if missing:
+        scored = score(X[missing], top_k=top_k)
+        if scored is None:
+            return None
+        for row, result in zip(missing, scored):
+            results[row] = result
+    return results
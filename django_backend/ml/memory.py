@@ -0,0 +1,40 @@
+import os
+
+# /proc/<pid>/status fields, reported in KiB
+STATUS_FIELDS = ("VmRSS", "RssAnon", "RssFile", "RssShmem")
+# /proc/<pid>/smaps_rollup fields; Pss charges each shared page to its sharers
+SMAPS_FIELDS = ("Pss", "Shared_Clean", "Private_Clean", "Private_Dirty")
+
+
+def _read_kib_fields(path, fields):
+    values = {}
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                name, _, rest = line.partition(":")
+                if name in fields:
+                    values[name] = int(rest.split()[0])
+    except (OSError, ValueError, IndexError):
+        pass
+    return values
+
+
+def process_memory(pid="self"):
+    """
+    Return the resident memory of a process in KiB.
+
+    RSS counts every resident page, including pages shared with other worker
+    processes (RssFile covers memory-mapped model bundles); PSS divides shared
+    pages between the processes that map them, so summing PSS over workers gives
+    their real footprint. Only available on Linux; elsewhere returns just the pid.
+    """
+    memory = {"pid": os.getpid() if pid == "self" else pid}
+    status = _read_kib_fields(f"/proc/{pid}/status", STATUS_FIELDS)
+    smaps = _read_kib_fields(f"/proc/{pid}/smaps_rollup", SMAPS_FIELDS)
+    for field in STATUS_FIELDS:
+        if field in status:
+            memory[f"{field.lower()}_kib"] = status[field]
+    for field in SMAPS_FIELDS:
+        if field in smaps:
+            memory[f"{field.lower()}_kib"] = smaps[field]
+    return memory
@@ -17,6 +17,12 @@ from sklearn.preprocessing import LabelEncoder, StandardScaler
 from imblearn.over_sampling import SMOTE
 from django.conf import settings
 
+from .compiled import compile_estimator
+from .features import FEATURES, feature_matrix
+
+# Ways CropModel.predict_proba can evaluate the trained ensemble
+INFERENCE_BACKENDS = ("native", "compiled")
+
 
 # Add progress tracking function
 def save_progress(model_id, stage, progress):
@@ -31,20 +37,53 @@ def save_progress(model_id, stage, progress):
         json.dump(progress_data, f)
 
 
+def top_k_indices(probabilities, k):
+    """
+    Return the column indices of the k largest probabilities in each row, best first.
+
+    np.argpartition locates each row's k-th largest value in linear time; ties are
+    then broken by column order so the result matches a stable descending sort.
+    """
+    probabilities = np.asarray(probabilities)
+    n_rows, n_classes = probabilities.shape
+    k = min(k, n_classes)
+    if k == n_classes:
+        return np.argsort(-probabilities, axis=1, kind="stable")
+
+    rows = np.arange(n_rows)
+    kth_columns = np.argpartition(-probabilities, k - 1, axis=1)[:, k - 1]
+    kth_values = probabilities[rows, kth_columns][:, None]
+
+    above = probabilities > kth_values
+    tied = probabilities == kth_values
+    needed = k - above.sum(axis=1, keepdims=True)
+    selected = above | (tied & (np.cumsum(tied, axis=1) <= needed))
+
+    columns = np.nonzero(selected)[1].reshape(n_rows, k)
+    order = np.argsort(
+        -np.take_along_axis(probabilities, columns, axis=1), axis=1, kind="stable"
+    )
+    return np.take_along_axis(columns, order, axis=1)
+
+
 # Create your models here.
 
 
 class CropModel:
     """Base class for crop recommendation models"""
 
-    def __init__(self, algorithm="random_forest"):
+    def __init__(self, algorithm="random_forest", n_estimators=100, max_depth=None):
         self.algorithm = algorithm
+        self.n_estimators = n_estimators
+        self.max_depth = max_depth
         self.model = None
-        self.features = ["N", "P", "K", "pH", "temperature", "rainfall", "humidity"]
+        self.features = list(FEATURES)
         self.target = "crop"
         self.label_encoder = LabelEncoder()
         self.scaler = StandardScaler()
         self.fitted_labels = None
+        self.inference_backend = "native"
+        self.compiled = None
 
     def train(self, X, y):
         """Train the model with the given data"""
@@ -118,6 +157,9 @@ class CropModel:
 
             # Initialize model based on algorithm with appropriate parameters for multi-class
             print(f"Initializing {self.algorithm} model...")
+            # Models pickled before the size was configurable use the defaults
+            n_estimators = getattr(self, "n_estimators", 100)
+            max_depth = getattr(self, "max_depth", None)
             if self.algorithm == "random_forest":
                 # Calculate class weights for present classes only
                 weights = {}
@@ -125,8 +167,8 @@ class CropModel:
                     weights[label] = 1.0 / (class_counts.get(label, 1) + 1)
 
                 self.model = RandomForestClassifier(
-                    n_estimators=100,  # Reduced trees for faster training
-                    max_depth=None,  # Let trees grow fully
+                    n_estimators=n_estimators,
+                    max_depth=max_depth,  # None lets trees grow fully
                     min_samples_split=2,
                     min_samples_leaf=1,
                     random_state=42,
@@ -145,8 +187,8 @@ class CropModel:
                 )
 
                 self.model = XGBClassifier(
-                    n_estimators=100,  # Reduced trees for faster training
-                    max_depth=None,  # Let trees grow fully
+                    n_estimators=n_estimators,
+                    max_depth=max_depth,  # None uses XGBoost's default
                     learning_rate=0.1,
                     random_state=42,
                     n_jobs=-1,  # Use all CPU cores
@@ -171,6 +213,9 @@ class CropModel:
                 self.model.fit(X_balanced, y_balanced)
             print("Model training completed successfully")
 
+            # Cache crop names in predict_proba column order for fast decoding
+            self.class_names = self._build_class_names()
+
             # Verify the model works by making a test prediction
             print("Verifying model with test prediction...")
             test_pred = self.model.predict(X_scaled[:1])
@@ -193,64 +238,119 @@ class CropModel:
     def predict(self, X):
         """Make predictions with the trained model"""
         try:
-            if self.model is None:
-                raise ValueError("Model has not been trained")
-
-            # Ensure X has the correct features in the correct order
-            if isinstance(X, pd.DataFrame):
-                X = X[self.features]
-
-            # Scale features
-            X_scaled = self.scaler.transform(X)
-
-            # Make predictions
-            predictions = self.model.predict(X_scaled)
-            probabilities = self.model.predict_proba(X_scaled)
-
-            # Map predictions back to original labels for XGBoost
-            if self.algorithm == "xgboost":
-                predictions = np.array(
-                    [self.reverse_mapping[pred] for pred in predictions]
-                )
+            # Probabilities are computed once; the top crop is their argmax
+            probabilities = self.predict_proba(X)
+            return self._decode_top_k(probabilities[:1], top_k=5)[0]
+        except Exception as e:
+            print(f"Error making prediction: {str(e)}")
+            return None
 
-            # Get top prediction
-            top_crop_idx = predictions[0]
-            top_crop = self.label_encoder.inverse_transform([top_crop_idx])[0]
+    def predict_proba(self, X):
+        """
+        Return class probabilities for every row of X, in get_class_names() order.
+
+        X may be a feature dict, a float array in self.features order or a
+        DataFrame; see ml.features.feature_matrix.
+        """
+        if self.model is None:
+            raise ValueError("Model has not been trained")
+
+        X_scaled = self.scale(feature_matrix(X, self.features))
+        if getattr(self, "inference_backend", "native") == "compiled":
+            return self.get_compiled().predict_proba(X_scaled)
+        return self.model.predict_proba(X_scaled)
+
+    def get_compiled(self):
+        """Return the flat-array form of the trained ensemble, compiling it once"""
+        compiled = getattr(self, "compiled", None)
+        if compiled is None:
+            compiled = self.compiled = compile_estimator(self.model, self.algorithm)
+        return compiled
+
+    def set_inference_backend(self, backend):
+        """
+        Select how predict_proba evaluates the ensemble.
+
+        "native" calls the sklearn/XGBoost estimator; "compiled" walks the
+        flattened trees with numpy, which avoids per-call dispatch and thread
+        pool overhead for small batches.
+        """
+        if backend not in INFERENCE_BACKENDS:
+            raise ValueError(f"Unsupported inference backend: {backend}")
+        if backend == "compiled":
+            self.get_compiled()
+        self.inference_backend = backend
+
+    def scale(self, X):
+        """Standardize a float array with the fitted scaler's mean and scale"""
+        # Same arithmetic as StandardScaler.transform, without its input
+        # validation and feature-name checks
+        mean = getattr(self.scaler, "mean_", None)
+        scale = getattr(self.scaler, "scale_", None)
+        if mean is not None:
+            X = X - mean
+        if scale is not None:
+            X = X / scale
+        return X
+
+    def predict_batch(self, X, top_k=5):
+        """
+        Make predictions for every row of X with a single scaler and model call.
+
+        Args:
+            X: DataFrame or array of shape (n_samples, n_features)
+            top_k (int): Number of crop matches to return per row
+
+        Returns:
+            list: One {"top_crop", "crop_matches"} dict per row, or None on failure
+        """
+        try:
+            probabilities = self.predict_proba(X)
+            return self._decode_top_k(probabilities, top_k=top_k)
+        except Exception as e:
+            print(f"Error making batch prediction: {str(e)}")
+            return None
 
-            # For XGBoost, map the index to get correct probability
-            if self.algorithm == "xgboost":
-                confidence = probabilities[0][self.label_mapping[top_crop_idx]]
-            else:
-                confidence = probabilities[0][top_crop_idx]
-
-            # Get alternative crops (top 5 predictions)
-            crop_matches = []
-            for i, prob in enumerate(probabilities[0]):
-                if self.algorithm == "xgboost":
-                    # Map the consecutive index back to original label
-                    orig_idx = self.reverse_mapping.get(i)
-                    if orig_idx is not None:  # Only add if we have a mapping
-                        crop = self.label_encoder.inverse_transform([orig_idx])[0]
-                        crop_matches.append({"crop": crop, "confidence": float(prob)})
-                else:
-                    crop = self.label_encoder.inverse_transform([i])[0]
-                    crop_matches.append({"crop": crop, "confidence": float(prob)})
+    def _decode_top_k(self, probabilities, top_k):
+        class_names = self.get_class_names()
 
-            # Sort by confidence and get top matches
-            crop_matches.sort(key=lambda x: x["confidence"], reverse=True)
-            crop_matches = crop_matches[:5]  # Keep only top 5 alternatives
+        top_indices = top_k_indices(probabilities, top_k)
+        top_probabilities = np.take_along_axis(probabilities, top_indices, axis=1)
+        top_names = class_names[top_indices]
 
-            return {
-                "top_crop": {"crop": top_crop, "confidence": float(confidence)},
-                "crop_matches": crop_matches,
-            }
-        except Exception as e:
-            print(f"Error making prediction: {str(e)}")
-            return None
+        results = []
+        for names, probs in zip(top_names.tolist(), top_probabilities.tolist()):
+            crop_matches = [
+                {"crop": crop, "confidence": prob} for crop, prob in zip(names, probs)
+            ]
+            results.append(
+                {"top_crop": dict(crop_matches[0]), "crop_matches": crop_matches}
+            )
+        return results
+
+    def get_class_names(self):
+        """Return crop names in the column order of predict_proba"""
+        class_names = getattr(self, "class_names", None)
+        if class_names is None:
+            # Models pickled before the table was cached at train time
+            class_names = self.class_names = self._build_class_names()
+        return class_names
+
+    def _build_class_names(self):
+        encoded = np.asarray(self.model.classes_)
+        if self.algorithm == "xgboost":
+            # XGBoost was trained on consecutive labels; map back to the encoder's
+            encoded = np.array([self.reverse_mapping[label] for label in encoded])
+        return np.asarray(self.label_encoder.classes_)[encoded]
 
     def save(self, path):
-        """Save the model to disk"""
+        """Save the model to disk (as an artifact directory if path ends in .model)"""
+        from .artifacts import ARTIFACT_EXTENSION, save_model_artifact
+
         try:
+            if path.endswith(ARTIFACT_EXTENSION):
+                save_model_artifact(self, path)
+                return True
             with open(path, "wb") as f:
                 pickle.dump(self, f)
             return True
@@ -260,8 +360,15 @@ class CropModel:
 
     @classmethod
     def load(cls, path):
-        """Load a model from disk"""
+        """Load a model from disk (a pickle, bundle or artifact directory)"""
+        from .artifacts import is_model_artifact, load_model_artifact
+        from .bundle import BUNDLE_EXTENSION, load_model_bundle
+
         try:
+            if is_model_artifact(path):
+                return load_model_artifact(path)
+            if path.endswith(BUNDLE_EXTENSION):
+                return load_model_bundle(path)
             with open(path, "rb") as f:
                 return pickle.load(f)
         except Exception as e:
@@ -0,0 +1,279 @@
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+
+from .artifacts import is_model_artifact, load_model_artifact
+from .bundle import BUNDLE_EXTENSION, load_model_bundle, pickle_path_for
+from .lookup import attach_lookup_grid, lookup_path_for
+from .models import CropModel
+
+# A loaded model together with the file signature it was loaded from
+RegistryEntry = namedtuple(
+    "RegistryEntry", ["model", "signature", "version", "loaded_at", "load_seconds"]
+)
+
+
+def file_signature(path):
+    """Return a cheap (mtime, size, inode) signature for a file, or None if missing"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def model_signature(path):
+    """
+    Return the signature a loaded model is checked against.
+
+    While lookup grids are served this is the model's file_signature extended
+    with that of its grid file, so storing a new grid reloads the model.
+    """
+    signature = file_signature(path)
+    serve_grids = getattr(settings, "ML_LOOKUP_GRID", {}).get("enabled", False)
+    if signature is None or not serve_grids:
+        return signature
+    return signature + (file_signature(lookup_path_for(path)) or (0, 0, 0))
+
+
+def load_crop_model(path):
+    """Load a CropModel (artifact, bundle or pickle), returning None if invalid"""
+    if is_model_artifact(path):
+        model = load_model_artifact(path)
+        model.set_inference_backend(
+            getattr(settings, "ML_INFERENCE_BACKEND", "native")
+        )
+    elif path.endswith(BUNDLE_EXTENSION):
+        model = load_model_bundle(path)
+    else:
+        with open(path, "rb") as f:
+            model = pickle.load(f)
+
+        if not isinstance(model, CropModel):
+            print(f"Loaded model at {path} is not a valid CropModel instance")
+            return None
+
+        # Compile here rather than on the first request when that backend is enabled
+        model.set_inference_backend(
+            getattr(settings, "ML_INFERENCE_BACKEND", "native")
+        )
+
+    # An artifact's grid must match the version that was opened, which may
+    # already have been replaced at path
+    attach_lookup_grid(model, getattr(model, "artifact_path", path))
+    return model
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded CropModel instances keyed by file path.
+
+    Each lookup costs a single os.stat(); the model is only unpickled again when
+    the file's mtime, size or inode changes. A reloaded model replaces the old
+    entry in one assignment, so concurrent readers always see either the old or
+    the new model, never a half-loaded one.
+
+    Models requested with pin=True (the default model and its tiers) stay
+    loaded; of the others, only the max_entries most recently used are kept.
+    """
+
+    def __init__(self, loader=load_crop_model, max_entries=4):
+        self._loader = loader
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._pinned = set()
+        self._load_locks = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._reloads = 0
+        self._load_errors = 0
+        self._evictions = 0
+        self._listeners = []
+
+    def get(self, path, pin=False):
+        """
+        Return the model stored at path, loading it if it is new or has changed.
+
+        Args:
+            path (str): Path to the model file or artifact directory
+            pin (bool): Never evict the model to make room for others
+
+        Returns:
+            CropModel: Loaded model or None if the file is missing or invalid
+        """
+        entry = self.get_entry(path, pin=pin)
+        return entry.model if entry else None
+
+    def get_entry(self, path, pin=False):
+        """Return the RegistryEntry for path, loading or reloading it as needed"""
+        path = os.path.abspath(path)
+        if pin and path not in self._pinned:
+            with self._lock:
+                self._pinned.add(path)
+        signature = model_signature(path)
+        if signature is None:
+            with self._lock:
+                self._misses += 1
+                self._entries.pop(path, None)
+            return None
+
+        entry = self._entries.get(path)
+        if entry is not None and entry.signature == signature:
+            with self._lock:
+                self._hits += 1
+                self._touch_locked(path)
+            return entry
+
+        # Only one thread loads a given path; the others wait and reuse its result
+        with self._get_load_lock(path):
+            entry = self._entries.get(path)
+            signature = model_signature(path)
+            if entry is not None and entry.signature == signature:
+                with self._lock:
+                    self._hits += 1
+                    self._touch_locked(path)
+                return entry
+
+            with self._lock:
+                self._misses += 1
+
+            new_entry = self._load(path, signature)
+            if new_entry is None:
+                # Keep serving the previous model if the new file cannot be read,
+                # e.g. because it is still being written
+                return entry
+
+            with self._lock:
+                if entry is not None:
+                    self._reloads += 1
+                self._entries[path] = new_entry
+                self._entries.move_to_end(path)
+                if path.endswith(BUNDLE_EXTENSION):
+                    # The pickle this bundle was exported from is no longer
+                    # served; do not keep its full estimator resident as well
+                    self._entries.pop(pickle_path_for(path), None)
+                self._evict_locked()
+                listeners = list(self._listeners)
+
+            if entry is not None:
+                for listener in listeners:
+                    listener(path, new_entry.version)
+            return new_entry
+
+    def peek(self, path):
+        """
+        Return the RegistryEntry for path only if it is loaded and still current.
+
+        Never loads a model, so it is safe to call from an event loop; None means
+        the caller should fall back to get_entry() on a worker thread.
+        """
+        path = os.path.abspath(path)
+        entry = self._entries.get(path)
+        if entry is None or entry.signature != model_signature(path):
+            return None
+        with self._lock:
+            self._hits += 1
+        return entry
+
+    def add_listener(self, callback):
+        """Call callback(path, version) whenever a loaded model is replaced"""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def version(self, path):
+        """Return the version string of the currently loaded model at path"""
+        entry = self._entries.get(os.path.abspath(path))
+        return entry.version if entry else None
+
+    def invalidate(self, path=None):
+        """Drop one cached model, or all of them if no path is given"""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(os.path.abspath(path), None)
+
+    def stats(self):
+        """
+        Return hit/miss counters and details of the currently loaded models.
+
+        Models are named by file name only; their location on disk is not
+        reported.
+        """
+        with self._lock:
+            entries = list(self._entries.items())
+            stats = {
+                "hits": self._hits,
+                "misses": self._misses,
+                "reloads": self._reloads,
+                "load_errors": self._load_errors,
+                "evictions": self._evictions,
+                "max_entries": self.max_entries,
+            }
+
+        stats["models"] = [
+            {
+                "model": os.path.basename(path),
+                "pinned": path in self._pinned,
+                "version": entry.version,
+                "algorithm": getattr(entry.model, "algorithm", None),
+                "loaded_at": entry.loaded_at,
+                "load_seconds": entry.load_seconds,
+            }
+            for path, entry in entries
+        ]
+        return stats
+
+    def _touch_locked(self, path):
+        if path in self._entries:
+            self._entries.move_to_end(path)
+
+    def _evict_locked(self):
+        """Drop the least recently used unpinned models beyond max_entries"""
+        unpinned = [path for path in self._entries if path not in self._pinned]
+        for path in unpinned[: max(0, len(unpinned) - self.max_entries)]:
+            del self._entries[path]
+            self._load_locks.pop(path, None)
+            self._evictions += 1
+
+    def _get_load_lock(self, path):
+        with self._lock:
+            lock = self._load_locks.get(path)
+            if lock is None:
+                lock = self._load_locks[path] = threading.Lock()
+            return lock
+
+    def _load(self, path, signature):
+        start = time.perf_counter()
+        try:
+            model = self._loader(path)
+        except Exception as e:
+            print(f"Error loading model from {path}: {str(e)}")
+            model = None
+
+        if model is None:
+            with self._lock:
+                self._load_errors += 1
+            return None
+
+        load_seconds = time.perf_counter() - start
+        version = "-".join(f"{value:x}" for value in signature)
+        print(f"Loaded model {path} (version {version}) in {load_seconds:.3f}s")
+        return RegistryEntry(
+            model=model,
+            signature=signature,
+            version=version,
+            loaded_at=time.time(),
+            load_seconds=load_seconds,
+        )
+
+
+# Shared registry used by every prediction path in this process
+model_registry = ModelRegistry(
+    max_entries=getattr(settings, "ML_MODEL_REGISTRY_SIZE", 4)
+)
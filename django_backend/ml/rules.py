@@ -0,0 +1,237 @@
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from .features import FEATURES, feature_matrix
+from .models import top_k_indices
+from .registry import file_signature
+from .utils import RECOMMENDATIONS_PATH
+
+# Requirement ranges learned from the training datasets by build_crop_requirements
+CROP_REQUIREMENTS_PATH = os.path.join(RECOMMENDATIONS_PATH, "crop_requirements.json")
+
+# Hand-written requirement ranges used until learned ones are available
+DEFAULT_CROP_REQUIREMENTS = {
+    "Wheat": {
+        "N": (60, 100),
+        "P": (30, 60),
+        "K": (60, 100),
+        "pH": (6.0, 7.5),
+        "temperature": (15, 25),
+        "rainfall": (450, 650),
+    },
+    "Rice": {
+        "N": (80, 120),
+        "P": (40, 60),
+        "K": (40, 60),
+        "pH": (5.5, 6.5),
+        "temperature": (20, 30),
+        "rainfall": (1000, 2000),
+    },
+    "Maize": {
+        "N": (80, 120),
+        "P": (30, 50),
+        "K": (40, 60),
+        "pH": (5.8, 6.8),
+        "temperature": (20, 30),
+        "rainfall": (500, 800),
+    },
+    "Apple": {
+        "N": (60, 100),
+        "P": (30, 50),
+        "K": (60, 100),
+        "pH": (6.0, 7.0),
+        "temperature": (15, 25),
+        "rainfall": (600, 800),
+    },
+    "Banana": {
+        "N": (100, 150),
+        "P": (40, 60),
+        "K": (100, 150),
+        "pH": (5.5, 7.0),
+        "temperature": (25, 35),
+        "rainfall": (1000, 2000),
+    },
+    "Potato": {
+        "N": (100, 150),
+        "P": (40, 60),
+        "K": (150, 200),
+        "pH": (5.0, 6.0),
+        "temperature": (15, 20),
+        "rainfall": (500, 700),
+    },
+    "Tomato": {
+        "N": (100, 150),
+        "P": (40, 60),
+        "K": (150, 200),
+        "pH": (6.0, 6.8),
+        "temperature": (20, 25),
+        "rainfall": (600, 800),
+    },
+    "Cotton": {
+        "N": (60, 100),
+        "P": (30, 50),
+        "K": (40, 60),
+        "pH": (6.0, 7.0),
+        "temperature": (25, 35),
+        "rainfall": (500, 800),
+    },
+}
+
+
+class RuleEngine:
+    """
+    Rule-based crop scoring used when no trained model is available.
+
+    Requirements are held as (crops, features) arrays of optimal minimums and
+    maximums, with NaN where a crop has no requirement for a feature. A batch of
+    samples is scored against every crop with one broadcasted operation: a value
+    inside the range scores 1, outside it scores 1 - distance / range width
+    (floored at 0), and a crop's confidence is the mean over its features.
+    """
+
+    def __init__(self, crops, lower, upper, features=FEATURES):
+        self.crops = np.asarray(crops, dtype=object)
+        self.lower = np.asarray(lower, dtype=np.float64)
+        self.upper = np.asarray(upper, dtype=np.float64)
+        self.features = list(features)
+        self._mask = ~np.isnan(self.lower)
+        self._counts = np.maximum(self._mask.sum(axis=1), 1)
+
+    @classmethod
+    def from_requirements(cls, requirements, features=FEATURES):
+        """Build an engine from {crop: {feature: (min, max)}}"""
+        crops = list(requirements)
+        lower = np.full((len(crops), len(features)), np.nan)
+        upper = np.full((len(crops), len(features)), np.nan)
+        for i, crop in enumerate(crops):
+            for j, feature in enumerate(features):
+                if feature in requirements[crop]:
+                    lower[i, j], upper[i, j] = requirements[crop][feature]
+        return cls(crops, lower, upper, features)
+
+    @classmethod
+    def from_datasets(cls, dataset_paths, quantiles=(0.1, 0.9), features=FEATURES):
+        """
+        Learn per-crop requirement ranges as quantiles of the training datasets.
+
+        Args:
+            dataset_paths (list): CSV files with the feature columns and a crop column
+            quantiles (tuple): Lower and upper quantile of each feature per crop
+        """
+        frames = [
+            pd.read_csv(path, usecols=list(features) + ["crop"])
+            for path in dataset_paths
+        ]
+        data = pd.concat(frames, ignore_index=True)
+        data["crop"] = data["crop"].astype(str).str.strip().str.lower()
+
+        grouped = data.groupby("crop")[list(features)]
+        lower = grouped.quantile(quantiles[0])
+        upper = grouped.quantile(quantiles[1])
+        return cls(lower.index.tolist(), lower.to_numpy(), upper.to_numpy(), features)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            data = json.load(f)
+        return cls(
+            data["crops"],
+            np.array(data["lower"], dtype=np.float64),
+            np.array(data["upper"], dtype=np.float64),
+            data["features"],
+        )
+
+    def save(self, path):
+        """Write the requirement table as JSON (NaN marks a missing requirement)"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "features": self.features,
+                    "crops": self.crops.tolist(),
+                    "lower": self.lower.tolist(),
+                    "upper": self.upper.tolist(),
+                },
+                f,
+            )
+        os.replace(tmp_path, path)
+
+    def score(self, X):
+        """
+        Score every sample against every crop.
+
+        Args:
+            X: Samples accepted by ml.features.feature_matrix
+
+        Returns:
+            np.ndarray: Confidence in [0, 1] of shape (n_samples, n_crops)
+        """
+        X = feature_matrix(X, self.features)[:, None, :]
+        lower = self.lower[None, :, :]
+        upper = self.upper[None, :, :]
+
+        distance = np.maximum(lower - X, 0) + np.maximum(X - upper, 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            partial = np.maximum(0, 1 - distance / (upper - lower))
+        matches = np.where(distance == 0, 1.0, np.nan_to_num(partial))
+
+        matches = np.where(self._mask, matches, 0.0)
+        return matches.sum(axis=2) / self._counts
+
+    def rank(self, X, top_k=None):
+        """
+        Return the crops ordered by confidence for every sample.
+
+        Returns:
+            list: Per sample, a list of {"crop", "confidence"} dicts, best first
+        """
+        scores = self.score(X)
+        top_indices = top_k_indices(scores, top_k or len(self.crops))
+        top_scores = np.take_along_axis(scores, top_indices, axis=1)
+        top_crops = self.crops[top_indices]
+        return [
+            [
+                {"crop": crop, "confidence": confidence}
+                for crop, confidence in zip(crops, confidences)
+            ]
+            for crops, confidences in zip(top_crops.tolist(), top_scores.tolist())
+        ]
+
+
+_engine_lock = threading.Lock()
+_engine = None
+_engine_signature = None
+
+
+def get_rule_engine():
+    """
+    Return the rule engine, preferring requirement ranges learned from data.
+
+    crop_requirements.json is re-read only when it changes; without it the
+    hand-written DEFAULT_CROP_REQUIREMENTS are used.
+    """
+    global _engine, _engine_signature
+
+    signature = file_signature(CROP_REQUIREMENTS_PATH)
+    if _engine is not None and signature == _engine_signature:
+        return _engine
+
+    with _engine_lock:
+        if _engine is not None and signature == _engine_signature:
+            return _engine
+        engine = None
+        if signature is not None:
+            try:
+                engine = RuleEngine.load(CROP_REQUIREMENTS_PATH)
+            except Exception as e:
+                print(f"Error loading crop requirements: {str(e)}")
+        if engine is None:
+            engine = RuleEngine.from_requirements(DEFAULT_CROP_REQUIREMENTS)
+        _engine = engine
+        _engine_signature = signature
+        return _engine
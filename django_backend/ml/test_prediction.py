@@ -13,7 +13,7 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_backend.settings")
 django.setup()
 
 from ml.models import CropModel
-from ml.utils import MODELS_PATH
+from ml.prediction import get_default_model_path
 
 
 def test_model_prediction():
@@ -21,19 +21,17 @@ def test_model_prediction():
     print("\nTesting Model Prediction...")
 
     try:
-        # Find the latest model
-        model_files = [f for f in os.listdir(MODELS_PATH) if f.endswith(".pkl")]
-        if not model_files:
+        # The default model is an artifact directory or a pickle
+        model_path = get_default_model_path()
+        if not os.path.exists(model_path):
             print("Error: No trained model found!")
             return
 
-        latest_model = max(
-            model_files, key=lambda x: os.path.getctime(os.path.join(MODELS_PATH, x))
-        )
-        model_path = os.path.join(MODELS_PATH, latest_model)
-
         print(f"Loading model from: {model_path}")
         model = CropModel.load(model_path)
+        if model is None:
+            print("Error: Trained model could not be loaded!")
+            return
 
         # Test data (optimal values for wheat)
         test_data = pd.DataFrame(
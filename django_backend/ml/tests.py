@@ -1,3 +1,759 @@
-from django.test import TestCase
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory, SimpleTestCase
+from sklearn.ensemble import RandomForestClassifier
+from xgboost import XGBClassifier
+
+from . import prediction
+from .artifacts import (
+    artifact_versions,
+    is_model_artifact,
+    load_model_artifact,
+    save_model_artifact,
+)
+from .cache import PredictionCache
+from .catalog import ModelCatalog
+from .compiled import compile_random_forest, compile_xgboost
+from .features import FEATURES
+from .lookup import (
+    attach_lookup_grid,
+    build_lookup_grid,
+    disagreement_bound,
+    load_lookup_grid,
+    measure_grid_error,
+    predict_with_lookup,
+    save_lookup_grid,
+)
+from .models import CropModel, top_k_indices
+from .registry import ModelRegistry, model_signature
+from .rules import DEFAULT_CROP_REQUIREMENTS, RuleEngine
+from .views import get_metrics
+from .utils import (
+    CROP_CONDITIONS,
+    build_recommendation_texts,
+    calculate_match_batch,
+    calculate_overall_match,
+    generate_crop_recommendations,
+    get_crop_conditions,
+)
+
+
+def make_dataset(n_samples=400, n_features=7, n_classes=4, seed=0):
+    """Integer-valued features, so the fitted trees split exactly halfway between them"""
+    rng = np.random.default_rng(seed)
+    X = rng.integers(0, 6, size=(n_samples, n_features)).astype(np.float32)
+    y = (X[:, 0] + X[:, 1] * 2 + X[:, 2] + rng.integers(0, 2, n_samples)) % n_classes
+    return X, y.astype(np.int64)
+
+
+def threshold_samples(compiled, X, seed=1):
+    """
+    Samples that sit exactly on split thresholds: each row takes a training row
+    and moves one of its features onto a threshold used for that feature.
+    """
+    rng = np.random.default_rng(seed)
+    is_split = compiled.left != np.arange(compiled.n_nodes)
+    features = compiled.feature[is_split]
+    thresholds = compiled.threshold[is_split].astype(np.float32)
+
+    rows = X[rng.integers(0, len(X), len(features))].copy()
+    rows[np.arange(len(features)), features] = thresholds
+    return rows
+
+
+class CompiledForestTests(SimpleTestCase):
+    def setUp(self):
+        self.X, self.y = make_dataset()
+        rng = np.random.default_rng(2)
+        self.random_X = (rng.random((500, self.X.shape[1])) * 6).astype(np.float32)
+
+    def assert_matches(self, estimator, compiled, exact):
+        for X in (self.X, self.random_X, threshold_samples(compiled, self.X)):
+            native = estimator.predict_proba(X)
+            probabilities = compiled.predict_proba(X)
+            if exact:
+                self.assertTrue(np.array_equal(native, probabilities))
+            else:
+                np.testing.assert_allclose(probabilities, native, rtol=0, atol=1e-6)
+
+    def test_random_forest_matches_bit_for_bit(self):
+        forest = RandomForestClassifier(n_estimators=25, max_depth=8, random_state=0)
+        forest.fit(self.X, self.y)
+        self.assert_matches(forest, compile_random_forest(forest), exact=True)
+
+    def test_xgboost_matches_within_float32_rounding(self):
+        classifier = XGBClassifier(
+            n_estimators=25,
+            max_depth=4,
+            objective="multi:softprob",
+            random_state=0,
+        )
+        classifier.fit(self.X, self.y)
+        self.assert_matches(classifier, compile_xgboost(classifier), exact=False)
+
+
+def register_models(manifest_path, model_dir, prefix, count, start):
+    """Register count models in a fresh catalog once every process is ready"""
+    catalog = ModelCatalog(manifest_path)
+    start.wait()
+    for i in range(count):
+        path = os.path.join(model_dir, f"{prefix}_{i}.pkl")
+        catalog.register(f"{prefix}_{i}", path, "random_forest")
+
+
+class ModelCatalogTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.model_dir = os.path.join(self.dir, "files")
+        os.makedirs(self.model_dir)
+        self.manifest_path = os.path.join(self.dir, "models", "catalog.json")
+
+    def make_model_files(self, prefix, count):
+        ids = set()
+        for i in range(count):
+            with open(os.path.join(self.model_dir, f"{prefix}_{i}.pkl"), "wb") as f:
+                f.write(f"{prefix}{i}".encode())
+            ids.add(f"{prefix}_{i}")
+        return ids
+
+    def test_concurrent_registrations_from_two_processes_are_kept(self):
+        count = 25
+        ids = self.make_model_files("a", count) | self.make_model_files("b", count)
+        context = multiprocessing.get_context("fork")
+        start = context.Barrier(2)
+        processes = [
+            context.Process(
+                target=register_models,
+                args=(self.manifest_path, self.model_dir, prefix, count, start),
+            )
+            for prefix in ("a", "b")
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+
+        catalog = ModelCatalog(self.manifest_path)
+        self.assertEqual({entry["id"] for entry in catalog.entries()}, ids)
+        self.assertIn(catalog.active_id, {f"a_{count - 1}", f"b_{count - 1}"})
+
+
+def make_crop_model(n_estimators=4, n_classes=8):
+    """A CropModel around a small forest, whose probabilities tie often"""
+    X, y = make_dataset(n_classes=n_classes)
+    X = X.astype(np.float64)
+    model = CropModel(algorithm="random_forest")
+    model.label_encoder.fit([f"crop{i}" for i in range(n_classes)])
+    model.scaler.fit(X)
+    model.model = RandomForestClassifier(
+        n_estimators=n_estimators, max_depth=4, random_state=0
+    ).fit(model.scaler.transform(X), y)
+    return model, pd.DataFrame(X, columns=FEATURES)
+
+
+def baseline_prediction(model, row):
+    """
+    CropModel.predict as it was before top_k_indices: model.predict for the
+    top crop and a stable sort of every class's probability for the matches.
+    """
+    X_scaled = model.scaler.transform(row[model.features].to_numpy())
+    top_crop_idx = model.model.predict(X_scaled)[0]
+    probabilities = model.model.predict_proba(X_scaled)
+    crop_matches = [
+        {
+            "crop": model.label_encoder.inverse_transform([i])[0],
+            "confidence": float(prob),
+        }
+        for i, prob in enumerate(probabilities[0])
+    ]
+    crop_matches.sort(key=lambda x: x["confidence"], reverse=True)
+    return {
+        "top_crop": {
+            "crop": model.label_encoder.inverse_transform([top_crop_idx])[0],
+            "confidence": float(probabilities[0][top_crop_idx]),
+        },
+        "crop_matches": crop_matches[:5],
+    }
+
+
+class TopKTests(SimpleTestCase):
+    def test_matches_a_stable_descending_sort_with_ties(self):
+        rng = np.random.default_rng(3)
+        # Few distinct values, so most rows have ties at and around the k-th
+        probabilities = rng.integers(0, 4, size=(300, 10)) / 4
+        for k in range(1, 11):
+            expected = np.argsort(-probabilities, axis=1, kind="stable")[:, :k]
+            np.testing.assert_array_equal(top_k_indices(probabilities, k), expected)
+
+    def test_k_larger_than_the_number_of_classes(self):
+        probabilities = np.array([[0.25, 0.5, 0.25]])
+        np.testing.assert_array_equal(top_k_indices(probabilities, 5), [[1, 0, 2]])
+
+
+class CropModelPredictTests(SimpleTestCase):
+    def setUp(self):
+        self.model, self.X = make_crop_model()
+        self.expected = [
+            baseline_prediction(self.model, self.X.iloc[[i]])
+            for i in range(len(self.X))
+        ]
+
+    def test_samples_include_tied_matches(self):
+        tied = [
+            len({match["confidence"] for match in expected["crop_matches"]}) < 5
+            for expected in self.expected
+        ]
+        self.assertTrue(any(tied))
+
+    def test_predict_matches_the_baseline(self):
+        for i, expected in enumerate(self.expected):
+            self.assertEqual(self.model.predict(self.X.iloc[[i]]), expected)
+
+    def test_predict_batch_matches_the_baseline(self):
+        self.assertEqual(self.model.predict_batch(self.X, top_k=5), self.expected)
+
+
+class ModelArtifactTests(SimpleTestCase):
+    def setUp(self):
+        # Resolved, so version paths compare equal to os.path.realpath()
+        self.dir = os.path.realpath(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, "m.model")
+        self.model, self.X = make_crop_model()
+
+    def test_path_links_to_the_current_version(self):
+        save_model_artifact(self.model, self.path)
+        first = os.path.realpath(self.path)
+        self.assertTrue(os.path.islink(self.path))
+        loaded = load_model_artifact(self.path)
+        self.assertEqual(loaded.artifact_path, first)
+        np.testing.assert_allclose(
+            loaded.predict_proba(self.X), self.model.predict_proba(self.X), atol=1e-6
+        )
+
+        save_model_artifact(self.model, self.path)
+        second = os.path.realpath(self.path)
+        self.assertNotEqual(second, first)
+        self.assertEqual(artifact_versions(self.path), [first, second])
+
+        # Only the version that was replaced last is kept
+        save_model_artifact(self.model, self.path)
+        self.assertEqual(
+            artifact_versions(self.path), [second, os.path.realpath(self.path)]
+        )
+
+    def test_opened_version_is_served_after_a_save(self):
+        save_model_artifact(self.model, self.path)
+        loaded = load_model_artifact(self.path)
+        save_model_artifact(self.model, self.path)
+        self.assertNotEqual(loaded.artifact_path, os.path.realpath(self.path))
+        np.testing.assert_allclose(
+            loaded.predict_proba(self.X), self.model.predict_proba(self.X), atol=1e-6
+        )
+
+    def test_path_resolves_while_versions_are_saved(self):
+        save_model_artifact(self.model, self.path)
+        done = threading.Event()
+
+        def save():
+            try:
+                for _ in range(5):
+                    save_model_artifact(self.model, self.path)
+            finally:
+                done.set()
+
+        saver = threading.Thread(target=save)
+        saver.start()
+        checks = 0
+        while not done.is_set():
+            self.assertIsNotNone(model_signature(self.path))
+            self.assertTrue(is_model_artifact(self.path))
+            checks += 1
+        saver.join()
+        self.assertGreater(checks, 0)
+        self.assertEqual(len(artifact_versions(self.path)), 2)
+
+    def test_replaces_an_artifact_saved_before_versioning(self):
+        save_model_artifact(self.model, self.path)
+        version = os.path.realpath(self.path)
+        os.remove(self.path)
+        os.rename(version, self.path)
+
+        save_model_artifact(self.model, self.path)
+        self.assertTrue(os.path.islink(self.path))
+        legacy, current = artifact_versions(self.path)
+        self.assertTrue(legacy.endswith("-legacy"))
+        self.assertTrue(is_model_artifact(legacy))
+        self.assertEqual(current, os.path.realpath(self.path))
+
+
+def recommendation_texts(crop_name):
+    """The texts get_recommendation_texts serves, without the enrichment store"""
+    return build_recommendation_texts(crop_name, get_crop_conditions(crop_name))
+
+
+class MatchAnalysisBatchTests(SimpleTestCase):
+    # "unknown" is not in CROP_CONDITIONS and is scored on DEFAULT_CONDITIONS
+    crops = sorted(CROP_CONDITIONS) + ["unknown"]
+
+    def make_samples(self):
+        rng = np.random.default_rng(4)
+        samples = [
+            # Missing parameters take their defaults
+            {},
+            {"nitrogen": 85},
+        ]
+        for crop in self.crops:
+            conditions = get_crop_conditions(crop)
+            ranges = [
+                conditions[key]
+                for key in ("optimal_n", "optimal_p", "optimal_k", "optimal_ph")
+            ]
+            # Within, on the bounds, just below and above, and far outside
+            for position in (0.5, 0.0, 1.0, -0.2, 1.2, -3.0, 4.0):
+                samples.append(
+                    dict(
+                        zip(
+                            ("nitrogen", "phosphorus", "potassium", "ph"),
+                            (low + (high - low) * position for low, high in ranges),
+                        )
+                    )
+                )
+        for values in rng.uniform([0, 0, 0, 3], [200, 100, 150, 10], (40, 4)):
+            samples.append(
+                dict(zip(("nitrogen", "phosphorus", "potassium", "ph"), values))
+            )
+        return samples
+
+    def assert_matches_scalar(self, samples, batch, names):
+        with mock.patch("ml.utils.get_recommendation_texts", recommendation_texts):
+            for i, sample in enumerate(samples):
+                for j, crop in enumerate(names[i]):
+                    self.assertEqual(
+                        batch.match_analysis(i, j),
+                        calculate_overall_match(sample, crop),
+                    )
+                    self.assertEqual(
+                        batch.recommendations(i, j),
+                        generate_crop_recommendations(crop, sample),
+                    )
+
+    def test_shared_crops_match_the_scalar_analysis(self):
+        samples = self.make_samples()
+        batch = calculate_match_batch(samples, self.crops)
+        self.assertEqual(batch.shape, (len(samples), len(self.crops)))
+        self.assert_matches_scalar(samples, batch, [self.crops] * len(samples))
+
+    def test_per_sample_crops_match_the_scalar_analysis(self):
+        samples = self.make_samples()
+        rng = np.random.default_rng(5)
+        names = [
+            [self.crops[c] for c in rng.permutation(len(self.crops))[:3]]
+            for _ in samples
+        ]
+        batch = calculate_match_batch(samples, names)
+        self.assert_matches_scalar(samples, batch, names)
+
+
+class ModelRegistryTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.loads = []
+        self.registry = ModelRegistry(loader=self.load, max_entries=2)
+
+    def load(self, path):
+        """Stand-in for load_crop_model: the model is the file's text"""
+        self.loads.append(os.path.basename(path))
+        with open(path) as f:
+            text = f.read()
+        return None if text == "broken" else text
+
+    def write(self, name, text):
+        path = os.path.join(self.dir, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def test_loads_once_and_reloads_when_the_file_changes(self):
+        path = self.write("a.pkl", "v1")
+        self.assertEqual(self.registry.get(path), "v1")
+        self.assertEqual(self.registry.get(path), "v1")
+        self.assertEqual(self.loads, ["a.pkl"])
+
+        self.write("a.pkl", "v2 is longer")
+        self.assertEqual(self.registry.get(path), "v2 is longer")
+        self.assertEqual(self.loads, ["a.pkl", "a.pkl"])
+        self.assertEqual(self.registry.stats()["reloads"], 1)
+
+    def test_swap_notifies_listeners_and_keeps_serving_on_a_bad_file(self):
+        swaps = []
+        self.registry.add_listener(lambda path, version: swaps.append(version))
+        path = self.write("a.pkl", "v1")
+        first = self.registry.get_entry(path)
+
+        self.write("a.pkl", "v2 is longer")
+        second = self.registry.get_entry(path)
+        self.assertEqual(swaps, [second.version])
+        self.assertNotEqual(first.version, second.version)
+
+        # A file that cannot be loaded leaves the previous model in service
+        self.write("a.pkl", "broken")
+        self.assertEqual(self.registry.get(path), "v2 is longer")
+        self.assertEqual(swaps, [second.version])
+
+    def test_missing_file_drops_the_model(self):
+        path = self.write("a.pkl", "v1")
+        self.registry.get(path)
+        os.remove(path)
+        self.assertIsNone(self.registry.get(path))
+        self.assertIsNone(self.registry.version(path))
+
+    def test_evicts_the_least_recently_used_unpinned_model(self):
+        default = self.write("default_model.pkl", "default")
+        a, b, c = (self.write(f"{name}.pkl", name) for name in "abc")
+        self.registry.get(default, pin=True)
+        self.registry.get(a)
+        self.registry.get(b)
+        self.registry.get(a)
+        self.registry.get(c)
+
+        self.assertIsNone(self.registry.version(b))
+        for path in (default, a, c):
+            self.assertIsNotNone(self.registry.version(path))
+        self.assertEqual(self.registry.stats()["evictions"], 1)
+
+        # An evicted model is loaded again on its next request
+        self.assertEqual(self.registry.get(b), "b")
+        self.assertEqual(self.loads.count("b.pkl"), 2)
+        self.assertIsNotNone(self.registry.version(default))
+
+    def test_stats_name_models_without_their_location(self):
+        path = self.write("a.pkl", "v1")
+        self.registry.get(path, pin=True)
+        (model,) = self.registry.stats()["models"]
+        self.assertEqual(model["model"], "a.pkl")
+        self.assertTrue(model["pinned"])
+        self.assertNotIn(self.dir, json.dumps(self.registry.stats()))
+
+
+class MetricsViewTests(SimpleTestCase):
+    def get(self, user):
+        request = RequestFactory().get("/api/metrics/")
+        request.user = user
+        return get_metrics(request)
+
+    def test_requires_staff(self):
+        self.assertEqual(self.get(AnonymousUser()).status_code, 403)
+        user = SimpleNamespace(is_authenticated=True, is_staff=False)
+        self.assertEqual(self.get(user).status_code, 403)
+
+    def test_staff_get_the_metrics(self):
+        staff = SimpleNamespace(is_authenticated=True, is_staff=True)
+        response = self.get(staff)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("model_registry", json.loads(response.content))
+
+
+SOIL = {"nitrogen": 90, "phosphorus": 42, "potassium": 43, "ph": 6.51}
+ENV = {"temperature": 20.8, "rainfall": 202.9, "humidity": 82.0}
+
+
+class PredictionCacheTests(SimpleTestCase):
+    def test_inputs_within_the_precision_share_a_key(self):
+        cache = PredictionCache(precision={"pH": 0.05, "temperature": 0.5})
+        base = np.array([90, 42, 43, 6.51, 20.8, 202.9, 82.0])
+        close = base + [0.3, -0.2, 0.1, 0.01, 0.1, 0.3, -0.4]
+        self.assertEqual(cache.quantize(base), cache.quantize(close))
+        for i, step in enumerate([1, 1, 1, 0.05, 0.5, 1, 1]):
+            moved = base.copy()
+            moved[i] += step
+            self.assertNotEqual(cache.quantize(base), cache.quantize(moved))
+
+    def test_entries_expire_after_the_ttl(self):
+        cache = PredictionCache(ttl=10)
+        with mock.patch("ml.cache.time.monotonic", return_value=100.0):
+            cache.set("k", "v")
+        with mock.patch("ml.cache.time.monotonic", return_value=109.9):
+            self.assertEqual(cache.get("k"), "v")
+        with mock.patch("ml.cache.time.monotonic", return_value=110.0):
+            self.assertIsNone(cache.get("k"))
+        self.assertEqual(cache.stats()["expirations"], 1)
+
+    def test_evicts_the_least_recently_used_entry(self):
+        cache = PredictionCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_cleared_when_the_registry_swaps_a_model(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "default_model.pkl")
+        with open(path, "w") as f:
+            f.write("v1")
+
+        cache = PredictionCache()
+        registry = ModelRegistry(loader=lambda path: "model")
+        registry.add_listener(cache.on_model_swapped)
+        registry.get(path)
+        cache.set("k", "v")
+        registry.get(path)
+        self.assertEqual(cache.get("k"), "v")
+
+        with open(path, "w") as f:
+            f.write("v2 is longer")
+        registry.get(path)
+        self.assertIsNone(cache.get("k"))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+
+class CachedPredictionTests(SimpleTestCase):
+    def setUp(self):
+        self.built = []
+        self.entry = SimpleNamespace(model="model", version="v1")
+        for target, value in (
+            ("prediction_cache", PredictionCache()),
+            ("build_prediction", self.build_prediction),
+            ("load_default_model_entry", lambda tier: self.entry),
+        ):
+            patcher = mock.patch.object(prediction, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def build_prediction(self, features, model):
+        self.built.append(features.tolist())
+        return {"features": features.tolist()}
+
+    def predict(self, soil=SOIL, env=ENV):
+        return prediction.predict_with_tier(soil, env, "accurate")
+
+    def test_predicts_on_raw_inputs_and_shares_within_the_precision(self):
+        first = self.predict()
+        self.assertEqual(first["features"], [90, 42, 43, 6.51, 20.8, 202.9, 82.0])
+        # Within every step of the first sample: served the first response
+        second = self.predict({**SOIL, "ph": 6.52, "nitrogen": 90.2})
+        self.assertEqual(second, first)
+        self.assertEqual(len(self.built), 1)
+
+        third = self.predict({**SOIL, "ph": 6.6})
+        self.assertEqual(third["features"][3], 6.6)
+        self.assertEqual(len(self.built), 2)
+
+    def test_a_new_model_version_misses(self):
+        self.predict()
+        self.entry = SimpleNamespace(model="model", version="v2")
+        self.predict()
+        self.assertEqual(len(self.built), 2)
+
+
+def baseline_rule_ranking(requirements, input_data):
+    """get_crops_for_conditions before RuleEngine: a per-crop, per-parameter loop"""
+    crop_matches = []
+    for crop, crop_requirements in requirements.items():
+        match_score = 0
+        total_weights = 0
+        for param, (min_val, max_val) in crop_requirements.items():
+            if param in input_data:
+                value = input_data[param]
+                if min_val <= value <= max_val:
+                    match_score += 1
+                else:
+                    diff = min_val - value if value < min_val else value - max_val
+                    match_score += max(0, 1 - (diff / (max_val - min_val)))
+                total_weights += 1
+        confidence = match_score / total_weights if total_weights > 0 else 0
+        crop_matches.append({"crop": crop, "confidence": confidence})
+    return sorted(crop_matches, key=lambda x: x["confidence"], reverse=True)
+
+
+class RuleEngineTests(SimpleTestCase):
+    def samples(self, n=200):
+        rng = np.random.default_rng(6)
+        low = [0, 0, 0, 3.5, 5, 100, 10]
+        high = [200, 100, 250, 9.0, 45, 2500, 100]
+        samples = [dict(zip(FEATURES, row)) for row in rng.uniform(low, high, (n, 7))]
+        # Values exactly on range bounds
+        for requirements in DEFAULT_CROP_REQUIREMENTS.values():
+            for bound in (0, 1):
+                sample = dict(samples[0])
+                sample.update({f: r[bound] for f, r in requirements.items()})
+                samples.append(sample)
+        return samples
+
+    def assert_matches_baseline(self, requirements, samples):
+        engine = RuleEngine.from_requirements(requirements)
+        scores = engine.score(samples)
+        rankings = engine.rank(samples)
+        for i, sample in enumerate(samples):
+            expected = baseline_rule_ranking(requirements, sample)
+            by_crop = {match["crop"]: match["confidence"] for match in expected}
+            np.testing.assert_allclose(
+                scores[i], [by_crop[crop] for crop in requirements], rtol=0, atol=1e-12
+            )
+            self.assertEqual(
+                [match["crop"] for match in rankings[i]],
+                [match["crop"] for match in expected],
+            )
+
+    def test_matches_the_baseline_scorer(self):
+        self.assert_matches_baseline(DEFAULT_CROP_REQUIREMENTS, self.samples())
+
+    def test_crops_without_some_requirements_average_only_theirs(self):
+        requirements = {
+            "only_n": {"N": (40, 80)},
+            "soil": {"N": (60, 100), "pH": (6.0, 7.0)},
+            "climate": {"temperature": (20, 30), "rainfall": (500, 900)},
+        }
+        engine = RuleEngine.from_requirements(requirements)
+        self.assertEqual(engine._mask.sum(axis=1).tolist(), [1, 2, 2])
+        self.assert_matches_baseline(requirements, self.samples())
+
+    def test_crop_without_requirements_scores_zero(self):
+        engine = RuleEngine.from_requirements({"none": {}, "n": {"N": (0, 10)}})
+        scores = engine.score([dict(zip(FEATURES, [5, 0, 0, 7, 20, 500, 50]))])
+        self.assertEqual(scores.tolist(), [[0.0, 1.0]])
+
+    def test_zero_width_range(self):
+        engine = RuleEngine.from_requirements({"exact": {"pH": (6.5, 6.5)}})
+        base = dict(zip(FEATURES, [50, 50, 50, 6.5, 20, 500, 50]))
+        inside = engine.score([base])
+        outside = engine.score([{**base, "pH": 6.6}, {**base, "pH": 6.4}])
+        self.assertEqual(inside.tolist(), [[1.0]])
+        self.assertEqual(outside.tolist(), [[0.0], [0.0]])
+
+
+# The training features of make_dataset are integers in [0, 5]
+LOOKUP_BOUNDS = {feature: (0.0, 6.0) for feature in FEATURES}
+
+
+def build_small_grid(model, **kwargs):
+    options = dict(
+        bounds=LOOKUP_BOUNDS,
+        coarse_bins=2,
+        max_depth=14,
+        probes=8,
+        max_splits=2048,
+        split_batch=256,
+        validation_samples=5000,
+        seed=0,
+    )
+    return build_lookup_grid(model, **{**options, **kwargs})
+
+
+def uniform_samples(n, seed):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(0.0, 6.0, (n, len(FEATURES)))
+
+
+class LookupGridTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.model, _ = make_crop_model()
+        cls.grid = build_small_grid(cls.model, max_error_rate=1.0)
+
+    def test_wilson_bound(self):
+        self.assertEqual(disagreement_bound(0, 0), 1.0)
+        self.assertGreater(disagreement_bound(0, 100), 0.0)
+        self.assertLess(disagreement_bound(0, 10000), disagreement_bound(0, 100))
+        for errors, n in ((1, 10), (5, 100), (50, 1000), (1000, 1000)):
+            bound = disagreement_bound(errors, n)
+            self.assertGreaterEqual(bound, errors / n)
+            self.assertLessEqual(bound, 1.0)
+
+    def test_refinement_covers_more_of_the_box(self):
+        coarse = build_small_grid(self.model, max_splits=0)
+        self.assertEqual(coarse.stats()["refined_cells"], 0)
+        stats = self.grid.stats()
+        self.assertGreater(stats["refined_cells"], 0)
+        self.assertGreater(self.grid.depth, 0)
+
+        X = uniform_samples(5000, seed=1)
+        self.assertGreater(
+            measure_grid_error(self.grid, self.model, X)["coverage"],
+            measure_grid_error(coarse, self.model, X)["coverage"],
+        )
+
+    def test_agrees_with_the_model_within_the_stated_bound(self):
+        measured = self.grid.error["uniform"]
+        self.assertEqual(measured["samples"], 5000)
+        self.assertGreaterEqual(measured["top1_error_bound"], measured["top1_error"])
+
+        # Fresh samples, not the ones the error was measured on
+        X = uniform_samples(20000, seed=2)
+        results = self.grid.predict_batch(X)
+        covered = [row for row, result in enumerate(results) if result is not None]
+        self.assertTrue(covered)
+        expected = self.model.predict_batch(X[covered])
+        disagree = sum(
+            results[row]["top_crop"]["crop"] != match["top_crop"]["crop"]
+            for row, match in zip(covered, expected)
+        )
+        self.assertLessEqual(disagree / len(covered), measured["top1_error_bound"])
+
+    def test_predict_with_lookup_falls_back_to_the_model(self):
+        X = uniform_samples(2000, seed=3)
+        # Rows outside the box are always answered by the model
+        X[:100, 0] = 7.0
+        self.model.lookup_grid = self.grid
+        try:
+            results = predict_with_lookup(self.model, X)
+        finally:
+            self.model.lookup_grid = None
+        expected = self.model.predict_batch(X)
+
+        from_grid = self.grid.locate(X) >= 0
+        self.assertFalse(from_grid[:100].any())
+        for row in np.flatnonzero(~from_grid):
+            self.assertEqual(results[row], expected[row])
+        for row in np.flatnonzero(from_grid):
+            self.assertEqual(len(results[row]["crop_matches"]), 5)
+
+    def test_error_gate_decides_what_is_served(self):
+        rejected = build_small_grid(self.model, max_splits=0, max_error_rate=0.0)
+        self.assertTrue(self.grid.accepted)
+        self.assertFalse(rejected.accepted)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            model_path = os.path.join(tmp, "model.pkl")
+            with open(model_path, "wb") as f:
+                f.write(b"model")
+            with self.settings(ML_LOOKUP_GRID={"enabled": True}):
+                for grid, served in ((self.grid, True), (rejected, False)):
+                    save_lookup_grid(grid, model_path)
+                    attach_lookup_grid(self.model, model_path)
+                    self.assertEqual(self.model.lookup_grid is not None, served)
+            self.model.lookup_grid = None
+
+    def test_stale_checksum_refuses_the_grid(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            model_path = os.path.join(tmp, "model.pkl")
+            with open(model_path, "wb") as f:
+                f.write(b"model v1")
+            save_lookup_grid(self.grid, model_path)
+
+            loaded = load_lookup_grid(model_path, use_mmap=False)
+            X = uniform_samples(1000, seed=4)
+            np.testing.assert_array_equal(loaded.locate(X), self.grid.locate(X))
+            self.assertEqual(loaded.error, self.grid.error)
+
+            with open(model_path, "wb") as f:
+                f.write(b"model v2")
+            self.assertIsNone(load_lookup_grid(model_path, use_mmap=False))
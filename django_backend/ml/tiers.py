@@ -0,0 +1,408 @@
+import copy
+import json
+import multiprocessing
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+from sklearn.ensemble import RandomForestClassifier
+
+from .artifacts import is_model_artifact, model_checksum
+from .batching import LATENCY_BUCKETS_MS, Histogram
+from .executor import summarize_latencies
+from .features import feature_matrix
+from .models import CropModel
+from .registry import file_signature
+
+# Model variants trained together, from most accurate to fastest
+TIERS = ("accurate", "balanced", "fast")
+DEFAULT_TIER = "accurate"
+
+# Record of the tiers trained with a model, inside its artifact directory
+TIERS_FILE = "tiers.json"
+TIERS_EXTENSION = ".tiers.json"
+
+
+def tier_model_path(model_path, tier):
+    """Return the path of a tier's model, next to the accurate model at model_path"""
+    if tier == DEFAULT_TIER:
+        return model_path
+    base, extension = os.path.splitext(model_path)
+    return f"{base}_{tier}{extension}"
+
+
+def tiers_path_for(model_path):
+    """Return where the record of a model file's or artifact's tiers is stored"""
+    if is_model_artifact(model_path):
+        return os.path.join(model_path, TIERS_FILE)
+    return model_path + TIERS_EXTENSION
+
+
+def save_tier_record(model_path, tiers):
+    """
+    Record which tier models were trained with the model at model_path.
+
+    The record holds the checksums of the model and of each tier's model, so
+    a tier left over from an earlier training run is never served with it.
+    """
+    from .catalog import write_json_atomic
+
+    checksums = {}
+    for tier in tiers:
+        tier_path = tier_model_path(model_path, tier)
+        if os.path.exists(tier_path):
+            checksums[tier] = model_checksum(tier_path)
+    write_json_atomic(
+        tiers_path_for(model_path),
+        {"checksum": model_checksum(model_path), "tiers": checksums},
+    )
+
+
+# (model path, tier) -> (file signatures, whether the tier is current)
+_tier_checks = {}
+
+
+def tier_is_current(model_path, tier):
+    """
+    True if the tier model next to model_path was trained with that model.
+
+    Checksums are only computed again when the model, the tier model or the
+    tier record changes on disk.
+    """
+    if tier == DEFAULT_TIER:
+        return True
+    tier_path = tier_model_path(model_path, tier)
+    record_path = tiers_path_for(model_path)
+    signatures = (
+        file_signature(model_path),
+        file_signature(tier_path),
+        file_signature(record_path),
+    )
+    if None in signatures:
+        return False
+    cached = _tier_checks.get((model_path, tier))
+    if cached is not None and cached[0] == signatures:
+        return cached[1]
+
+    try:
+        with open(record_path, "r") as f:
+            record = json.load(f)
+        checksums = record.get("tiers", {})
+        current = (
+            record.get("checksum") == model_checksum(model_path)
+            and checksums.get(tier) == model_checksum(tier_path)
+        )
+    except Exception as e:
+        print(f"Error reading tier record {record_path}: {str(e)}")
+        current = False
+    if not current:
+        print(f"Not serving {tier_path}: it was not trained with {model_path}")
+    _tier_checks[(model_path, tier)] = (signatures, current)
+    return current
+
+
+def is_tier_model_id(model_id):
+    """True for the id of a balanced or fast variant rather than a trained model"""
+    return any(model_id.endswith(f"_{tier}") for tier in TIERS[1:])
+
+
+def train_balanced_model(model, X_train, y_train, n_estimators=20, max_depth=12):
+    """
+    Train a smaller ensemble of the same algorithm on the same data.
+
+    Returns:
+        CropModel: The balanced tier, or None if training failed
+    """
+    balanced = CropModel(
+        algorithm=model.algorithm, n_estimators=n_estimators, max_depth=max_depth
+    )
+    balanced.label_encoder.fit(model.fitted_labels)
+    balanced.fitted_labels = model.fitted_labels
+    if not balanced.train(X_train, y_train):
+        return None
+    return balanced
+
+
+def distill_tree(teacher, X_train, max_depth=8, samples=20000, seed=42):
+    """
+    Distill a model into a single decision tree.
+
+    The tree is fitted to the teacher's predictions on the training samples
+    and on random samples spread over their range, so it also follows the
+    teacher away from the training data. It is stored as a one-tree random
+    forest, which every serving path (compiled evaluator, artifacts, bundles)
+    already supports.
+
+    Returns:
+        CropModel: The fast tier, sharing the teacher's encoder and scaler
+    """
+    X = feature_matrix(X_train, teacher.features)
+    rng = np.random.default_rng(seed)
+    low, high = X.min(axis=0), X.max(axis=0)
+    X_fit = np.vstack([X, low + rng.random((samples, X.shape[1])) * (high - low)])
+    names = teacher.get_class_names()[teacher.predict_proba(X_fit).argmax(axis=1)]
+
+    student = copy.copy(teacher)
+    student.algorithm = "random_forest"
+    student.n_estimators = 1
+    student.max_depth = max_depth
+    student.compiled = None
+    student.inference_backend = "native"
+    student.model = RandomForestClassifier(
+        n_estimators=1,
+        bootstrap=False,
+        max_features=None,
+        max_depth=max_depth,
+        random_state=seed,
+    )
+    student.model.fit(teacher.scale(X_fit), teacher.label_encoder.transform(names))
+    student.class_names = student._build_class_names()
+    return student
+
+
+def evaluate_tier(model, X_test, y_test, reference=None, latency_samples=200):
+    """
+    Measure a tier's accuracy and single-sample latency on the test split.
+
+    Args:
+        model (CropModel): Tier to evaluate
+        X_test (pd.DataFrame): Test features
+        y_test (pd.Series): Test crop names
+        reference (np.ndarray): Crops predicted by the accurate tier, to report
+            how often this tier agrees with it
+        latency_samples (int): Test rows timed one prediction at a time
+
+    Returns:
+        tuple: (metrics dict, predicted crop names)
+    """
+    X = feature_matrix(X_test, model.features)
+    predicted = model.get_class_names()[model.predict_proba(X).argmax(axis=1)]
+    metrics = {
+        "accuracy": float(np.mean(predicted == y_test.str.lower().to_numpy())),
+        "n_estimators": getattr(model, "n_estimators", None),
+        "max_depth": getattr(model, "max_depth", None),
+    }
+    if reference is not None:
+        metrics["agreement"] = float(np.mean(predicted == reference))
+
+    seconds = []
+    for row in X[:latency_samples]:
+        start = time.perf_counter()
+        model.predict(row)
+        seconds.append(time.perf_counter() - start)
+    latency = summarize_latencies(np.array(seconds, dtype=np.float64))
+    metrics["latency_ms"] = latency
+    metrics["p50_ms"] = latency.get("p50")
+    metrics["p99_ms"] = latency.get("p99")
+    return metrics, predicted
+
+
+def train_tier_models(model, X_train, y_train, X_test, y_test, config=None):
+    """
+    Derive the balanced and fast tiers of a trained model and measure all three.
+
+    Args:
+        model (CropModel): The trained, accurate model
+        config (dict): ML_MODEL_TIERS-style options for the derived tiers
+
+    Returns:
+        tuple: ({tier: CropModel} for the derived tiers, {tier: metrics} for all)
+    """
+    config = config or {}
+    balanced_config = config.get("balanced", {})
+    fast_config = config.get("fast", {})
+    latency_samples = config.get("latency_samples", 200)
+
+    metrics = {}
+    metrics["accurate"], reference = evaluate_tier(
+        model, X_test, y_test, latency_samples=latency_samples
+    )
+
+    models = {}
+    balanced = train_balanced_model(
+        model,
+        X_train,
+        y_train,
+        n_estimators=balanced_config.get("n_estimators", 20),
+        max_depth=balanced_config.get("max_depth", 12),
+    )
+    if balanced is not None:
+        models["balanced"] = balanced
+    models["fast"] = distill_tree(
+        model,
+        X_train,
+        max_depth=fast_config.get("max_depth", 8),
+        samples=fast_config.get("distill_samples", 20000),
+    )
+
+    for tier, tier_model in models.items():
+        metrics[tier], _ = evaluate_tier(
+            tier_model,
+            X_test,
+            y_test,
+            reference=reference,
+            latency_samples=latency_samples,
+        )
+    return models, metrics
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SharedInFlight:
+    """
+    Count of predictions in flight across every process forked from this one.
+
+    The counters live in shared memory created at import, so with gunicorn's
+    preload_app (the shipped default) every worker counts into the same
+    table; without it each worker only sees its own predictions. Each
+    process counts in its own slot, claimed on its first prediction, and a
+    slot whose process has died is reclaimed by the next process that needs
+    one, so a worker killed mid-request does not stay counted for good.
+    """
+
+    def __init__(self, slots=256):
+        self._pids = multiprocessing.RawArray("q", slots)
+        self._counts = multiprocessing.RawArray("q", slots)
+        self._claim_lock = multiprocessing.Lock()
+        self._lock = threading.Lock()
+        self._slot = None
+        self._slot_pid = None
+
+    def add(self, delta):
+        """Add delta to this process's count"""
+        with self._lock:
+            slot = self._own_slot()
+            if slot is not None:
+                self._counts[slot] += delta
+
+    def total(self):
+        """Predictions in flight in all processes"""
+        return int(np.frombuffer(self._counts, dtype=np.int64).sum())
+
+    def _own_slot(self):
+        pid = os.getpid()
+        if self._slot_pid == pid:
+            return self._slot
+        slot = None
+        with self._claim_lock:
+            for candidate, owner in enumerate(self._pids):
+                if owner == 0 or not process_alive(owner):
+                    self._pids[candidate] = pid
+                    self._counts[candidate] = 0
+                    slot = candidate
+                    break
+        if slot is None:
+            print("No free in-flight slot; this process's load is not counted")
+        self._slot, self._slot_pid = slot, pid
+        return slot
+
+
+class TierSelector:
+    """
+    Picks the model tier of each prediction and keeps per-tier statistics.
+
+    A request that names a tier gets it. Otherwise it is served by the
+    accurate tier, unless auto is on and the server is under load. The load
+    signal is the number of predictions in flight in all the server's worker
+    processes (see SharedInFlight), not counting the new one. Sync workers
+    serve one request at a time, so it is the number of other busy workers:
+    from balanced_at of them new requests go to the balanced tier, and from
+    fast_at to the fast one.
+    """
+
+    def __init__(self, auto=False, balanced_at=2, fast_at=3):
+        self.auto = auto
+        self.balanced_at = balanced_at
+        self.fast_at = fast_at
+        self.server_in_flight = SharedInFlight()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._requests = dict.fromkeys(TIERS, 0)
+        self._auto_selected = dict.fromkeys(TIERS, 0)
+        self.latency_ms = {tier: Histogram(LATENCY_BUCKETS_MS) for tier in TIERS}
+
+    @classmethod
+    def from_settings(cls):
+        config = getattr(settings, "ML_MODEL_TIERS", {})
+        return cls(
+            auto=config.get("auto", False),
+            balanced_at=config.get("balanced_at", 2),
+            fast_at=config.get("fast_at", 3),
+        )
+
+    def select(self, requested=None):
+        """
+        Return the tier a prediction should use.
+
+        Raises:
+            ValueError: If an unknown tier is requested
+        """
+        if requested:
+            if requested not in TIERS:
+                raise ValueError(f"tier must be one of: {', '.join(TIERS)}")
+            return requested
+        if not self.auto:
+            return DEFAULT_TIER
+
+        in_flight = self.server_in_flight.total()
+        if in_flight >= self.fast_at:
+            tier = "fast"
+        elif in_flight >= self.balanced_at:
+            tier = "balanced"
+        else:
+            tier = DEFAULT_TIER
+        with self._lock:
+            self._auto_selected[tier] += 1
+        return tier
+
+    @contextmanager
+    def track(self, tier):
+        """Count a prediction as in flight and record its latency under tier"""
+        with self._lock:
+            self._in_flight += 1
+            self._requests[tier] += 1
+        self.server_in_flight.add(1)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.latency_ms[tier].observe((time.perf_counter() - start) * 1000)
+            self.server_in_flight.add(-1)
+            with self._lock:
+                self._in_flight -= 1
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "auto": self.auto,
+                "balanced_at": self.balanced_at,
+                "fast_at": self.fast_at,
+                "in_flight": self._in_flight,
+                "server_in_flight": self.server_in_flight.total(),
+            }
+            requests = dict(self._requests)
+            auto_selected = dict(self._auto_selected)
+        stats["tiers"] = {
+            tier: {
+                "requests": requests[tier],
+                "auto_selected": auto_selected[tier],
+                "latency_ms": self.latency_ms[tier].snapshot(),
+            }
+            for tier in TIERS
+        }
+        return stats
+
+
+# Tier selection and statistics shared by this process's prediction views
+model_tiers = TierSelector.from_settings()
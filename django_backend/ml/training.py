@@ -13,13 +13,30 @@ import matplotlib.pyplot as plt
 import io
 import base64
 import json
+import uuid
+from datetime import datetime
 from django.conf import settings
 import pickle
 
+from .artifacts import (
+    ARTIFACT_EXTENSION,
+    is_model_artifact,
+    save_model_artifact,
+    verify_artifact,
+)
+from .bundle import bundle_path_for, export_model_bundle
+from .cascade import calibrate_cascade, save_cascade_calibration
+from .lookup import build_lookup_grid, lookup_grid_settings, save_lookup_grid
 from .models import CropModel
+from .registry import load_crop_model
+from .tiers import save_tier_record, tier_model_path, train_tier_models
 from .utils import load_dataset, preprocess_dataset, DATA_PATH, MODELS_PATH
 
 
+class TrainingCancelled(Exception):
+    """Raised by a train_model checkpoint to stop the training run"""
+
+
 # Add progress tracking
 def save_progress(model_id, stage, progress):
     """Save training progress to a JSON file"""
@@ -40,17 +57,61 @@ def save_progress(model_id, stage, progress):
         json.dump(progress_data, f)
 
 
-def train_model(algorithm, dataset_path):
+def save_model_atomic(model, path):
+    """Pickle a model to a temporary file and rename it into place"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(model, f)
+    os.replace(tmp_path, path)
+
+
+def save_model_files(model, model_path, default_model_path, metrics=None):
+    """
+    Write a model and the default model in the ML_MODEL_FORMAT format.
+
+    Pickled models also get a shared-memory bundle when ML_SERVE_MODEL_BUNDLES
+    is set.
+    """
+    if getattr(settings, "ML_MODEL_FORMAT", "artifact") == "artifact":
+        for path in (model_path, default_model_path):
+            save_model_artifact(model, path, metrics=metrics)
+        return
+
+    for path in (model_path, default_model_path):
+        save_model_atomic(model, path)
+
+    # Shared-memory bundles are written after the pickles, so
+    # serving_path() never prefers a bundle older than its pickle
+    if getattr(settings, "ML_SERVE_MODEL_BUNDLES", False):
+        try:
+            for path in (model_path, default_model_path):
+                export_model_bundle(model, bundle_path_for(path))
+        except Exception as e:
+            print(f"Error exporting model bundle: {str(e)}")
+
+
+def train_model(algorithm, dataset_path, checkpoint=None):
     """
     Train a crop recommendation model using the specified algorithm and dataset.
 
     Args:
         algorithm (str): The algorithm to use for training (random_forest or xgboost)
         dataset_path (str): Path to the dataset CSV file
+        checkpoint (callable, optional): Called with the name of each stage
+            before it starts; it raises TrainingCancelled to stop the run. No
+            checkpoint follows "saving", so the model files are never left
+            half written
+
+    Raises:
+        TrainingCancelled: If checkpoint stopped the run
 
     Returns:
         dict: Training results including model path and metrics
     """
+    if checkpoint is None:
+        checkpoint = lambda stage: None  # noqa: E731
+
     try:
         print(f"Starting training process with algorithm: {algorithm}")
         print(f"Loading dataset from: {dataset_path}")
@@ -104,12 +165,14 @@ def train_model(algorithm, dataset_path):
         )
 
         # Train model
+        checkpoint("model_training")
         print("Starting model training...")
         success = model.train(X_train, y_train)
         if not success:
             raise Exception("Model training failed in CropModel.train()")
 
         # Make predictions on test set
+        checkpoint("model_evaluation")
         print("Evaluating model performance...")
         X_test_scaled = model.scaler.transform(X_test)
         y_pred = model.model.predict(X_test_scaled)
@@ -138,32 +201,142 @@ def train_model(algorithm, dataset_path):
 
         # Save model
         print("Saving model...")
+        # Training jobs run in parallel: the suffix keeps ids started in the
+        # same microsecond apart
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        model_id = f"{algorithm}_{timestamp}_{uuid.uuid4().hex[:8]}"
         model_dir = os.path.join(settings.BASE_DIR, "ml", "models")
         os.makedirs(model_dir, exist_ok=True)
-        model_path = os.path.join(model_dir, "default_model.pkl")
 
-        # Save the model
-        with open(model_path, "wb") as f:
-            pickle.dump(model, f)
+        if getattr(settings, "ML_MODEL_FORMAT", "artifact") == "artifact":
+            extension = ARTIFACT_EXTENSION
+        else:
+            extension = ".pkl"
+        model_path = os.path.join(MODELS_PATH, f"{model_id}{extension}")
+        # Keep the default model used by generate_prediction in sync
+        default_model_path = os.path.join(model_dir, f"default_model{extension}")
+
+        tier_models, tier_metrics = {}, None
+        tiers_config = getattr(settings, "ML_MODEL_TIERS", {})
+        if tiers_config.get("enabled", False):
+            checkpoint("tier_training")
+            print("Training balanced and fast model tiers...")
+            try:
+                tier_models, tier_metrics = train_tier_models(
+                    model, X_train, y_train, X_test, y_test, config=tiers_config
+                )
+            except Exception as e:
+                print(f"Error training model tiers: {str(e)}")
+
+        # From here on the run writes the default model and is not interrupted
+        checkpoint("saving")
+        # The faster tiers are written before the accurate model, so a worker
+        # that sees the new default model also finds its tiers
+        if tier_models:
+            try:
+                for tier, tier_model in tier_models.items():
+                    save_model_files(
+                        tier_model,
+                        tier_model_path(model_path, tier),
+                        tier_model_path(default_model_path, tier),
+                        metrics={"tier": tier, **tier_metrics[tier]},
+                    )
+                print(f"Model tier metrics: {tier_metrics}")
+            except Exception as e:
+                print(f"Error saving model tiers: {str(e)}")
+                tier_models, tier_metrics = {}, None
+
+        save_model_files(
+            model,
+            model_path,
+            default_model_path,
+            metrics={
+                **metrics,
+                "feature_importance": feature_importance,
+                "tiers": tier_metrics,
+            },
+        )
+        # Tie the tiers to this model; tiers of an earlier run are never served
+        if tier_models:
+            tier_paths = [model_path, default_model_path]
+            if getattr(settings, "ML_SERVE_MODEL_BUNDLES", False):
+                tier_paths += [bundle_path_for(path) for path in tier_paths]
+            for path in tier_paths:
+                if os.path.exists(path):
+                    save_tier_record(path, tier_models)
 
         # Verify the saved model
         print("Verifying saved model...")
-        with open(model_path, "rb") as f:
-            saved_model = pickle.load(f)
-            if not isinstance(saved_model, CropModel):
-                raise Exception("Saved model is not a valid CropModel instance")
+        if is_model_artifact(model_path):
+            verify_artifact(model_path)
+        saved_model = load_crop_model(model_path)
+        if not isinstance(saved_model, CropModel):
+            raise Exception("Saved model is not a valid CropModel instance")
+
+        lookup_grid = None
+        if getattr(settings, "ML_LOOKUP_GRID", {}).get("enabled", False):
+            print("Building prediction lookup grid...")
+            try:
+                grid = build_lookup_grid(
+                    model,
+                    validation_X=X_test.to_numpy(dtype=np.float64),
+                    **lookup_grid_settings(),
+                )
+                grid_paths = [model_path, default_model_path]
+                if getattr(settings, "ML_SERVE_MODEL_BUNDLES", False):
+                    grid_paths += [bundle_path_for(path) for path in grid_paths]
+                for path in grid_paths:
+                    if os.path.exists(path):
+                        save_lookup_grid(grid, path)
+                lookup_grid = grid.stats()
+                print(f"Lookup grid error: {grid.error}")
+            except Exception as e:
+                print(f"Error building lookup grid: {str(e)}")
+
+        cascade = None
+        cascade_config = getattr(settings, "ML_CASCADE", {})
+        first_stage = cascade_config.get("first_stage", "fast")
+        if cascade_config.get("enabled", False) and first_stage in tier_models:
+            print("Calibrating cascade inference...")
+            try:
+                cascade = calibrate_cascade(
+                    tier_models[first_stage],
+                    model,
+                    X_test,
+                    y_test,
+                    target_agreement=cascade_config.get("target_agreement", 0.99),
+                    calibration_samples=cascade_config.get(
+                        "calibration_samples", 20000
+                    ),
+                )
+                cascade_paths = [model_path, default_model_path]
+                if getattr(settings, "ML_SERVE_MODEL_BUNDLES", False):
+                    cascade_paths += [bundle_path_for(path) for path in cascade_paths]
+                for path in cascade_paths:
+                    if os.path.exists(path):
+                        save_cascade_calibration(cascade, path, first_stage)
+                print(f"Cascade calibration: {cascade}")
+            except Exception as e:
+                print(f"Error calibrating cascade: {str(e)}")
 
         print("Training process completed successfully")
         return {
             "success": True,
+            "model_id": model_id,
             "model_path": model_path,
+            "default_model_path": default_model_path,
             "message": "Model trained and saved successfully",
             "metrics": {
                 "success": True,
                 **metrics,
                 "feature_importance": feature_importance,
+                "tiers": tier_metrics,
             },
+            "lookup_grid": lookup_grid,
+            "cascade": cascade,
         }
+    except TrainingCancelled:
+        raise
     except Exception as e:
         import traceback
 
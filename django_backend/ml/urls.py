@@ -13,4 +13,8 @@ urlpatterns = [
         name="get_model",
     ),
     path("predict/", views.predict, name="predict"),
+    path("metrics/", views.get_metrics, name="ml_metrics"),
+    path("ready/", views.get_readiness, name="ml_ready"),
+    path("icons/", views.list_icons, name="list_icons"),
+    path("icons/<str:icon_id>.svg", views.get_icon, name="get_icon"),
 ]
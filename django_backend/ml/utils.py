@@ -95,139 +95,149 @@ def preprocess_dataset(df, target_column="crop"):
     }
 
 
-def generate_crop_recommendations(crop_name, soil_params):
-    """Generate specific recommendations based on crop and soil parameters"""
-    # Map crop to general growing conditions
-    crop_conditions = {
-        "rice": {
-            "optimal_n": (70, 100),
-            "optimal_p": (30, 50),
-            "optimal_k": (60, 90),
-            "optimal_ph": (5.5, 6.5),
-            "temp_range": "22-30°C",
-            "rainfall": "150-300cm",
-            "growing_period": "90-120 days",
-        },
-        "wheat": {
-            "optimal_n": (80, 120),
-            "optimal_p": (40, 60),
-            "optimal_k": (70, 100),
-            "optimal_ph": (6.0, 7.5),
-            "temp_range": "15-24°C",
-            "rainfall": "45-65cm",
-            "growing_period": "120-150 days",
-        },
-        "maize": {
-            "optimal_n": (90, 140),
-            "optimal_p": (30, 50),
-            "optimal_k": (60, 90),
-            "optimal_ph": (5.8, 7.0),
-            "temp_range": "20-30°C",
-            "rainfall": "50-80cm",
-            "growing_period": "100-140 days",
-        },
-        "cotton": {
-            "optimal_n": (60, 100),
-            "optimal_p": (30, 50),
-            "optimal_k": (60, 90),
-            "optimal_ph": (6.0, 7.5),
-            "temp_range": "20-30°C",
-            "rainfall": "60-120cm",
-            "growing_period": "150-180 days",
-        },
-    }
-
-    # Default values if crop not found
-    default_conditions = {
+# General growing conditions per crop
+CROP_CONDITIONS = {
+    "rice": {
         "optimal_n": (70, 100),
-        "optimal_p": (30, 60),
-        "optimal_k": (60, 100),
-        "optimal_ph": (6.0, 7.0),
-        "temp_range": "20-30°C",
-        "rainfall": "50-100cm",
+        "optimal_p": (30, 50),
+        "optimal_k": (60, 90),
+        "optimal_ph": (5.5, 6.5),
+        "temp_range": "22-30°C",
+        "rainfall": "150-300cm",
         "growing_period": "90-120 days",
-    }
+    },
+    "wheat": {
+        "optimal_n": (80, 120),
+        "optimal_p": (40, 60),
+        "optimal_k": (70, 100),
+        "optimal_ph": (6.0, 7.5),
+        "temp_range": "15-24°C",
+        "rainfall": "45-65cm",
+        "growing_period": "120-150 days",
+    },
+    "maize": {
+        "optimal_n": (90, 140),
+        "optimal_p": (30, 50),
+        "optimal_k": (60, 90),
+        "optimal_ph": (5.8, 7.0),
+        "temp_range": "20-30°C",
+        "rainfall": "50-80cm",
+        "growing_period": "100-140 days",
+    },
+    "cotton": {
+        "optimal_n": (60, 100),
+        "optimal_p": (30, 50),
+        "optimal_k": (60, 90),
+        "optimal_ph": (6.0, 7.5),
+        "temp_range": "20-30°C",
+        "rainfall": "60-120cm",
+        "growing_period": "150-180 days",
+    },
+}
+
+# Default values if crop not found
+DEFAULT_CONDITIONS = {
+    "optimal_n": (70, 100),
+    "optimal_p": (30, 60),
+    "optimal_k": (60, 100),
+    "optimal_ph": (6.0, 7.0),
+    "temp_range": "20-30°C",
+    "rainfall": "50-100cm",
+    "growing_period": "90-120 days",
+}
+
+# Soil parameters scored against each crop: (condition key, soil_params key,
+# value used when the parameter is missing, display name, unit)
+SOIL_PARAMETERS = (
+    ("optimal_n", "nitrogen", 0, "Nitrogen", "kg/ha"),
+    ("optimal_p", "phosphorus", 0, "Phosphorus", "kg/ha"),
+    ("optimal_k", "potassium", 0, "Potassium", "kg/ha"),
+    ("optimal_ph", "ph", 7.0, "pH Level", ""),
+)
 
-    # Get conditions for the crop (use default if not found)
-    conditions = crop_conditions.get(crop_name.lower(), default_conditions)
+# Recommendation codes; each one indexes a (below, above, within) text tuple
+RECOMMEND_BELOW = 0
+RECOMMEND_ABOVE = 1
+RECOMMEND_WITHIN = 2
 
-    # Generate recommendations based on soil parameters
-    recommendations = []
 
-    # Nitrogen recommendation
-    n_value = soil_params.get("nitrogen", 0)
-    if n_value < conditions["optimal_n"][0]:
-        recommendations.append(
-            f"Increase nitrogen application to reach optimal level ({conditions['optimal_n'][0]}-{conditions['optimal_n'][1]} kg/ha) for {crop_name}. Consider using nitrogen-rich fertilizers."
-        )
-    elif n_value > conditions["optimal_n"][1]:
-        recommendations.append(
-            f"Reduce nitrogen application to optimal level ({conditions['optimal_n'][0]}-{conditions['optimal_n'][1]} kg/ha) for {crop_name} to prevent excessive vegetative growth."
-        )
-    else:
-        recommendations.append(
-            f"Maintain current nitrogen levels which are within the optimal range for {crop_name}."
-        )
+def get_crop_conditions(crop_name):
+    """Return the growing conditions for a crop (use default if not found)"""
+    return CROP_CONDITIONS.get(crop_name.lower(), DEFAULT_CONDITIONS)
 
-    # Phosphorus recommendation
-    p_value = soil_params.get("phosphorus", 0)
-    if p_value < conditions["optimal_p"][0]:
-        recommendations.append(
-            f"Increase phosphorus application to reach optimal level ({conditions['optimal_p'][0]}-{conditions['optimal_p'][1]} kg/ha) for {crop_name}. This will improve root development and flowering."
-        )
-    elif p_value > conditions["optimal_p"][1]:
-        recommendations.append(
-            f"Reduce phosphorus application to optimal level ({conditions['optimal_p'][0]}-{conditions['optimal_p'][1]} kg/ha) for {crop_name}."
-        )
-    else:
-        recommendations.append(
-            f"Maintain current phosphorus levels which are within the optimal range for {crop_name}."
-        )
 
-    # Potassium recommendation
-    k_value = soil_params.get("potassium", 0)
-    if k_value < conditions["optimal_k"][0]:
-        recommendations.append(
-            f"Increase potassium application to reach optimal level ({conditions['optimal_k'][0]}-{conditions['optimal_k'][1]} kg/ha) for {crop_name}. This will improve disease resistance and water regulation."
-        )
-    elif k_value > conditions["optimal_k"][1]:
-        recommendations.append(
-            f"Reduce potassium application to optimal level ({conditions['optimal_k'][0]}-{conditions['optimal_k'][1]} kg/ha) for {crop_name}."
-        )
-    else:
-        recommendations.append(
-            f"Maintain current potassium levels which are within the optimal range for {crop_name}."
-        )
+def build_recommendation_texts(crop_name, conditions):
+    """
+    Build every recommendation sentence that can be given for a crop.
 
-    # pH recommendation
-    ph_value = soil_params.get("ph", 7.0)
-    if ph_value < conditions["optimal_ph"][0]:
-        recommendations.append(
-            f"Apply agricultural lime to increase soil pH to the optimal range ({conditions['optimal_ph'][0]}-{conditions['optimal_ph'][1]}) for {crop_name}."
-        )
-    elif ph_value > conditions["optimal_ph"][1]:
-        recommendations.append(
-            f"Apply elemental sulfur or acidifying amendments to decrease soil pH to the optimal range ({conditions['optimal_ph'][0]}-{conditions['optimal_ph'][1]}) for {crop_name}."
-        )
-    else:
-        recommendations.append(
-            f"Maintain current soil pH which is within the optimal range for {crop_name}."
-        )
+    Returns:
+        tuple: ({soil_params key: (below, above, within) text}, general texts)
+    """
+    n_min, n_max = conditions["optimal_n"]
+    p_min, p_max = conditions["optimal_p"]
+    k_min, k_max = conditions["optimal_k"]
+    ph_min, ph_max = conditions["optimal_ph"]
+
+    parameter_texts = {
+        "nitrogen": (
+            f"Increase nitrogen application to reach optimal level ({n_min}-{n_max} kg/ha) for {crop_name}. Consider using nitrogen-rich fertilizers.",
+            f"Reduce nitrogen application to optimal level ({n_min}-{n_max} kg/ha) for {crop_name} to prevent excessive vegetative growth.",
+            f"Maintain current nitrogen levels which are within the optimal range for {crop_name}.",
+        ),
+        "phosphorus": (
+            f"Increase phosphorus application to reach optimal level ({p_min}-{p_max} kg/ha) for {crop_name}. This will improve root development and flowering.",
+            f"Reduce phosphorus application to optimal level ({p_min}-{p_max} kg/ha) for {crop_name}.",
+            f"Maintain current phosphorus levels which are within the optimal range for {crop_name}.",
+        ),
+        "potassium": (
+            f"Increase potassium application to reach optimal level ({k_min}-{k_max} kg/ha) for {crop_name}. This will improve disease resistance and water regulation.",
+            f"Reduce potassium application to optimal level ({k_min}-{k_max} kg/ha) for {crop_name}.",
+            f"Maintain current potassium levels which are within the optimal range for {crop_name}.",
+        ),
+        "ph": (
+            f"Apply agricultural lime to increase soil pH to the optimal range ({ph_min}-{ph_max}) for {crop_name}.",
+            f"Apply elemental sulfur or acidifying amendments to decrease soil pH to the optimal range ({ph_min}-{ph_max}) for {crop_name}.",
+            f"Maintain current soil pH which is within the optimal range for {crop_name}.",
+        ),
+    }
 
     # General cultivation recommendations
-    recommendations.append(
-        f"Plant {crop_name} when soil temperature is suitable for germination. Optimal growing temperature range is {conditions['temp_range']}."
-    )
-    recommendations.append(
-        f"Ensure adequate irrigation, especially during critical growth stages. {crop_name} requires approximately {conditions['rainfall']} of water throughout its growing season."
-    )
-    recommendations.append(
-        f"The growing period for {crop_name} is typically {conditions['growing_period']}. Plan your cropping calendar accordingly."
+    general_texts = (
+        f"Plant {crop_name} when soil temperature is suitable for germination. Optimal growing temperature range is {conditions['temp_range']}.",
+        f"Ensure adequate irrigation, especially during critical growth stages. {crop_name} requires approximately {conditions['rainfall']} of water throughout its growing season.",
+        f"The growing period for {crop_name} is typically {conditions['growing_period']}. Plan your cropping calendar accordingly.",
     )
 
+    return parameter_texts, general_texts
+
+
+def select_recommendations(conditions, parameter_texts, general_texts, soil_params):
+    """Pick the recommendation for each soil parameter from prebuilt texts"""
+    recommendations = []
+    for condition_key, param, default, _, _ in SOIL_PARAMETERS:
+        value = soil_params.get(param, default)
+        optimal_min, optimal_max = conditions[condition_key]
+        below, above, within = parameter_texts[param]
+        if value < optimal_min:
+            recommendations.append(below)
+        elif value > optimal_max:
+            recommendations.append(above)
+        else:
+            recommendations.append(within)
+
+    recommendations.extend(general_texts)
     return recommendations
 
 
+def generate_crop_recommendations(crop_name, soil_params):
+    """Generate specific recommendations based on crop and soil parameters"""
+    conditions = get_crop_conditions(crop_name)
+    parameter_texts, general_texts = build_recommendation_texts(crop_name, conditions)
+    return select_recommendations(
+        conditions, parameter_texts, general_texts, soil_params
+    )
+
+
 def calculate_parameter_match(param_value, optimal_min, optimal_max):
     """Calculate how well a parameter matches the optimal range (0-100%)"""
     if optimal_min <= param_value <= optimal_max:
@@ -250,102 +260,178 @@ def calculate_parameter_match(param_value, optimal_min, optimal_max):
     return min(100, match_percent)
 
 
+def calculate_match_for_conditions(soil_params, conditions):
+    """Calculate overall and per-parameter match against given optimal ranges"""
+    match_params = []
+    overall_match = 0
+    for condition_key, param, default, name, unit in SOIL_PARAMETERS:
+        value = soil_params.get(param, default)
+        match = calculate_parameter_match(value, *conditions[condition_key])
+
+        # Overall match is an equally weighted average of the parameters
+        overall_match += match * 0.25
+        match_params.append(
+            {"name": name, "match": round(match), "value": value, "unit": unit}
+        )
+
+    return {"overall_match": round(overall_match), "parameters": match_params}
+
+
 def calculate_overall_match(soil_params, crop_name):
     """Calculate overall match percentage and individual parameter matches"""
-    # Get optimal conditions for the crop
-    crop_conditions = {
-        "rice": {
-            "optimal_n": (70, 100),
-            "optimal_p": (30, 50),
-            "optimal_k": (60, 90),
-            "optimal_ph": (5.5, 6.5),
-        },
-        "wheat": {
-            "optimal_n": (80, 120),
-            "optimal_p": (40, 60),
-            "optimal_k": (70, 100),
-            "optimal_ph": (6.0, 7.5),
-        },
-        "maize": {
-            "optimal_n": (90, 140),
-            "optimal_p": (30, 50),
-            "optimal_k": (60, 90),
-            "optimal_ph": (5.8, 7.0),
-        },
-        "cotton": {
-            "optimal_n": (60, 100),
-            "optimal_p": (30, 50),
-            "optimal_k": (60, 90),
-            "optimal_ph": (6.0, 7.5),
-        },
-        # Add more crops as needed
-    }
+    return calculate_match_for_conditions(soil_params, get_crop_conditions(crop_name))
 
-    # Default values if crop not found
-    default_conditions = {
-        "optimal_n": (70, 100),
-        "optimal_p": (30, 60),
-        "optimal_k": (60, 100),
-        "optimal_ph": (6.0, 7.0),
-    }
 
-    # Get conditions for the crop (use default if not found)
-    conditions = crop_conditions.get(crop_name.lower(), default_conditions)
+def get_recommendation_texts(crop_name):
+    """Return a crop's recommendation texts from its precomputed enrichment"""
+    # ml.enrichment builds on this module, so it is imported on first use
+    from .enrichment import crop_enrichment
 
-    # Calculate match percentages for each parameter
-    n_match = calculate_parameter_match(
-        soil_params.get("nitrogen", 0),
-        conditions["optimal_n"][0],
-        conditions["optimal_n"][1],
-    )
+    enrichment = crop_enrichment.get(crop_name)
+    return enrichment.parameter_texts, enrichment.general_texts
 
-    p_match = calculate_parameter_match(
-        soil_params.get("phosphorus", 0),
-        conditions["optimal_p"][0],
-        conditions["optimal_p"][1],
-    )
 
-    k_match = calculate_parameter_match(
-        soil_params.get("potassium", 0),
-        conditions["optimal_k"][0],
-        conditions["optimal_k"][1],
-    )
+def soil_matrix(soil_params):
+    """
+    Stack soil samples into an (n_samples, n_parameters) float array.
+
+    Args:
+        soil_params: List of soil_params dicts (missing parameters take the same
+            defaults as the scalar functions), or an array whose columns are
+            already in SOIL_PARAMETERS order
+
+    Returns:
+        np.ndarray: Array of shape (n_samples, len(SOIL_PARAMETERS))
+    """
+    if isinstance(soil_params, np.ndarray):
+        return np.ascontiguousarray(soil_params, dtype=np.float64).reshape(
+            -1, len(SOIL_PARAMETERS)
+        )
+    return np.array(
+        [
+            [sample.get(param, default) for _, param, default, _, _ in SOIL_PARAMETERS]
+            for sample in soil_params
+        ],
+        dtype=np.float64,
+    ).reshape(-1, len(SOIL_PARAMETERS))
 
-    ph_match = calculate_parameter_match(
-        soil_params.get("ph", 7.0),
-        conditions["optimal_ph"][0],
-        conditions["optimal_ph"][1],
+
+def optimal_range_table(crop_names):
+    """
+    Return the optimal soil ranges of several crops as arrays.
+
+    Returns:
+        tuple: (lower, upper) arrays of shape (len(crop_names), len(SOIL_PARAMETERS))
+    """
+    ranges = np.array(
+        [
+            [get_crop_conditions(crop_name)[key] for key, _, _, _, _ in SOIL_PARAMETERS]
+            for crop_name in crop_names
+        ],
+        dtype=np.float64,
+    ).reshape(len(crop_names), len(SOIL_PARAMETERS), 2)
+    return ranges[:, :, 0], ranges[:, :, 1]
+
+
+def calculate_match_batch(soil_params, crop_names):
+    """
+    Score N soil samples against K crops in one broadcasted computation.
+
+    Args:
+        soil_params: Samples accepted by soil_matrix()
+        crop_names (list): K crop names shared by every sample, or one list of
+            K crop names per sample (e.g. each sample's top-k predictions)
+
+    Returns:
+        MatchAnalysisBatch: Match percentages and recommendation codes of
+            shape (N, K, ...), rendered to dicts and text on demand
+    """
+    values = soil_matrix(soil_params)
+    n_samples = len(values)
+
+    names = np.array(crop_names, dtype=object)
+    if names.ndim == 1:
+        names = np.broadcast_to(names, (n_samples, len(names)))
+    if names.ndim != 2 or names.shape[0] != n_samples:
+        raise ValueError("crop_names must have one row per sample")
+
+    # Look up each distinct crop once, then gather its ranges into (N, K, P)
+    unique_names, crop_index = np.unique(names, return_inverse=True)
+    crop_index = crop_index.reshape(names.shape)
+    table_lower, table_upper = optimal_range_table(unique_names.tolist())
+    lower = table_lower[crop_index]
+    upper = table_upper[crop_index]
+
+    value = values[:, None, :]
+    half_width = (upper - lower) / 2
+    distance = np.where(value < lower, lower - value, value - upper)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        partial = 100 - (distance / half_width * 100)
+    within = (value >= lower) & (value <= upper)
+    matches = np.where(within, 100.0, np.clip(np.nan_to_num(partial), 0, 100))
+
+    # Same left-to-right accumulation as calculate_match_for_conditions
+    overall = np.zeros(names.shape, dtype=np.float64)
+    for p in range(len(SOIL_PARAMETERS)):
+        overall += matches[:, :, p] * 0.25
+
+    codes = np.full(matches.shape, RECOMMEND_WITHIN, dtype=np.int8)
+    codes[value < lower] = RECOMMEND_BELOW
+    codes[value > upper] = RECOMMEND_ABOVE
+
+    return MatchAnalysisBatch(
+        values=values,
+        crop_names=names,
+        matches=np.rint(matches).astype(np.int64),
+        overall=np.rint(overall).astype(np.int64),
+        codes=codes,
     )
 
-    # Calculate overall match (weighted average)
-    overall_match = n_match * 0.25 + p_match * 0.25 + k_match * 0.25 + ph_match * 0.25
-
-    # Format the result
-    match_params = [
-        {
-            "name": "Nitrogen",
-            "match": round(n_match),
-            "value": soil_params.get("nitrogen", 0),
-            "unit": "kg/ha",
-        },
-        {
-            "name": "Phosphorus",
-            "match": round(p_match),
-            "value": soil_params.get("phosphorus", 0),
-            "unit": "kg/ha",
-        },
-        {
-            "name": "Potassium",
-            "match": round(k_match),
-            "value": soil_params.get("potassium", 0),
-            "unit": "kg/ha",
-        },
-        {
-            "name": "pH Level",
-            "match": round(ph_match),
-            "value": soil_params.get("ph", 7.0),
-            "unit": "",
-        },
-    ]
 
-    return {"overall_match": round(overall_match), "parameters": match_params}
+class MatchAnalysisBatch:
+    """
+    Match analysis of N soil samples against K crops each.
+
+    matches (N, K, P) and overall (N, K) hold rounded percentages, and codes
+    (N, K, P) holds a RECOMMEND_* code per parameter. Nothing is turned into
+    Python dicts or recommendation sentences until a cell is rendered.
+    """
+
+    def __init__(self, values, crop_names, matches, overall, codes):
+        self.values = values
+        self.crop_names = crop_names
+        self.matches = matches
+        self.overall = overall
+        self.codes = codes
+
+    @property
+    def shape(self):
+        return self.overall.shape
+
+    def match_analysis(self, sample, crop):
+        """Render one cell in the format of calculate_match_for_conditions"""
+        matches = self.matches[sample, crop].tolist()
+        values = self.values[sample].tolist()
+        return {
+            "overall_match": int(self.overall[sample, crop]),
+            "parameters": [
+                {"name": name, "match": match, "value": value, "unit": unit}
+                for (_, _, _, name, unit), match, value in zip(
+                    SOIL_PARAMETERS, matches, values
+                )
+            ],
+        }
+
+    def recommendations(self, sample, crop):
+        """Render one cell in the format of generate_crop_recommendations"""
+        parameter_texts, general_texts = get_recommendation_texts(
+            self.crop_names[sample, crop]
+        )
+        recommendations = [
+            parameter_texts[param][code]
+            for (_, param, _, _, _), code in zip(
+                SOIL_PARAMETERS, self.codes[sample, crop].tolist()
+            )
+        ]
+        recommendations.extend(general_texts)
+        return recommendations
@@ -1,22 +1,50 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 import json
 import os
 import pickle
+from core.prediction_log import prediction_log
+from core.training_jobs import get_training_job, job_state
 from .models import CropModel
+from .artifacts import (
+    ARTIFACT_EXTENSION,
+    artifact_size,
+    is_model_artifact,
+    read_manifest,
+)
+from .batching import micro_batcher
+from .bundle import serving_path
+from .cache import prediction_cache
+from .cascade import model_cascades
+from .catalog import model_catalog
+from .executor import InferenceQueueFull, inference_executor
+from .features import FEATURES, feature_vector
+from .icons import ICONS, ICONS_VERSION, icon_url, render_svg_document
+from .memory import process_memory
+from .prediction import get_default_model_path
+from .registry import model_registry
+from .tiers import model_tiers
+from .warmup import warmup_state
 from .utils import MODELS_PATH, calculate_overall_match, generate_crop_recommendations
-import pandas as pd
 
 # Create your views here.
 
 
+def find_model_file(model_id):
+    """Return the artifact directory of a model, or its pickle if not converted"""
+    artifact_path = os.path.join(MODELS_PATH, f"{model_id}{ARTIFACT_EXTENSION}")
+    if is_model_artifact(artifact_path):
+        return artifact_path
+    return os.path.join(MODELS_PATH, f"{model_id}.pkl")
+
+
 @require_http_methods(["GET"])
 def get_model(request, model_id):
     """Get details for a specific model"""
     try:
-        model_file = os.path.join(MODELS_PATH, f"{model_id}.pkl")
+        model_file = find_model_file(model_id)
         progress_file = os.path.join(MODELS_PATH, f"{model_id}_progress.json")
         metrics_file = os.path.join(MODELS_PATH, f"{model_id}_metrics.json")
 
@@ -34,6 +62,13 @@ def get_model(request, model_id):
         if os.path.exists(metrics_file):
             with open(metrics_file, "r") as f:
                 metrics_data = json.load(f)
+        elif is_model_artifact(model_file):
+            # Artifacts record their evaluation metrics in the manifest
+            metrics = dict(read_manifest(model_file).get("metrics", {}))
+            metrics_data = {
+                "feature_importance": metrics.pop("feature_importance", []),
+                "metrics": metrics,
+            }
         else:
             # If metrics file doesn't exist, create default metrics
             metrics_data = {
@@ -53,7 +88,11 @@ def get_model(request, model_id):
             "algorithm": model_id.split("_")[0],
             "dataset": "_".join(model_id.split("_")[1:]),
             "created_at": os.path.getctime(model_file),
-            "file_size": os.path.getsize(model_file),
+            "file_size": (
+                artifact_size(model_file)
+                if os.path.isdir(model_file)
+                else os.path.getsize(model_file)
+            ),
             "progress": (
                 progress_data
                 if progress_data
@@ -69,13 +108,88 @@ def get_model(request, model_id):
         return JsonResponse({"error": str(e)}, status=500)
 
 
+@require_http_methods(["GET"])
+def get_metrics(request):
+    """
+    Get in-process serving metrics such as model registry hit/miss counts.
+
+    Staff only: the metrics describe the deployment (loaded models, memory,
+    queue depths) rather than anything a client needs.
+    """
+    if not request.user.is_staff:
+        return JsonResponse({"error": "Staff access required"}, status=403)
+    return JsonResponse(
+        {
+            "model_registry": model_registry.stats(),
+            "prediction_cache": prediction_cache.stats(),
+            "inference_executor": inference_executor.stats(),
+            "micro_batching": micro_batcher.stats(),
+            "process": process_memory(),
+            "lookup_grid": lookup_grid_stats(),
+            "model_tiers": model_tiers.stats(),
+            "cascade": model_cascades.stats(),
+            "prediction_log": prediction_log.stats(),
+            "model_catalog": {
+                "active": model_catalog.active_id,
+                "models": len(model_catalog.entries()),
+            },
+        }
+    )
+
+
+def lookup_grid_stats():
+    """Hit and error statistics of the default model's lookup grid, if served"""
+    entry = model_registry.peek(get_default_model_path())
+    grid = getattr(entry.model, "lookup_grid", None) if entry else None
+    return grid.stats() if grid is not None else None
+
+
+@require_http_methods(["GET"])
+def get_readiness(request):
+    """Readiness probe: 200 once this worker has warmed up, 503 until then"""
+    state = warmup_state.to_dict()
+    return JsonResponse(state, status=200 if state["ready"] else 503)
+
+
+@require_http_methods(["GET"])
+def list_icons(request):
+    """List the icon registry with the versioned URL of every icon"""
+    return JsonResponse(
+        {
+            "version": ICONS_VERSION,
+            "icons": {icon_id: icon_url(icon_id) for icon_id in ICONS},
+        }
+    )
+
+
+@require_http_methods(["GET"])
+def get_icon(request, icon_id):
+    """Serve one icon as an SVG document that clients may cache indefinitely"""
+    document = render_svg_document(icon_id)
+    if document is None:
+        return JsonResponse({"error": "Icon not found"}, status=404)
+
+    etag = f'"{ICONS_VERSION}"'
+    if request.headers.get("If-None-Match") == etag:
+        response = HttpResponse(status=304)
+    else:
+        response = HttpResponse(document, content_type="image/svg+xml")
+    response["ETag"] = etag
+    response["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+
 @require_http_methods(["GET"])
 def get_training_status(request, model_id):
-    """Get the training status for a specific model"""
+    """Get the training status for a training job, or for a model by id"""
     try:
+        job = get_training_job(model_id)
+        if job is not None:
+            return JsonResponse(job_state(job))
+
         # Check progress file
         progress_file = os.path.join(MODELS_PATH, f"{model_id}_progress.json")
-        model_file = os.path.join(MODELS_PATH, f"{model_id}.pkl")
+        model_file = find_model_file(model_id)
 
         if os.path.exists(model_file):
             return JsonResponse(
@@ -187,47 +301,60 @@ def get_training_status(request, model_id):
         )
 
 
+def load_and_predict(model_id, features):
+    """
+    Resolve a model in the catalog, load it through the registry and predict
+    one sample.
+
+    Returns:
+        tuple: (catalog entry or None, whether the model loaded, prediction)
+    """
+    entry = model_catalog.resolve(model_id)
+    if entry is None:
+        return None, False, None
+    model = model_registry.get(serving_path(entry["path"]))
+    if model is None:
+        return entry, False, None
+    return entry, True, micro_batcher.predict(model, features)
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
-def predict(request):
+async def predict(request):
     """Make crop prediction using the trained model"""
     try:
         # Get prediction data from request
         data = json.loads(request.body)
 
-        # Validate required fields
-        required_fields = ["N", "P", "K", "temperature", "humidity", "pH", "rainfall"]
-        missing_fields = [field for field in required_fields if field not in data]
-        if missing_fields:
+        # Validate and coerce the inputs straight to a feature vector
+        try:
+            features = feature_vector(data)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        input_data = dict(zip(FEATURES, features.tolist()))
+
+        # Resolve the requested model, or the active one, from the catalog. The
+        # catalog may have to read (and checksum) model files, and loading and
+        # inference are CPU-bound, so all of it stays off the event loop
+        model_id = data.get("model_id")
+        try:
+            entry, loaded, result = await inference_executor.run(
+                load_and_predict, model_id, features
+            )
+        except InferenceQueueFull as e:
+            return JsonResponse({"error": str(e)}, status=503)
+        if entry is None:
+            error = (
+                f"Model not found: {model_id}" if model_id else "No trained model found"
+            )
+            return JsonResponse({"error": error}, status=404)
+        if not loaded:
             return JsonResponse(
-                {"error": f"Missing required fields: {', '.join(missing_fields)}"},
-                status=400,
+                {"error": f"Model could not be loaded: {entry['id']}"}, status=503
             )
 
-        # Create DataFrame for prediction with correct column names
-        input_data = {
-            "N": float(data["N"]),
-            "P": float(data["P"]),
-            "K": float(data["K"]),
-            "pH": float(data["pH"]),
-            "temperature": float(data["temperature"]),
-            "rainfall": float(data["rainfall"]),
-            "humidity": float(data["humidity"]),
-        }
-        prediction_data = pd.DataFrame([input_data])
-
-        # Get the latest model
-        model_files = [f for f in os.listdir(MODELS_PATH) if f.endswith(".pkl")]
-        if not model_files:
-            return JsonResponse({"error": "No trained model found"}, status=404)
-
-        latest_model = max(
-            model_files, key=lambda x: os.path.getctime(os.path.join(MODELS_PATH, x))
-        )
-        model = CropModel.load(os.path.join(MODELS_PATH, latest_model))
-
-        # Make prediction
-        result = model.predict(prediction_data)
+        if result is None:
+            return JsonResponse({"error": "Model prediction failed"}, status=500)
 
         # Get top crop and matches
         top_crop = result["top_crop"]["crop"]
@@ -290,6 +417,7 @@ def predict(request):
         ]
 
         response_data = {
+            "model_id": entry["id"],
             "top_crop": {"crop": top_crop, "confidence": confidence},
             "crop_matches": crop_matches,
             "match_analysis": match_analysis,
@@ -0,0 +1,178 @@
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from .enrichment import crop_enrichment
+from .features import FEATURES, feature_matrix
+from .knowledge_base import crop_knowledge_base
+from .prediction import (
+    generate_prediction,
+    load_default_model_entry,
+    split_feature_params,
+)
+from .rules import get_rule_engine
+
+# Representative samples run through the pipeline when none are configured
+DEFAULT_WARMUP_SAMPLES = [
+    dict(zip(FEATURES, values))
+    for values in (
+        (90, 42, 43, 6.5, 21, 203, 82),
+        (100, 50, 80, 6.8, 19, 55, 60),
+        (120, 40, 75, 6.2, 25, 65, 65),
+        (80, 40, 75, 6.8, 27, 90, 70),
+    )
+]
+
+
+def warmup_enabled():
+    """Warm-up runs if ML_WARMUP["enabled"] is set or ML_WARMUP=1 in the environment"""
+    env = os.environ.get("ML_WARMUP")
+    if env is not None:
+        return env.lower() in ("1", "true", "yes")
+    return bool(getattr(settings, "ML_WARMUP", {}).get("enabled", False))
+
+
+class WarmupState:
+    """Progress of this process's warm-up, as reported by the readiness endpoint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.status = "cold"
+        self.started_at = None
+        self.finished_at = None
+        self.seconds = None
+        self.error = None
+        self.details = {}
+
+    @property
+    def ready(self):
+        return self.status in ("ready", "disabled")
+
+    def start(self):
+        """Mark warm-up as started; returns False if it is already running or done"""
+        with self._lock:
+            if self.status in ("warming", "ready"):
+                return False
+            self.status = "warming"
+            self.started_at = time.time()
+            self.error = None
+            return True
+
+    def finish(self, details=None, error=None):
+        with self._lock:
+            self.finished_at = time.time()
+            self.seconds = self.finished_at - self.started_at
+            self.details = details or {}
+            self.error = error
+            self.status = "failed" if error else "ready"
+
+    def reset(self):
+        with self._lock:
+            self.status = "cold"
+            self.started_at = None
+
+    def disable(self):
+        with self._lock:
+            if self.status == "cold":
+                self.status = "disabled"
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "status": self.status,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "seconds": self.seconds,
+                "error": self.error,
+                "details": self.details,
+            }
+
+
+def warm_up(samples=None):
+    """
+    Load the active model and push samples through the full prediction pipeline.
+
+    This pays every first-call cost up front: the sklearn/XGBoost imports and
+    unpickle, the compiled backend, class-name and enrichment tables, crop
+    data, the rule engine and the estimator's thread pools.
+
+    Args:
+        samples (list): Sample dicts to predict; defaults to ML_WARMUP["samples"]
+            or DEFAULT_WARMUP_SAMPLES
+
+    Returns:
+        dict: What was warmed, for the readiness endpoint
+    """
+    config = getattr(settings, "ML_WARMUP", {})
+    samples = samples or config.get("samples") or DEFAULT_WARMUP_SAMPLES
+    X = feature_matrix(samples)
+
+    # In-process lookup tables used by every response
+    crop_knowledge_base.data
+    get_rule_engine()
+
+    details = {"samples": len(samples), "model_version": None}
+    entry = load_default_model_entry()
+    if entry is not None:
+        model = entry.model
+        details["model_version"] = entry.version
+        details["classes"] = len(model.get_class_names())
+        crop_enrichment.prepare_for_model(model)
+        # One vectorized call initializes the estimator's worker threads
+        model.predict_batch(X, top_k=5)
+
+    # And every sample once through the single-prediction path
+    for row in X:
+        generate_prediction(*split_feature_params(row))
+    return details
+
+
+def run_warmup(samples=None):
+    """Run warm_up() once, recording the outcome in warmup_state"""
+    if not warmup_state.start():
+        return
+    print("Warming up ML prediction pipeline...")
+    try:
+        details = warm_up(samples)
+    except Exception as e:
+        print(f"Error warming up ML prediction pipeline: {str(e)}")
+        warmup_state.finish(error=str(e))
+        return
+    warmup_state.finish(details=details)
+    print(f"ML prediction pipeline warmed up in {warmup_state.seconds:.2f}s")
+
+
+def start_warmup():
+    """
+    Warm up in the background, or inline if ML_WARMUP["background"] (or the
+    ML_WARMUP_BACKGROUND environment variable) is false.
+    """
+    if not warmup_enabled():
+        warmup_state.disable()
+        return
+
+    background = getattr(settings, "ML_WARMUP", {}).get("background", True)
+    env = os.environ.get("ML_WARMUP_BACKGROUND")
+    if env is not None:
+        background = env.lower() in ("1", "true", "yes")
+
+    if background:
+        threading.Thread(target=run_warmup, name="ml-warmup", daemon=True).start()
+    else:
+        run_warmup()
+
+
+def restart_warmup_after_fork():
+    """A warm-up thread started before a fork (gunicorn --preload) is not inherited"""
+    if warmup_state.status == "warming":
+        warmup_state.reset()
+        start_warmup()
+
+
+# Warm-up status of this process
+warmup_state = WarmupState()
+
+os.register_at_fork(after_in_child=restart_warmup_after_fork)
@@ -1,6 +1,7 @@
 import requests
 import json
 import os
+import time
 
 BASE_URL = "http://localhost:8000/api"
 
@@ -27,8 +28,14 @@ def test_prediction_api():
 
 
 def test_dataset_upload_api():
-    """Test the dataset upload API endpoint with a mock CSV file"""
+    """
+    Test the dataset upload API endpoint with a mock CSV file
+
+    Returns:
+        str: The uploaded dataset's id, or None if the upload failed
+    """
     print("\nTesting dataset upload API...")
+    dataset_id = None
 
     # Create a mock CSV file
     mock_csv_content = """N,P,K,pH,temperature,rainfall,humidity,crop
@@ -60,6 +67,7 @@ def test_dataset_upload_api():
             if response.status_code == 201:
                 print("Dataset upload API test successful!")
                 print(json.dumps(response.json(), indent=2))
+                dataset_id = response.json().get("dataset_id")
             else:
                 print("Dataset upload API test failed!")
                 print(response.text)
@@ -74,23 +82,45 @@ def test_dataset_upload_api():
                 print(
                     f"Warning: Could not remove {mock_file_path} - file may still be in use"
                 )
+    return dataset_id
 
 
-def test_model_training_api():
-    """Test the model training API endpoint"""
+def test_model_training_api(dataset_id, timeout=300):
+    """
+    Test the model training API endpoint: queue a job, then poll its status
+    until it finishes (needs manage.py run_training_workers running)
+    """
     print("\nTesting model training API...")
 
-    payload = {"dataset_id": "mock_dataset_id", "algorithm": "randomForest"}
+    payload = {"dataset_id": dataset_id, "algorithm": "random_forest"}
 
     try:
         response = requests.post(f"{BASE_URL}/models/train/", json=payload)
         print(f"Status: {response.status_code}")
-        if response.status_code == 201:
+        if response.status_code != 202:
+            print("Model training API test failed!")
+            print(response.text)
+            return
+
+        job_id = response.json()["job_id"]
+        print(f"Training job {job_id} queued, polling its status...")
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            response = requests.get(f"{BASE_URL}/models/{job_id}/status/")
+            job = response.json()
+            print(f"Job status: {job['status']}")
+            if job["status"] in ("succeeded", "failed", "cancelled"):
+                break
+            time.sleep(2)
+        else:
+            print("Model training API test failed: the job did not finish in time")
+            return
+
+        if job["status"] == "succeeded":
             print("Model training API test successful!")
-            print(json.dumps(response.json(), indent=2))
         else:
             print("Model training API test failed!")
-            print(response.text)
+        print(json.dumps(job, indent=2))
     except Exception as e:
         print(f"Error: {e}")
 
@@ -99,5 +129,6 @@ if __name__ == "__main__":
     print("API Testing Script")
     print("=================")
     test_prediction_api()
-    test_model_training_api()
-    test_dataset_upload_api()
+    dataset_id = test_dataset_upload_api()
+    if dataset_id:
+        test_model_training_api(dataset_id)
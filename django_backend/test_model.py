@@ -1,13 +1,23 @@
 import os
-import pickle
+import sys
+
+import django
+
+# Set up Django environment
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_backend.settings")
+django.setup()
+
 from ml.models import CropModel
+from ml.prediction import get_default_model_path
 
-# Load the model
-model_path = os.path.join("ml", "models", "default_model.pkl")
+# Load the model (an artifact directory or a pickle, whichever is newest)
+model_path = get_default_model_path()
 print(f"Loading model from {model_path}")
 
-with open(model_path, "rb") as f:
-    model = pickle.load(f)
+model = CropModel.load(model_path)
+if model is None:
+    print("No trained model found")
+    sys.exit(1)
 
 print(f"Model type: {type(model)}")
 print(f"Model attributes: {dir(model)}")
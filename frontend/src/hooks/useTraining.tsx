@@ -74,10 +74,10 @@ export const useTraining = () => {
     try {
       console.log(`Training model with algorithm ${algorithm} and dataset ID ${datasetId}`);
       
-      // Start training
+      // Start training; the API names the random forest algorithm random_forest
       const trainingResponse = await endpoints.training.trainModel({
         dataset_id: datasetId,
-        algorithm: algorithm
+        algorithm: algorithm === 'randomForest' ? 'random_forest' : algorithm
       });
       
       console.log("Training response:", trainingResponse.data);
@@ -121,17 +121,19 @@ export const useTraining = () => {
         };
       });
 
-      // Poll for training status
+      // Poll the training job until it succeeds, fails or is cancelled
       let isComplete = false;
+      let failure: string | null = null;
       let attempts = 0;
-      const maxAttempts = 30; // 1 minute with 2-second intervals
+      const maxAttempts = 300; // 10 minutes with 2-second intervals, queueing included
 
-      while (!isComplete && attempts < maxAttempts) {
+      while (!isComplete && !failure && attempts < maxAttempts) {
+        attempts++;
         try {
           const statusResponse = await endpoints.training.getStatus(modelId);
           const status = statusResponse.data;
 
-          if (status.metrics?.success || status.status === 'completed') {
+          if (status.status === 'succeeded' || status.metrics?.success || status.status === 'completed') {
             isComplete = true;
             const result: TrainingResult = {
               name: status.name,
@@ -163,7 +165,9 @@ export const useTraining = () => {
               overallProgress: 100
             });
           } else if (status.status === 'failed') {
-            throw new Error(status.error || 'Training failed');
+            failure = status.error || 'Training failed';
+          } else if (status.status === 'cancelled') {
+            failure = 'Training was cancelled';
           } else {
             // Update progress
             if (status.progress) {
@@ -178,14 +182,16 @@ export const useTraining = () => {
           }
         } catch (err) {
           console.error('Error checking training status:', err);
-          attempts++;
         }
 
-        if (!isComplete) {
+        if (!isComplete && !failure) {
           await new Promise(resolve => setTimeout(resolve, 2000)); // Wait 2 seconds
         }
       }
 
+      if (failure) {
+        throw new Error(failure);
+      }
       if (!isComplete) {
         throw new Error('Training timed out. Please try again.');
       }